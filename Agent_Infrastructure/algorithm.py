@@ -1,36 +1,121 @@
-from ortools.constraint_solver import routing_enums_pb2
-from ortools.constraint_solver import pywrapcp
-from google.protobuf import duration_pb2
+import numpy as np
+import utilities as utils
+from distance_matrix import DistanceMatrix
+from search_budget import SearchBudget
+from local_search import cheapest_insertion
+from routing_backend import create_backend, ROUTING_BACKEND
+from tour_cache import TourCache, tour_key
+from location_store import LocationStore
 
 VEHICLE_MAXIMUM_DISTANCE = 5000
 NUM_VEHICLES = 1
 DEPOT_LOCATION = 0
+TRANSIT_MODE = 'matrix' # 'matrix': register the distance matrix once, 'callback': per arc python callback
+DISTANCE_MODE = 'manhattan'
+DISTANCE_SCALE = 1000 # distances are handed to the solver as fixed-point integers (1/DISTANCE_SCALE units)
+WARM_START = True # start the search from the previous tour instead of PARALLEL_CHEAPEST_INSERTION
+MARGINAL_COST_MODE = 'resolve' # 'resolve': solve the tour without each request, 'removal': removal_savings()
+REMOVAL_WINDOW = 0 # positions around a removed request that removal_savings() re-optimizes, 0: plain splice
+EXACT_MAX_REQUESTS = 8 # tours with up to this many requests are solved exactly by solve_exact(), 0: always routing_backend
+
+def solve_tour_data(task):
+    '''Worker of AlgorithmBase.get_optimal_tours(), solves the tour data with the given solver settings.
+
+    Args:
+        task (tuple): (settings dict from get_solver_settings(), tour data dict from create_tour_data())
+
+    Returns:
+        dict: See calculate_optimal_tour().
+        dict: The search statistics.
+    '''
+    settings, data = task
+    algorithm = AlgorithmBase([], [])
+    for name, value in settings.items():
+        setattr(algorithm, name, value)
+    return algorithm.calculate_optimal_tour(data), algorithm.search_stats
+
 
 class AlgorithmBase():
     
     def __init__(self, locations, assignments):
+        self.search_budget = SearchBudget() # time limit scaled with the number of locations, see search_budget.py
+        self.exact_max_requests = EXACT_MAX_REQUESTS
+        self.routing_backend = ROUTING_BACKEND # 'ortools' or 'local_search', see routing_backend.py
+        self.transit_mode = TRANSIT_MODE
+        self.distance_mode = DISTANCE_MODE
+        self.distance_scale = DISTANCE_SCALE
+        self.search_stats = {}
+        self.warm_start = WARM_START
+        self.trace_search = False # record (wall time ms, objective) of every solution in search_stats['trace']
+        self.solver_executor = None # SolverExecutor of get_optimal_tours(), None: solved in this process, see shared_executor()
+        self.tour_cache = TourCache() # solved tours by content, None: no caching
         self.locations = locations
         self.assignments = assignments
-        self.time_limit_seconds = 2
+
+    @property
+    def locations(self):
+        '''The locations as a list of (x, y) tuples, a copy of self.store.'''
+        return self.store.get_locations()
+
+    @locations.setter
+    def locations(self, locations):
+        # a new location list invalidates the persistent distance matrix, it is rebuilt on first use
+        self.store = LocationStore(locations)
+        self._distance_matrix = None
+        self.previous_route = None # stop ids of the last solved tour, see create_initial_route()
+
+    @property
+    def assignments(self):
+        '''The assignments as a list of [pickup, dropoff] location indices, a copy of self.store.'''
+        return self.store.get_assignments().tolist()
+
+    @assignments.setter
+    def assignments(self, assignments):
+        self.store.set_assignments(assignments)
+
+    @property
+    def distance_matrix(self):
+        '''Persistent DistanceMatrix of self.locations, kept up to date by add_locations() and remove_requests().'''
+        if self._distance_matrix is None or len(self._distance_matrix) != len(self.store):
+            self._distance_matrix = DistanceMatrix(self.store.get_coordinates(), self.distance_mode, self.distance_scale)
+        return self._distance_matrix
+
+    def _filter_requests(self, ignore):
+        # boolean masks over the assignments (transport requests) we wish to ignore and over the
+        # locations without their pickup and dropoff locations, O(n + k) for k ignored requests
+        assignments = self.store.get_assignments()
+        ignored = np.zeros(len(assignments), dtype=bool)
+        ignored[np.asarray(ignore, dtype=np.intp)] = True
+        kept = np.ones(len(self.store), dtype=bool)
+        kept[assignments[ignored].ravel()] = False
+        # new index of every kept location, the remaining assignments are remapped in one lookup
+        new_index = np.cumsum(kept) - 1
+        return np.flatnonzero(kept), new_index[assignments[~ignored]]
 
     def filter_requests_by_index(self, ignore):
-        # Remove the unwanted indices from locations and create a mapping
-        index_mapping = {}
-        new_index = 0
-
-        locations = []
-        for i in ignore:
-            for old_index, loc in enumerate(self.locations):
-                if loc not in [self.locations[j] for j in self.assignments[i]]:
-                    # the location is not the pickup or dropoff location
-                    # of the assignment (transport request) we wish to ignore
-                    locations.append(loc)
-                    index_mapping[old_index] = new_index
-                    new_index += 1
-
-        # Update the assignment list with the new indices, omitting assignments that should be ignored
-        assignments = [[index_mapping[p], index_mapping[d]] for p, d in self.assignments if p in index_mapping and d in index_mapping]
-        return locations, assignments
+        '''Locations and assignments without the assignments at the indices 'ignore'.
+
+        Returns:
+            np.ndarray: (n, 2) coordinates of the remaining locations.
+            np.ndarray: (m, 2) remaining assignments, indices into the remaining locations.
+        '''
+        keep, assignments = self._filter_requests(ignore)
+        return self.store.get_coordinates()[keep], assignments
+
+    def add_locations(self, pickups, dropoffs):
+        '''Appends transport requests to the tour, the distance matrix grows by one row and column per stop.
+
+        Args:
+            pickups (array-like): Pickup locations (x, y).
+            dropoffs (array-like): Dropoff locations (x, y).
+        '''
+        distance_matrix = self.distance_matrix
+        distance_matrix.append(self.store.append(pickups, dropoffs))
+
+    def remove_requests(self, ignore):
+        '''Removes the assignments at the indices 'ignore' and their locations, the distance matrix only drops them from its index.'''
+        distance_matrix = self.distance_matrix
+        distance_matrix.select(self.store.delete(ignore))
 
     def create_distance_matrix(self, locations):
         '''Create distance matrix using taxicab geometry. https://en.wikipedia.org/wiki/Taxicab_geometry
@@ -39,16 +124,9 @@ class AlgorithmBase():
             locations (list of tuples): List of locations (x, y).
         
         Returns:
-            list of lists: Distance matrix. https://en.wikipedia.org/wiki/Distance_matrix 
+            np.ndarray: Distance matrix scaled by self.distance_scale as int64. https://en.wikipedia.org/wiki/Distance_matrix 
         '''
-        dist_mat = []
-        for x in locations:
-            distance_for_location_x = []
-            for y in locations:
-                distance = round(abs(x[0] - y[0]) + abs(x[1] - y[1]), 2)
-                distance_for_location_x.append(distance) 
-            dist_mat.append(distance_for_location_x) 
-        return dist_mat 
+        return utils.create_distance_matrix(locations, mode=self.distance_mode, scale=self.distance_scale)
 
     def create_tour_data(self, ignore_indices = [], include_pickups=[], include_dropoffs=[]): 
         '''Create data required for 'get_optimal_tour()'.
@@ -61,23 +139,63 @@ class AlgorithmBase():
             dict: Dictionary containing tour data.
         '''
         if ignore_indices:
-            locations, assignmets = self.filter_requests_by_index(ignore_indices)
+            keep, assignments = self._filter_requests(ignore_indices)
+            size = len(keep)
         else: 
-            locations, assignmets = self.locations, self.assignments
+            keep, assignments = None, self.store.get_assignments()
+            size = len(self.store)
         
-        if include_pickups:
-            for include_location in zip(include_pickups, include_dropoffs): # zip( [(1,2),()], [(3,4),()] ) -> [ ( (1,2), (3,4) ), () ]
-                locations.extend(list(include_location)) 
-                assignmets.append([len(locations)-2, len(locations)-1])
+        # [(1,2),(5,6)], [(3,4),(7,8)] -> [(1,2),(3,4),(5,6),(7,8)]
+        include_locations = np.hstack([np.asarray(include_pickups, dtype=np.float64).reshape(-1, 2),
+                                       np.asarray(include_dropoffs, dtype=np.float64).reshape(-1, 2)]).reshape(-1, 2)
+        if len(include_locations):
+            # the included requests are appended after the remaining locations
+            assignments = np.vstack([assignments, size + np.arange(len(include_locations)).reshape(-1, 2)])
                 
-        #print(f"\nAfter create_tour_data locations: {[(round(ll,3),round(lr,3)) for ll, lr in locations]} \nand assignments: {assignmets}\n")
         data = {}
-        data["distance_matrix"] = self.create_distance_matrix(locations)
-        data["pickups_deliveries"] = assignmets
+        # submatrix of the persistent distance matrix, only the included locations are computed
+        data["distance_matrix"] = self.distance_matrix.get_matrix(keep, include_locations)
+        # stop id of every node, included locations are new stops (-1)
+        data["stop_ids"] = np.concatenate([self.distance_matrix.get_stop_ids(keep), np.full(len(include_locations), -1)])
+        data["pickups_deliveries"] = assignments.tolist()
         data["num_vehicles"] = NUM_VEHICLES
         data["depot"] = DEPOT_LOCATION
         return data
 
+    def create_initial_route(self, data):
+        '''Turns the previous tour into a route for 'data': stops that are gone are dropped
+        and new transport requests are spliced in at their cheapest positions.
+
+        Args:
+            data (dict): Dictionary containing necessary data for routing.
+
+        Returns:
+            list of int: Node indices of the route without the depot, None if there is no previous tour.
+        '''
+        if not self.previous_route:
+            return None
+        node_of_stop = {stop: node for node, stop in enumerate(data["stop_ids"].tolist()) if stop >= 0}
+        route = [node_of_stop[stop] for stop in self.previous_route if stop in node_of_stop]
+        route = [data["depot"]] + [node for node in route if node != data["depot"]] + [data["depot"]]
+        visited = set(route)
+        for pickup, dropoff in data["pickups_deliveries"]:
+            if pickup in visited and dropoff in visited:
+                continue
+            route = [node for node in route if node not in (pickup, dropoff)]
+            route, _ = cheapest_insertion(data["distance_matrix"], route, pickup, dropoff)
+        return route[1:-1]
+
+    def get_backend(self, data=None):
+        '''Routing backend of the tour data, tours with up to exact_max_requests requests are solved exactly.'''
+        if data is not None and data["num_vehicles"] == 1 and len(data["pickups_deliveries"]) <= self.exact_max_requests:
+            return create_backend('exact')
+        return create_backend(self.routing_backend, self.transit_mode)
+
+    def get_cache_key(self, data, backend):
+        '''Key of the tour data in the tour cache, includes the solver settings that change the tour.'''
+        budget = sorted(vars(self.search_budget).items())
+        return tour_key(data, (backend.name, self.transit_mode, VEHICLE_MAXIMUM_DISTANCE * self.distance_scale, budget))
+
     def calculate_optimal_tour(self, data):
         '''Calculates the optimal tour.
 
@@ -87,72 +205,31 @@ class AlgorithmBase():
         Returns:
             list: List representing the optimal tour (assignments) and distance as float
         '''
-        manager = pywrapcp.RoutingIndexManager(len(data["distance_matrix"]), data["num_vehicles"], data["depot"])
-        routing = pywrapcp.RoutingModel(manager)
-
-        def distance_callback(from_index, to_index):
-            """Returns the manhattan distance between the two nodes."""
-            # Convert from routing variable Index to distance matrix NodeIndex.
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return int(data["distance_matrix"][from_node][to_node])
-
-        transit_callback_index = routing.RegisterTransitCallback(distance_callback)
-        routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
-
-        # Add Distance constraint.
-        dimension_name = "Distance"
-        routing.AddDimension(
-            transit_callback_index,
-            0,  # no slack
-            VEHICLE_MAXIMUM_DISTANCE,
-            True,  # start cumul to zero
-            dimension_name,
-        )
-        distance_dimension = routing.GetDimensionOrDie(dimension_name)
-        distance_dimension.SetGlobalSpanCostCoefficient(100)
-
-        # Define Transportation Requests.
-        for request in data["pickups_deliveries"]:
-            pickup_index = manager.NodeToIndex(request[0])
-            delivery_index = manager.NodeToIndex(request[1])
-            routing.AddPickupAndDelivery(pickup_index, delivery_index)
-            routing.solver().Add(
-                routing.VehicleVar(pickup_index) == routing.VehicleVar(delivery_index)
-            )
-            routing.solver().Add(
-                distance_dimension.CumulVar(pickup_index)
-                <= distance_dimension.CumulVar(delivery_index)
-            )
-
-        # Setting first solution heuristic.
-        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-        search_parameters.first_solution_strategy = (
-            routing_enums_pb2.FirstSolutionStrategy.PARALLEL_CHEAPEST_INSERTION
-        )
-        search_parameters.time_limit.seconds = self.time_limit_seconds
-
-        solution = routing.SolveWithParameters(search_parameters)
-
-        if solution:
-            optimalTour = []
-            vehicle_id = 0
-            total_distance = 0
-            index = routing.Start(vehicle_id)
-            route_distance = 0
-
-            while not routing.IsEnd(index):
-                optimalTour.append(str(manager.IndexToNode(index)))
-                previous_index = index
-                index = solution.Value(routing.NextVar(index))
-                route_distance += routing.GetArcCostForVehicle(
-                    previous_index, index, vehicle_id
-                )
-                total_distance += route_distance
-            optimalTour.append(str(manager.IndexToNode(index)))
+        backend = self.get_backend(data)
+        key = self.get_cache_key(data, backend) if self.tour_cache is not None else None
+        cached = self.tour_cache.get(key) if key else None
+        if cached:
+            route, route_distance, search_stats = cached
+            self.search_stats = dict(search_stats, cache_hit=True)
+        else:
+            # the previous tour depends on the history of the carrier, a deterministic search always starts cold
+            warm_start = self.warm_start and not self.search_budget.deterministic
+            initial_route = self.create_initial_route(data) if warm_start and "stop_ids" in data else None
+            route, route_distance, self.search_stats = backend.solve(
+                data, VEHICLE_MAXIMUM_DISTANCE * self.distance_scale, self.search_budget, initial_route, self.trace_search)
+            if key:
+                self.tour_cache.put(key, (None if route is None else tuple(route), route_distance, self.search_stats))
+
+        if route is not None:
+            optimalTour = [str(node) for node in route]
+            # back from fixed-point to the units of the locations
+            total_distance = route_distance / self.distance_scale
+            if "stop_ids" in data:
+                self.previous_route = [int(data["stop_ids"][node]) for node in route]
 
         else:
             optimalTour = self.optimalTour
+            total_distance = self.total_distance
 
 
         self.optimalTour = optimalTour
@@ -164,6 +241,122 @@ class AlgorithmBase():
 
         return result
 
+    def get_insertion_distance(self, tour, ignore_indices=[], include_pickups=[], include_dropoffs=[]):
+        '''Estimates the added distance of the included transport requests without calling the solver,
+        they are inserted one after another into 'tour' at the cheapest positions, O(n) per request.
+
+        Args:
+            tour (dict): Result of get_optimal_tour() with the same ignore_indices.
+            ignore_indices, include_pickups, include_dropoffs: See get_optimal_tour().
+
+        Returns:
+            float: Added distance in the units of the locations.
+        '''
+        data = self.create_tour_data(ignore_indices, include_pickups, include_dropoffs)
+        route = [int(node) for node in tour['optimalTour']]
+        added_distance = 0
+        backend = self.get_backend()
+        for pickup, dropoff in data["pickups_deliveries"][len(data["pickups_deliveries"])-len(include_pickups):]:
+            route, delta = backend.insert(data["distance_matrix"], route, pickup, dropoff)
+            added_distance += delta
+        return added_distance / self.distance_scale
+
+    def get_added_distance_bound(self, include_pickups, include_dropoffs):
+        '''Lower bound of the distance the included transport requests add to a tour of the current locations,
+        without solving. In taxicab geometry a stop outside the bounding box of the tour costs at least twice
+        its distance to the box on every axis, the farthest stop per axis counts, O(n) vectorized.
+
+        Args:
+            include_pickups, include_dropoffs: See get_optimal_tour().
+
+        Returns:
+            float: Lower bound in the units of the locations, 0 if there is none (DISTANCE_MODE 'euclid').
+        '''
+        stops = np.vstack([np.asarray(include_pickups, dtype=np.float64).reshape(-1, 2),
+                           np.asarray(include_dropoffs, dtype=np.float64).reshape(-1, 2)])
+        if self.distance_mode != 'manhattan' or not len(self.store) or not len(stops):
+            return 0.0
+        coordinates = self.store.get_coordinates()
+        outside = np.maximum(coordinates.min(axis=0) - stops, 0) + np.maximum(stops - coordinates.max(axis=0), 0)
+        # every solver arc is rounded to 1/distance_scale, at most one changed arc per stop plus one
+        slack = (len(stops) + 1) / self.distance_scale
+        return max(0.0, 2 * float(outside.max(axis=0).sum()) - slack)
+
+    def get_solver_settings(self):
+        return {
+            'search_budget': self.search_budget,
+            'transit_mode': self.transit_mode,
+            'distance_scale': self.distance_scale,
+            'warm_start': self.warm_start,
+            'exact_max_requests': self.exact_max_requests,
+            'routing_backend': self.routing_backend,
+            'previous_route': self.previous_route,
+        }
+
+    def get_optimal_tours(self, tour_requests):
+        '''Solves independent tours on the solver executor (process pool), tours in the tour cache are not solved again.
+
+        Args:
+            tour_requests (list of dicts): Keyword arguments of get_optimal_tour() for every tour.
+
+        Returns:
+            list of dicts: The results of get_optimal_tour() in the order of tour_requests.
+        '''
+        settings = dict(self.get_solver_settings(), tour_cache=None)
+        results, tasks, keys = [], [], []
+        for kwargs in tour_requests:
+            data = self.create_tour_data(**kwargs)
+            backend = self.get_backend(data)
+            key = self.get_cache_key(data, backend) if self.tour_cache is not None else None
+            cached = self.tour_cache.get(key) if key else None
+            if cached and cached[0] is not None:
+                route, route_distance, _ = cached
+                results.append({'optimalTour': [str(node) for node in route], 'distance': route_distance / self.distance_scale})
+            else:
+                results.append(None)
+                tasks.append((settings, data))
+                keys.append(key)
+        solved = iter(self.solver_executor.map(solve_tour_data, tasks) if self.solver_executor is not None
+                      else [solve_tour_data(task) for task in tasks])
+        for i, result in enumerate(results):
+            if result is None:
+                results[i], search_stats = next(solved)
+                key = keys.pop(0)
+                if key:
+                    route = tuple(int(node) for node in results[i]['optimalTour'])
+                    self.tour_cache.put(key, (route, round(results[i]['distance'] * self.distance_scale), search_stats))
+        return results
+
+    def get_removal_distances(self, tour, window=REMOVAL_WINDOW):
+        '''Marginal distance of every assignment, see removal_savings(). Replaces one solve per assignment.
+
+        Args:
+            tour (dict): Result of get_optimal_tour() for the current locations and assignments.
+            window (int): Re-optimized positions around a removed request.
+
+        Returns:
+            list of floats: Marginal distance of every assignment in the units of the locations.
+        '''
+        route = [int(node) for node in tour['optimalTour']]
+        savings = self.get_backend().remove(self.distance_matrix.get_matrix(), route, self.store.get_assignments().tolist(), window)
+        return (savings / self.distance_scale).tolist()
+
+    def get_marginal_distances(self, tour, mode=MARGINAL_COST_MODE, window=REMOVAL_WINDOW):
+        '''Marginal distance of every assignment, i.e. distance of tour minus the distance without the assignment.
+
+        Args:
+            tour (dict): Result of get_optimal_tour() for the current locations and assignments.
+            mode (str): 'resolve' solves the tour without each assignment, 'removal' splices it out of tour.
+            window (int): Re-optimized positions around a removed request in 'removal' mode.
+
+        Returns:
+            list of floats: Marginal distance per assignment, in the order of self.assignments.
+        '''
+        if mode == 'removal':
+            return self.get_removal_distances(tour, window)
+        tours = self.get_optimal_tours([{'ignore_indices': [i]} for i in range(self.store.count_requests())])
+        return [float(tour['distance']) - float(tour_without['distance']) for tour_without in tours]
+
     # The main function that calles create_tour_data and calculate_optimal_tour
     def get_optimal_tour(self, ignore_indices=[], include_pickups=[], include_dropoffs=[]): 
         '''
@@ -180,8 +373,6 @@ class AlgorithmBase():
     
     def update_locations_and_assignments(self, ignore_indices=[], include_pickups=[], include_dropoffs=[]):
         if ignore_indices:
-            self.locations, self.assignments = self.filter_requests_by_index(ignore_indices)
-        if include_pickups:
-            for include_location in zip(include_pickups, include_dropoffs): # zip( [(1,2),()], [(3,4),()] ) -> [ ( (1,2), (3,4) ), () ]
-                self.locations.extend(list(include_location)) 
-                self.assignmets.append([len(self.locations)-2, len(self.locations)-1])
\ No newline at end of file
+            self.remove_requests(ignore_indices)
+        if len(include_pickups):
+            self.add_locations(include_pickups, include_dropoffs)
\ No newline at end of file
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from auctioneer import Auctioneer
+from carrier_handler import CarrierHandler, PHASE_GRACE, parse_bids
+from state_actor import submit_command
+import utilities as utils
+
+LISTEN_BACKLOG = 1024 # pending connections, every request opens one unless the carrier keeps a session
+
+
+async def read_json(reader, buffer=b"", bufsize=1024):
+    '''Reads one JSON message from a stream, see utilities.receive_json().
+
+    Args:
+        reader (asyncio.StreamReader): Stream of the connection.
+        buffer (bytes): Bytes read after the previous message of the connection.
+        bufsize (int): Bytes per read().
+
+    Returns:
+        tuple: (message, bytes read after it), message is None if the peer closed the connection before
+               a complete message.
+    '''
+    while True:
+        message, buffer = utils.split_json(buffer)
+        if message is not None:
+            return message, buffer
+        chunk = await reader.read(bufsize)
+        if not chunk:
+            return (json.loads(buffer.decode('utf-8')) if buffer.strip() else None), b""
+        buffer += chunk
+
+
+class AsyncAuctioneerServer:
+    """
+    Auctioneer server serving the protocol of AuctioneerServer in one asyncio event loop instead of a
+    thread per connection. The handler methods that touch the auctioneer state still run as commands
+    of its actor, a request waiting for its phase is a coroutine woken by the notifications of the
+    phase condition instead of a blocked thread.
+    Attributes:
+        host (str), port (int)       : Address of the server
+        auctioneer (Auctioneer)      : Auction state and loop
+        loop (asyncio.AbstractEventLoop): Event loop of the server, set once it runs
+        changed (asyncio.Future)     : Resolved (and replaced) whenever the phase condition is notified
+    """
+    def __init__(self, host=socket.gethostname(), port=12340):
+        self.host = host
+        self.port = port
+        self.auctioneer = Auctioneer()
+        self.loop = None
+        self.server = None
+        self.changed = None
+        self._started = threading.Event()
+
+    def start_server(self):
+        auction_thread = threading.Thread(target=self.auctioneer.handle_auction_phases)
+        auction_thread.start()
+
+        connection_thread = threading.Thread(target=self.handle_connections)
+        connection_thread.start()
+
+        auction_thread.join()
+        self.stop_server()
+        exit()
+
+    def handle_connections(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.changed = self.loop.create_future()
+        self.auctioneer.pipeline.condition.watchers.append(self.notify)
+        self.server = await asyncio.start_server(self.handle_carrier, self.host, self.port,
+                                                 reuse_address=True, backlog=LISTEN_BACKLOG)
+        print("Auctioneer server started, waiting for connections...")
+        self._started.set()
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    def wait_until_started(self, timeout=None):
+        return self._started.wait(timeout)
+
+    def notify(self):
+        # called by the thread that notified the condition
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        changed, self.changed = self.changed, self.loop.create_future()
+        changed.set_result(None)
+
+    def stop_server(self):
+        if self.loop is not None and self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+        exit()
+
+    async def handle_carrier(self, reader, writer):
+        try:
+            data, buffer = await read_json(reader)
+            handler = CarrierHandler(self.auctioneer, None)
+            # a session: the carrier sends its requests of the day over this connection, one line each
+            session = data is not None and 'request_id' in data
+            while data and await self.handle_request(handler, data, writer) and session:
+                data, buffer = await read_json(reader, buffer)
+        except Exception as e:
+            print(f"\nError occurred during handling connection with carrier. \nError: {type(e).__name__}: {e}\n")
+        writer.close()
+
+    async def handle_request(self, handler, data, writer):
+        """
+        Answers one request, returns False for an invalid action.
+        """
+        actions = {
+            'register': self.register_carrier,
+            'offer': self.receive_offer,
+            'request_offer': self.send_offer,
+            'bid': self.receive_bid,
+            'request_auction_results': self.send_results,
+            'confirm': self.confirm,
+        }
+        action = data['action']
+        if action not in actions:
+            print("Invalid action from carrier. Connection closed.")
+            return False
+        handler.item = None
+        reply, new = await self.command(handler.session_reply, data)
+        if new:
+            try:
+                payload = await actions[action](handler, data)
+                response = handler.response(action, data, payload)
+            except BaseException as e:
+                if reply is not None:
+                    reply.set_exception(e)
+                raise
+            if reply is not None:
+                reply.set_result(response)
+        else:
+            # resent after a reconnect, the first attempt may still be running
+            response = await asyncio.wrap_future(reply)
+        writer.write((json.dumps(response) + "\n").encode('utf-8'))
+        await writer.drain()
+        return True
+
+    async def command(self, bound_method, *args):
+        '''Runs a @command method of the handler on the actor without blocking the event loop.
+
+        Returns:
+            The result of the method.
+        '''
+        return await asyncio.wrap_future(submit_command(bound_method, *args))
+
+    async def wait_for_item(self, handler, phase, carrier_id, item_id=None):
+        '''CarrierHandler.wait_for_item() as a coroutine.
+
+        Returns:
+            str: Current phase of the item, the item is stored in handler.item.
+        '''
+        pipeline = self.auctioneer.pipeline
+        start = time.monotonic()
+        while True:
+            # taken before the check, a notification after it resolves this future
+            changed = self.changed
+            with pipeline.condition:
+                result, remaining = pipeline.poll(phase, carrier_id, PHASE_GRACE, start, item_id)
+            if result is not None:
+                handler.item, current_phase = result
+                return current_phase
+            try:
+                await asyncio.wait_for(asyncio.shield(changed), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def register_carrier(self, handler, data):
+        return await self.command(handler.registration, data['carrier_id'])
+
+    async def receive_offer(self, handler, data):
+        return await self.command(handler.offer_submission, data['carrier_id'], data['payload'])
+
+    async def send_offer(self, handler, data):
+        carrier_id = data['carrier_id']
+        if await self.wait_for_item(handler, "REQ_OFFER", carrier_id) != "REQ_OFFER":
+            return {"status": "OFFER_REQUEST_TIMEOUT"}
+        return await self.command(handler.offer_payload, carrier_id)
+
+    async def receive_bid(self, handler, data):
+        carrier_id = data['carrier_id']
+        bids, packages, first_id = parse_bids(data['payload'])
+        phase = await self.wait_for_item(handler, "BID", carrier_id, first_id)
+        if phase != "BID":
+            print("Bidding timeout, current phase: ", phase)
+            return {"status": "BIDDING_TIMEOUT"}
+        return await self.command(handler.accept_bids, carrier_id, bids, packages)
+
+    async def send_results(self, handler, data):
+        carrier_id = data['carrier_id']
+        if not await self.command(handler.is_registered, carrier_id):
+            return {"status": "NOT_REGISTERED"}
+        if await self.wait_for_item(handler, "RESULTS", carrier_id) != "RESULTS":
+            return {"status": "NO_RESULTS_PHASE"}
+        return await self.command(handler.results_payload, carrier_id)
+
+    async def confirm(self, handler, data):
+        carrier_id = data['carrier_id']
+        if await self.wait_for_item(handler, "CONFIRM", carrier_id) != "CONFIRM":
+            return {"status": "CONFIRMATION_TIMEOUT"}
+        return await self.command(handler.confirm_payload, carrier_id)
@@ -1,12 +1,25 @@
 import time
 from offer import Offer
+import threading
+from phase_scheduler import PhaseScheduler, AuctionItem, Pipeline, wall_clock
 import utilities as utils
+from winner_determination import solve_winner_determination
+from bundling import spatial_bundles
+from offer_registry import OfferRegistry
+from state_actor import StateActor, command
 import numpy as np
 
-BASE_TIMEOUT = 5
+BASE_TIMEOUT = 5 # deadline of a phase in seconds (may be fractional), it ends earlier once every carrier has acted
 MAX_ROUNDS = 5
 BUNDLE_ROUNDS = 2
-AUCTION_MODEL = 'vickrey'
+AUCTION_MODEL = 'vickrey' # 'first_price', 'vickrey' or 'reserve' (second price, at least the minimum price), see bid_book.clear()
+# 'sequential': one item after another, 'simultaneous': all items of a round in one phase cycle,
+# 'pipelined': one item after another, the next item is offered while the previous one is cleared,
+# 'combinatorial': all offers in one round, carriers bid on packages, see determine_winners()
+ROUND_MODE = 'sequential'
+WDP_TIME_LIMIT = 2.0 # seconds of the winner determination in combinatorial mode
+# 'revenue': pairs of low and high revenue offers, 'grid' / 'kmeans': spatially close lanes, see bundling.py
+BUNDLE_METHOD = 'revenue'
 
 class Auctioneer:
     """
@@ -14,26 +27,41 @@ class Auctioneer:
     Attributes:
         server_socket (socket.socket): The server socket to listen for connections
         registered_carriers (list)   : List of registered carriers IDs
-        offers (dict)                : Key is ID of offer, value is the offer object
-        auction_time (float)         : Timestamp for the next phase
+        offers (OfferRegistry)       : Offers in order, indexed by offer ID
+        bundles (dict)               : Bundle number -> offer IDs of the bundle
+        bundle_table (dict)          : Bundle ID ("bundle_<first offer ID>") -> offer IDs of the bundle
+        auction_time (float)         : Wall clock deadline of the current phase, sent to the carriers
         active_carriers (list)       : List of registered carriers IDs which are active
-        phase (str)                  : actual auction phase
+        scheduler (PhaseScheduler)   : Phase of the auction day (REGIST, AUCTION) and the registration deadline
+        pipeline (Pipeline)          : Items on auction (AuctionItem), each with its own phase
         next_round (bool)            : If there is another auction round
+        session_replies (dict)       : Carrier ID -> (request ID, Future of the response) of the last request of its
+                                       session, recorded before it runs, a resent request waits for it
+        actor (StateActor)           : Executes every method that reads or writes the state above (@command),
+                                       for the carrier handlers and the auction loop, one at a time
         _stop_event (threading.Event): force stop all threads
     """
     def __init__(self):
 
-        self.offers = []
+        self.offers = OfferRegistry()
         self.registered_carriers = [] 
         self.active_carriers = []
+        self.session_replies = {}
         self.auction_time = None
         self.next_round = True
-        self.phase = "REGIST"
+        self.scheduler = PhaseScheduler("REGIST")
+        self.pipeline = Pipeline(self.scheduler)
         self.bundles = {}
-        self.id_on_auction = None
-        self.indices_on_auction = []
+        self.bundle_table = {}
+        self.actor = StateActor()
+        self.actor.start()
     
-    def generate_bundles(self, bundle_size=2):
+    @command
+    def generate_bundles(self, bundle_size=2, method=BUNDLE_METHOD):
+        if method != 'revenue':
+            # as many offers per bundle as 'bundle_size' revenue pairs
+            self.generate_spatial_bundles(2 * bundle_size, method)
+            return
         offers_sorted_indices = np.argsort([offer.revenue for offer in self.offers])
         n = len(self.offers)        
         bundle_iterator = 0
@@ -61,152 +89,298 @@ class Auctioneer:
         for k, v in self.bundles.items():
             if not v:
                 print(f"\nbundle {k} is empty!\n")
-        
+        self.index_bundles()
+
+    def generate_spatial_bundles(self, size, method):
+        '''Bundles of offers with close or opposite lanes (backhauls), in O(n log n) for grid and O(n k) for k-means.
+
+        Args:
+            size (int): Offers per bundle, the last bundle may be smaller.
+            method (str): 'grid' or 'kmeans', see bundling.spatial_bundles().
+        '''
+        pickups = utils.positions_to_array([offer.loc_pickup for offer in self.offers])
+        dropoffs = utils.positions_to_array([offer.loc_dropoff for offer in self.offers])
+        self.bundles = {k: [self.offers[i].offer_id for i in bundle]
+                        for k, bundle in enumerate(spatial_bundles(pickups, dropoffs, size, method))}
+        self.index_bundles()
+
     def handle_auction_phases(self):
         start_time_auction_day = time.time()
         while self.next_round:
-            if self.auction_time is not None: # at least one registered carrier has sent offers
-                n_round = 0
-                while n_round < MAX_ROUNDS:
-                    print(f"\nAuction round {n_round+1}/{MAX_ROUNDS}\n")
-                    sold = 0 # for counting how many offers have been sold in the round
-                    
-                    if n_round == 0:
-                        # This is the 1.st round
-                        self._wait_until(self.auction_time)
-                        self.generate_bundles()
-                    self.print_auction_list()
-
-                    #TODO: Find another iterator (maybe iterate through auctions on sale?! or size of Bundle round?!)
-                    # (Shachar:) it is a good idea, do we have time for that?
-                    
-                    if n_round < BUNDLE_ROUNDS: #bundle round
-                        for current_bundle in range(len(self.bundles)): # iterating through bundle list
-                            print(f"\n Bundle on auction:{current_bundle+1}/{len(self.bundles)}\n")
-
-                            # (Shachar:) converting current bundle list to set cause its faster (O(1) instead of O(n))
-                            current_bundle_set = set(self.bundles[current_bundle])
-                            self.indices_on_auction = [i for i, offer in enumerate(self.offers) if offer.offer_id in current_bundle_set]
-                            # Set bundles on offer
-                            if not self.indices_on_auction:
-                                continue
-                            print("\n incides on auction: ", self.indices_on_auction)
-                            for j in self.indices_on_auction:
-                                self.offers[j].on_auction = True
-                            # Set Auction ID to first offer of bundle (eg. "bundle_firstofferid")
-                            self.id_on_auction = "bundle_" + str(self.bundles[current_bundle][0]) # FIXME: ACCESS first element of bundle
-                            
-                            self.phase = "REQ_OFFER"
-                            self.auction_time = int(time.time()) + BASE_TIMEOUT
-                            print("\nEntering offer request phase")
-                            self._wait_until(self.auction_time)
-
-                            self.phase = "BID"
-                            self.auction_time = int(time.time()) + BASE_TIMEOUT
-                            print("\nEntering bidding phase")
-                            self._wait_until(self.auction_time)
-
-                            self.phase = "RESULTS"
-                            self.auction_time = int(time.time()) + BASE_TIMEOUT
-                            print("\nEntering results phase")
-                            # Update Multi Offer
-                            for j in self.indices_on_auction:
-                                self.offers[j].update_results(mode=AUCTION_MODEL)
-                            self._wait_until(self.auction_time)
-                            # Check if all registered carriers are active
-                            self.check_active_carriers()
-
-                            self.phase = "CONFIRM"
-                            print("\nEntering confirmation phase")
-                            self.auction_time = int(time.time()) + BASE_TIMEOUT 
-
-                            # Stats for Multi Offer
-                            for j in self.indices_on_auction:
-                                if self.offers[j].winner != "NONE":
-                                    sold += 1
+            # registration until the deadline that the first offer started, see start_countdown()
+            self.scheduler.wait()
+            self.scheduler.enter("AUCTION", 0)
+            n_round = 0
+            while n_round < MAX_ROUNDS:
+                print(f"\nAuction round {n_round+1}/{MAX_ROUNDS}\n")
+                sold = 0 # for counting how many offers have been sold in the round
+                
+                if n_round == 0:
+                    # This is the 1.st round
+                    self.generate_bundles()
+                self.print_auction_list()
+
+                #TODO: Find another iterator (maybe iterate through auctions on sale?! or size of Bundle round?!)
+                # (Shachar:) it is a good idea, do we have time for that?
+                
+                if ROUND_MODE == 'combinatorial':
+                    # all offers at once, carriers bid on packages, the winner determination clears the day in one round
+                    print("\nOffers on auction: combinatorial\n")
+                    item = self.put_on_auction(self.get_round_lots(bundle_round=False), package_bids=True)
+                    sold = self.run_auction_phases(item)
+                    self.next_round = False
+                    self.confirm_item(item)
+
+                elif ROUND_MODE == 'simultaneous':
+                    # all bundles (or all unsold offers) of the round are on auction in one phase cycle
+                    bundle_round = n_round < BUNDLE_ROUNDS
+                    print(f"\n{'Bundles' if bundle_round else 'Offers'} on auction: all at once\n")
+                    item = self.put_on_auction(self.get_round_lots(bundle_round))
+                    sold = self.run_auction_phases(item)
+                    n_round = self.end_round(n_round, sold)
+                    self.confirm_item(item)
+
+                elif ROUND_MODE == 'pipelined':
+                    # one item after another, the next item is offered and bid on while the previous one is cleared
+                    bundle_round = n_round < BUNDLE_ROUNDS
+                    lots = self.get_round_lots(bundle_round)
+                    print(f"\n{len(lots)} {'bundles' if bundle_round else 'offers'} on auction: pipelined\n")
+                    items = [self.put_on_auction({item_id: indices}) for item_id, indices in lots.items()]
+                    clearing = None
+                    for n, item in enumerate(items):
+                        print(f"\nItem on auction:{n+1}/{len(items)}\n")
+                        self.offer_item(item)
+                        if clearing is not None:
+                            clearing.join()
+                        if item is not items[-1]:
+                            # results and confirmation of this item while the next one is offered
+                            clearing = threading.Thread(target=self.clear_item, args=(item,))
+                            clearing.start()
+                            continue
+                        self.publish_results(item)
+                        n_round = self.end_round(n_round, sum(item.sold for item in items))
+                        self.confirm_item(item)
+
+                elif n_round < BUNDLE_ROUNDS: #bundle round
+                    # bundles with unsold offers, the bundle ID is "bundle_<first offer ID>"
+                    lots = self.get_round_lots(bundle_round=True)
+                    for current_bundle, (bundle_id, indices) in enumerate(lots.items()): # iterating through bundle list
+                        print(f"\n Bundle on auction:{current_bundle+1}/{len(lots)}\n")
+                        print("\n incides on auction: ", indices)
+                        item = self.put_on_auction({bundle_id: indices})
+
+                        # Stats for Multi Offer
+                        sold += self.run_auction_phases(item)
    
-                            #FIXME: later, because I am not sure if this is relevant at this point (maybe if there are only bundles)
-                            #(Shachar:) what if all bundles are sold? Idea: check if bundle list hasn't changed 
-                            # -> if so need to jump to single auctions or change bundle distribution
-                            # also need to check if all were sold -> no next round!
-
-                            if current_bundle == len(self.bundles)-1:
-                                if not sold and not self.valide_bids_for_unsold_offer():
-                                    n_round = BUNDLE_ROUNDS-1
-                                    self._wait_until(self.auction_time)
-                                    continue
-                                    # continue with single auctions
-                            if sold == len(self.offers):
-                                self.next_round = False
-                            self._wait_until(self.auction_time)
-                            # Set Multiple Offers to on_auction = False
-                            for j in self.indices_on_auction:
-                                self.offers[j].on_auction = False
-                            self.indices_on_auction = []
-
-                    else: #single offer Round
-                        print("\nSelling individual offers!!!\n")
-                        for i in range(len(self.offers)): # iterating auction list print(f"\nOffer {i+1}/{len(self.offers)} on sale\n")
-                            print(f"\nOffer on auction:{i+1}/{len(self.offers)}\n")
-
-                            ######################## need to modify
-                            if False:  ### Need somthing like bundle_round to be a boolean veriable or if n_round < x ...
-                                for offer in self.offers:
-                                    if offer.offer_id in self.bundles[self.id_on_auction]:
-                                        offer.on_auction = True
-                            else:
-                                self.offers[i].on_auction = True
-                                self.id_on_auction = self.offers[i].offer_id
-                                self.indices_on_auction = [i]
-                            #########################
-                                
-        
-                            self.phase = "REQ_OFFER"
-                            print("\nEntering offer request phase")
-                            self.auction_time = int(time.time()) + BASE_TIMEOUT
-                            self._wait_until(self.auction_time)
-
-                            self.phase = "BID"
-                            print("\nEntering bidding phase")
-                            self.auction_time = int(time.time()) + BASE_TIMEOUT
-                            self._wait_until(self.auction_time)
-
-                            self.phase = "RESULTS"
-                            self.offers[i].update_results(mode=AUCTION_MODEL)
-                            print("\nEntering results phase")
-                            self.auction_time = int(time.time()) + BASE_TIMEOUT
-                            self._wait_until(self.auction_time)
-                            self.check_active_carriers()
-
-                            self.phase = "CONFIRM"
-                            print("\nEntering confirmation phase")
-                            self.auction_time = int(time.time()) + BASE_TIMEOUT 
-                            if self.offers[i].winner != "NONE":
-                                sold += 1
-                            if i == len(self.offers)-1:
-                                # last offer in the leaset on auction
-                                if not sold and not self.valide_bids_for_unsold_offer():
-                                    # no offer was sold and no offer has valide bids
-                                    self.next_round = False  
-                            if sold == len(self.offers):
-                                self.next_round = False               
-                            self._wait_until(self.auction_time)
-                            self.offers[i].on_auction = False
-                    self.update_auction_list() 
-
-                    if not self.next_round:
-                        if self.offers:
-                            self.print_auction_list() 
-                        print("\nAuction day closed server restarts tomorrow...")
-                        print(f"Total duration of today's auction: {(time.time()-start_time_auction_day)/60}\n")
-                        exit()
-                    n_round += 1
+                        #FIXME: later, because I am not sure if this is relevant at this point (maybe if there are only bundles)
+                        #(Shachar:) what if all bundles are sold? Idea: check if bundle list hasn't changed 
+                        # -> if so need to jump to single auctions or change bundle distribution
+                        # also need to check if all were sold -> no next round!
+
+                        if current_bundle == len(lots)-1:
+                            # continue with single auctions if nothing was sold
+                            n_round = self.end_round(n_round, sold)
+                        elif sold == len(self.offers):
+                            self.next_round = False
+                        self.confirm_item(item)
+
+                else: #single offer Round
+                    print("\nSelling individual offers!!!\n")
+                    for i in range(len(self.offers)): # iterating auction list print(f"\nOffer {i+1}/{len(self.offers)} on sale\n")
+                        print(f"\nOffer on auction:{i+1}/{len(self.offers)}\n")
+
+                        item = self.put_on_auction({self.offers[i].offer_id: [i]})
+                        sold += self.run_auction_phases(item)
+                        if i == len(self.offers)-1:
+                            # last offer in the leaset on auction
+                            n_round = self.end_round(n_round, sold)
+                        elif sold == len(self.offers):
+                            self.next_round = False
+                        self.confirm_item(item)
+                self.update_auction_list() 
+
+                if not self.next_round:
+                    if self.offers:
+                        self.print_auction_list() 
+                    print("\nAuction day closed server restarts tomorrow...")
+                    print(f"Total duration of today's auction: {(time.time()-start_time_auction_day)/60}\n")
+                    print(f"Phases closed early: {self.pipeline.closed_early}, at the deadline: {self.pipeline.timed_out}\n")
+                    for name, stats in self.actor.latency_report().items():
+                        print(f"Command {name}: {stats['count']} times, mean {stats['mean_ms']:.3f} ms, max {stats['max_ms']:.3f} ms")
+                    self.actor.stop()
+                    exit()
+                n_round += 1
   
 
-    def _wait_until(self, timeout):
-        while time.time() < timeout:
-            time.sleep(1)
+    @command
+    def end_round(self, n_round, sold):
+        '''Decides how the auction goes on after the last item of a round, before its confirmation phase.
+
+        Returns:
+            int: The round to continue with (-1 for the next one), BUNDLE_ROUNDS-1 to continue with single offers.
+        '''
+        if not sold and not self.valide_bids_for_unsold_offer():
+            # no offer was sold and no offer has valide bids
+            if n_round < BUNDLE_ROUNDS:
+                # continue with single auctions
+                return BUNDLE_ROUNDS-1
+            self.next_round = False
+        if sold == len(self.offers):
+            self.next_round = False
+        return n_round
+
+    @command
+    def get_round_lots(self, bundle_round):
+        '''All items of a round: the bundles with unsold offers or every unsold offer.'''
+        if not bundle_round:
+            return {offer.offer_id: [i] for i, offer in enumerate(self.offers)}
+        lots = {}
+        for bundle_id, offer_ids in self.bundle_table.items():
+            indices = [i for i in map(self.offers.position, offer_ids) if i is not None]
+            if indices:
+                lots[bundle_id] = indices
+        return lots
+
+    def index_bundles(self):
+        '''Builds the bundle table (bundle ID -> offer IDs) of the generated bundles.'''
+        self.bundle_table = {"bundle_" + str(bundle[0]): bundle for bundle in self.bundles.values() if bundle}
+
+    @command
+    def put_on_auction(self, lots, package_bids=False):
+        '''Creates the item for the offers of 'lots', see run_auction_phases().
+
+        Args:
+            lots (dict): Item ID (offer ID or "bundle_<first offer ID>") -> indices of its offers.
+            package_bids (bool): Carriers may bid on packages of the offers, cleared by determine_winners().
+
+        Returns:
+            AuctionItem: The item, the offers are on auction once its first phase has started (offer_item()).
+        '''
+        # the revenue shares of the bundle offers are computed once, a bundle bid is split by them
+        shares = {item_id: self.offers.revenue_shares(indices) for item_id, indices in lots.items() if item_id in self.bundle_table}
+        return AuctionItem(lots, self.pipeline.condition, package_bids, shares)
+
+    @command
+    def take_off_auction(self, item):
+        self.set_on_auction(item, False)
+        self.pipeline.remove(item)
+
+    @command
+    def set_on_auction(self, item, on_auction):
+        for i in item.indices:
+            self.offers[i].on_auction = on_auction
+
+    def offer_item(self, item):
+        self.set_on_auction(item, True)
+        print("\nEntering offer request phase")
+        self.run_phase(item, "REQ_OFFER")
+
+        print("\nEntering bidding phase")
+        self.run_phase(item, "BID")
+
+    def publish_results(self, item):
+        # Update all offers of the item, before the carriers can request the results
+        self.clear_offers(item)
+        print("\nEntering results phase")
+        self.run_phase(item, "RESULTS")
+        return self.settle_item(item)
+
+    def clear_offers(self, item):
+        if item.package_bids:
+            self.determine_winners(item)
+        else:
+            self.update_results(item)
+
+    @command
+    def update_results(self, item):
+        for i in item.indices:
+            self.offers[i].update_results(mode=AUCTION_MODEL)
+
+    @command
+    def settle_item(self, item):
+        '''Counts the sold offers of the item after its results phase.'''
+        # Check if all registered carriers are active
+        self.check_active_carriers(item.indices)
+        item.sold = sum(self.offers[i].winner != "NONE" for i in item.indices)
+        return item.sold
+
+    def determine_winners(self, item):
+        '''Clears a combinatorial round: the package bids of every carrier are exclusive (XOR), single bids
+        are independent. The winner determination maximizes the sum of the accepted bids, every offer
+        has to be sold above its minimum price. Winners pay their bid (first price), shared over the
+        offers of the package by revenue (calculate_share()).
+
+        Returns:
+            dict: Result of solve_winner_determination().
+        '''
+        # the solver runs outside of the actor, carrier requests are served meanwhile
+        packages, reserves = self.collect_packages(item)
+        result = solve_winner_determination(packages, reserves, WDP_TIME_LIMIT)
+        self.award_packages(item, result['winners'])
+        print(f"\nWinner determination: {len(result['winners'])} of {len(packages)} bids accepted, revenue {result['revenue']} ({result['status']})")
+        return result
+
+    @command
+    def collect_packages(self, item):
+        '''Package bids (bidder, offer_ids, bid) and minimum prices of the offers of a combinatorial item.'''
+        packages = [((carrier_id, None), offer_ids, bid) for carrier_id, offer_ids, bid in item.packages]
+        for i in item.indices:
+            offer = self.offers[i]
+            offer.winner, offer.winning_bid = "NONE", "NONE"
+            packages += [((carrier_id, offer.offer_id), (offer.offer_id,), bid) for carrier_id, bid in offer.bids.items()]
+        reserves = {self.offers[i].offer_id: self.offers[i].profit for i in item.indices}
+        return packages, reserves
+
+    @command
+    def award_packages(self, item, winners):
+        index_of = {self.offers[i].offer_id: i for i in item.indices}
+        for (carrier_id, _), offer_ids, bid in winners:
+            indices = [index_of[offer_id] for offer_id in offer_ids]
+            for i, share in zip(indices, self.offers.revenue_shares(indices)):
+                self.offers[i].winner = carrier_id
+                self.offers[i].winning_bid = share * bid
+
+    def confirm_item(self, item):
+        print("\nEntering confirmation phase")
+        self.run_phase(item, "CONFIRM")
+        self.take_off_auction(item)
+
+    def run_auction_phases(self, item):
+        '''Runs REQ_OFFER, BID and RESULTS for the item, the caller runs CONFIRM (confirm_item()).
+
+        Returns:
+            int: Number of sold offers.
+        '''
+        self.offer_item(item)
+        return self.publish_results(item)
+
+    def clear_item(self, item):
+        '''RESULTS and CONFIRM of an item of a pipelined round, runs while the next item is offered.'''
+        self.publish_results(item)
+        self.confirm_item(item)
+
+    @property
+    def phase(self):
+        return self.scheduler.phase
+
+    def run_phase(self, item, phase):
+        '''Opens the phase of the item for the registered carriers and blocks until all of them have acted
+        in it, at the latest after BASE_TIMEOUT seconds, see PhaseScheduler.'''
+        self.open_phase(item, phase)
+        item.scheduler.wait()
+
+    @command
+    def open_phase(self, item, phase):
+        item.scheduler.enter(phase, BASE_TIMEOUT, self.registered_carriers)
+        self.pipeline.add(item)
+        self.auction_time = wall_clock(item.scheduler.deadline)
+
+    @command
+    def start_countdown(self, timeout):
+        '''Starts the countdown to the end of the registration (once, on the first offer).'''
+        self.auction_time = wall_clock(self.scheduler.set_deadline(timeout))
  
+    @command
     def add_offer(self, carrier_id, offer):
         offer_id = offer['offer_id']
         loc_pickup = offer['loc_pickup']
@@ -216,10 +390,12 @@ class Auctioneer:
         offer = Offer(carrier_id, offer_id, loc_pickup, loc_dropoff, min_price, revenue)
         self.offers.append(offer)
 
-    def check_active_carriers(self):
+    @command
+    def check_active_carriers(self, indices=()):
+        # 'indices' are the offers of the item whose results have just been published
         for register in self.registered_carriers:
             if register not in self.active_carriers:
-                for i in self.indices_on_auction:
+                for i in indices:
                     offer = self.offers[i]
                     if register==offer.winner or register==offer.carrier_id:
                         offer.winner = 'NONE'
@@ -228,33 +404,38 @@ class Auctioneer:
                             offer.bids = {}
         self.registered_carriers = self.active_carriers
 
+    @command
     def update_auction_list(self):
         new_list = []
         for offer in self.offers: 
             if offer.winner == "NONE" and offer.carrier_id in self.registered_carriers:
                 new_list.append(offer)
 
-        self.offers = new_list
+        self.offers.replace(new_list)
 
+    @command
     def print_auction_list(self):
         list_dict = [offer.to_dict() for offer in self.offers]
         utils.print_offer_list(list_dict)
 
+    @command
     def valide_bids_for_unsold_offer(self):
-        bid_is_legal = []
+        # the highest bid of an offer is kept by its bid book, stops at the first offer with a valide bid
         for offer in self.offers:
             if offer.winner == "NONE":
-                for bid in offer.bids.values():
-                    bid_is_legal.append(bid > offer.profit)
-        return any(bid_is_legal)
+                highest = offer.book.highest()
+                if highest is not None and highest[1] > offer.profit:
+                    return True
+        return False
     
 
-    def calculate_share(self, single_offer_id, bid):
-        # Calculate all_cost and get revenue for single_offer_id
+    @command
+    def calculate_share(self, single_offer_id, bid, indices):
+        # Calculate all_cost and get revenue for single_offer_id, 'indices' are the offers of the bundle
         all_cost = 0
         single_revenue = 0
         #(Shachar:) filters the offers in a single pass, which is typically faster than filtering in a for loop
-        bundle_offers = [self.offers[i] for i in self.indices_on_auction]
+        bundle_offers = [self.offers[i] for i in indices]
         all_cost = sum(offer.revenue for offer in bundle_offers)
         single_revenue = next(offer.revenue for offer in bundle_offers if offer.offer_id == single_offer_id)
         share = (single_revenue / all_cost) * bid
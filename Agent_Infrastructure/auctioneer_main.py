@@ -1,6 +1,13 @@
-
 from auctioneer_server import AuctioneerServer
+from async_server import AsyncAuctioneerServer
+
+SERVER_MODE = 'threaded' # threaded: one thread per connection, asyncio: all connections in one event loop
 
 if __name__ == "__main__":
-    auctioneer_server = AuctioneerServer()
-    auctioneer_server.start_server()
\ No newline at end of file
+    if SERVER_MODE == 'asyncio':
+        auctioneer_server = AsyncAuctioneerServer()
+    elif SERVER_MODE == 'threaded':
+        auctioneer_server = AuctioneerServer()
+    else:
+        raise ValueError(f"Unknown server mode '{SERVER_MODE}', use 'threaded' or 'asyncio'")
+    auctioneer_server.start_server()
@@ -0,0 +1,115 @@
+import heapq
+
+TOP_K = 2 # best bids kept ready, the second price needs two
+MECHANISMS = ('first_price', 'vickrey', 'reserve')
+
+
+class BidBook:
+    """
+    Bids on one offer. Every bid is pushed onto a max-heap (O(log n)), a carrier that bids again
+    replaces its bid and the old heap entry is skipped lazily. The k best bids are kept in a cache
+    that is updated on insertion, so the highest and second highest bid are O(1) queries; only a
+    carrier lowering one of the k best bids makes the next query rebuild the cache from the heap.
+    Attributes:
+        bids (dict)   : Carrier ID -> current bid
+        heap (list)   : Entries (-bid, sequence, carrier ID), outdated entries are skipped
+        latest (dict) : Carrier ID -> sequence of its current bid
+        k (int)       : Number of best bids in 'top'
+        top (list)    : The k best entries, best first, None: rebuilt on the next query
+        sequence (int): Number of bids so far, orders equal bids by arrival
+    """
+    def __init__(self, bids={}, k=TOP_K):
+        self.bids = {}
+        self.heap = []
+        self.latest = {}
+        self.k = k
+        self.top = []
+        self.sequence = 0
+        for bidder, bid in bids.items():
+            self.add(bidder, bid)
+
+    def __len__(self):
+        return len(self.bids)
+
+    def add(self, bidder, bid):
+        self.sequence += 1
+        replaced = self.bids.get(bidder)
+        self.bids[bidder] = bid
+        self.latest[bidder] = self.sequence
+        entry = (-bid, self.sequence, bidder)
+        heapq.heappush(self.heap, entry)
+        if len(self.heap) > 2 * len(self.bids) + self.k:
+            self.heap = [(-price, self.latest[carrier], carrier) for carrier, price in self.bids.items()]
+            heapq.heapify(self.heap)
+        if self.top is None:
+            return
+        in_top = any(top_bidder == bidder for _, _, top_bidder in self.top)
+        if in_top and bid < replaced:
+            # a bid outside the cache may be better now
+            self.top = None
+            return
+        top = [top_entry for top_entry in self.top if top_entry[2] != bidder]
+        if len(top) < self.k or entry < top[-1]:
+            top.append(entry)
+            top.sort()
+        self.top = top[:self.k]
+
+    def _rebuild_top(self):
+        valid = []
+        while self.heap and len(valid) < self.k:
+            entry = heapq.heappop(self.heap)
+            if self.latest.get(entry[2]) == entry[1]:
+                valid.append(entry)
+        for entry in valid:
+            heapq.heappush(self.heap, entry)
+        self.top = valid
+
+    def best(self):
+        '''The k best bids.
+
+        Returns:
+            list: (carrier ID, bid) tuples, highest first.
+        '''
+        if self.top is None:
+            self._rebuild_top()
+        return [(bidder, -negative_bid) for negative_bid, _, bidder in self.top]
+
+    def highest(self):
+        best = self.best()
+        return best[0] if best else None
+
+    def second_highest(self):
+        best = self.best()
+        return best[1] if len(best) > 1 else None
+
+
+def clear(book, reserve, mechanism='first_price'):
+    '''Winner and price of an offer, the winning bid has to exceed the reserve (minimum price).
+
+    Args:
+        book (BidBook): Bids on the offer.
+        reserve (float): Minimum price of the offer, None: no minimum.
+        mechanism (str): 'first_price': the winner pays its bid,
+            'vickrey': the winner pays the second highest bid, its own bid if the second one does not exceed the reserve,
+            'reserve': the winner pays the second highest bid, at least the reserve.
+
+    Returns:
+        tuple: (carrier ID, price), None if no bid exceeds the reserve.
+    '''
+    if mechanism not in MECHANISMS:
+        raise ValueError(f"Unknown auction mechanism '{mechanism}', use one of {MECHANISMS}")
+    highest = book.highest()
+    if highest is None or (reserve is not None and highest[1] <= reserve):
+        return None
+    winner, bid = highest
+    if mechanism == 'first_price':
+        return winner, bid
+    second = book.second_highest()
+    second_bid = second[1] if second is not None else None
+    if mechanism == 'vickrey':
+        price = second_bid if second_bid is not None and (reserve is None or second_bid > reserve) else bid
+    else:
+        # the reserve acts as a bid of the offering carrier
+        prices = [price for price in (second_bid, reserve) if price is not None]
+        price = max(prices) if prices else bid
+    return winner, price
@@ -0,0 +1,88 @@
+import numpy as np
+
+GRID_BITS = 10 # cells per coordinate of the grid: 2**GRID_BITS
+KMEANS_MAX_CLUSTERS = 256 # bounds the (offers, clusters) distance matrix
+KMEANS_ITERATIONS = 10
+
+
+def lane_features(pickups, dropoffs):
+    '''Features of the transport requests for clustering: pickup and dropoff, ordered so that both
+    directions of a lane get the same features (A -> B is the backhaul of B -> A, they complement each other).
+
+    Args:
+        pickups (np.ndarray): (n, 2) pickup locations (x, y).
+        dropoffs (np.ndarray): (n, 2) dropoff locations (x, y).
+
+    Returns:
+        np.ndarray: (n, 4) float64 features.
+    '''
+    pickups = np.asarray(pickups, dtype=np.float64).reshape(-1, 2)
+    dropoffs = np.asarray(dropoffs, dtype=np.float64).reshape(-1, 2)
+    swap = (pickups[:, 0] > dropoffs[:, 0]) | ((pickups[:, 0] == dropoffs[:, 0]) & (pickups[:, 1] > dropoffs[:, 1]))
+    first = np.where(swap[:, None], dropoffs, pickups)
+    second = np.where(swap[:, None], pickups, dropoffs)
+    return np.hstack([first, second])
+
+
+def grid_order(features, bits=GRID_BITS):
+    '''Order of the points along a Z-order (Morton) curve over a grid with 2**bits cells per feature,
+    points in the same or neighbouring cells end up close to each other.'''
+    n, dims = features.shape
+    if not n:
+        return np.zeros(0, dtype=np.intp)
+    low, high = features.min(axis=0), features.max(axis=0)
+    extent = np.where(high > low, high - low, 1)
+    cells = ((features - low) / extent * (2**bits - 1)).astype(np.uint64)
+    code = np.zeros(n, dtype=np.uint64)
+    for bit in range(bits):
+        for dim in range(dims):
+            code |= ((cells[:, dim] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(bit * dims + dim)
+    return np.argsort(code, kind='stable')
+
+
+def kmeans_labels(features, k, iterations=KMEANS_ITERATIONS):
+    '''Lloyd's k-means, the initial centers are spread along the grid order (deterministic).
+
+    Returns:
+        np.ndarray: (n,) cluster of every point, neighbouring clusters have close labels.
+    '''
+    order = grid_order(features)
+    centers = features[order[np.linspace(0, len(features) - 1, k).astype(np.intp)]]
+    squared = (features**2).sum(axis=1)[:, None]
+    for _ in range(iterations):
+        distances = squared - 2 * features @ centers.T + (centers**2).sum(axis=1)[None, :]
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, features)
+        filled = counts > 0
+        centers[filled] = sums[filled] / counts[filled, None]
+    return labels
+
+
+def spatial_bundles(pickups, dropoffs, size, method='grid'):
+    '''Bundles of spatially close (or opposite) lanes: the requests are ordered along the grid or by
+    k-means cluster and cut into consecutive groups.
+
+    Args:
+        pickups (np.ndarray): (n, 2) pickup locations (x, y).
+        dropoffs (np.ndarray): (n, 2) dropoff locations (x, y).
+        size (int): Requests per bundle, the last bundle may be smaller.
+        method (str): 'grid' (Z-order curve) or 'kmeans' (clusters, grid order inside a cluster).
+
+    Returns:
+        list: Index arrays of the bundles.
+    '''
+    features = lane_features(pickups, dropoffs)
+    n = len(features)
+    if method == 'grid':
+        order = grid_order(features)
+    elif method == 'kmeans':
+        k = max(1, min(KMEANS_MAX_CLUSTERS, -(-n // size)))
+        labels = kmeans_labels(features, k) if n else np.zeros(0, dtype=np.intp)
+        rank = np.empty(n, dtype=np.intp)
+        rank[grid_order(features)] = np.arange(n)
+        order = np.lexsort((rank, labels))
+    else:
+        raise ValueError(f"Unknown bundle method '{method}', use 'grid' or 'kmeans'")
+    return [order[start:start + size] for start in range(0, n, size)]
@@ -1,11 +1,29 @@
 import socket
 import json 
 import time
+import itertools
 from routing import Routing
 import utilities as utils
 from requests_handler import RequestHandler
 import numpy as np
 
+PACKAGE_CANDIDATES = 3 # offers with the best single bids, every combination of them is a package bid (combinatorial round)
+SESSION_MODE = True # one connection to the auctioneer for the auction day instead of one per request
+MAX_FAILED_ROUNDS = 3 # consecutive rounds without a confirmation before the carrier leaves the auction
+
+
+def reply_status(response):
+    '''Status of a reply of the auctioneer.
+
+    Args:
+        response (dict): Reply of RequestHandler, {"error": ...} if the request failed.
+
+    Returns:
+        str: The status of the payload, None for a failed request.
+    '''
+    return response.get("payload", {}).get("status")
+
+
 class Carrier:
 
     def __init__(self, carrier_id, socketio=None, server_host=socket.gethostname(), server_port=12340, path_config='config.yaml'):
@@ -18,7 +36,7 @@ class Carrier:
         self.routing = Routing(carrier_id, path_config)
         print("\nTransport requests:\n")
         self.print_offer_list()
-        self.request_handler = RequestHandler(carrier_id, server_host, server_port)
+        self.request_handler = RequestHandler(carrier_id, server_host, server_port, session=SESSION_MODE)
 
 
     def _wait_until(self, timeout):
@@ -34,14 +52,35 @@ class Carrier:
         
         # offer['loc_pickup'] = [{'pos_x': ..., 'pos_y': ...}, {'pos_x': ..., 'pos_y': ...}]
         else:
-            loc_pickup = []
-            loc_dropoff = []
-            for i in range(len(offer['loc_pickup'])):
-                loc_pickup.append(tuple(utils.dict_to_float(offer['loc_pickup'][i]).values()))
-                loc_dropoff.append(tuple(utils.dict_to_float(offer['loc_dropoff'][i]).values()))
+            loc_pickup = utils.positions_to_array(offer['loc_pickup'])
+            loc_dropoff = utils.positions_to_array(offer['loc_dropoff'])
             bid = self.routing.calculate_bid(loc_pickup, loc_dropoff, revenue)
         return offer_id, bid
     
+    def calculate_package_bids(self, offers):
+        '''Bids of a combinatorial round: every combination of the PACKAGE_CANDIDATES offers with the best
+        single bids is a package (the auctioneer accepts one of them at most), the other offers get single bids.
+
+        Returns:
+            tuple: Package bids [{"offer_ids": [...], "bid": ...}] and single bids {offer_id: bid}, positive bids only.
+        '''
+        singles = dict(self.calculate_bid(offer) for offer in offers)
+        ranked = sorted((offer for offer in offers if singles[offer['offer_id']] > 0), key=lambda offer: singles[offer['offer_id']], reverse=True)
+        candidates = ranked[:PACKAGE_CANDIDATES]
+        packages = [{"offer_ids": [offer['offer_id']], "bid": singles[offer['offer_id']]} for offer in candidates]
+        for size in range(2, len(candidates)+1):
+            for package in itertools.combinations(candidates, size):
+                _, bid = self.calculate_bid({
+                    "offer_id": None,
+                    "loc_pickup": [location for offer in package for location in offer['loc_pickup']],
+                    "loc_dropoff": [location for offer in package for location in offer['loc_dropoff']],
+                    "revenue": sum(float(offer['revenue']) for offer in package)
+                    })
+                if bid > 0:
+                    packages.append({"offer_ids": [offer['offer_id'] for offer in package], "bid": bid})
+        bids = {offer['offer_id']: singles[offer['offer_id']] for offer in ranked[PACKAGE_CANDIDATES:]}
+        return packages, bids
+
     def update_offer_list(self, offer):
         if (offer['offeror']==self.carrier_id and offer['winner']!="NONE") or offer['winner']==self.carrier_id :
             self.routing.update_offer_list(offer)
@@ -67,45 +106,60 @@ class Carrier:
         auction_time = response["timeout"]
         self._wait_until(auction_time+1)  # Wait to auction time
 
+        failed_rounds = 0
         while True:
+            # no sleeping until the phase deadlines, the auctioneer holds early requests until their phase opens
             # perform request offer
             response = self.request_handler.request_offer() # Request current offers
             
             print("\n Auctioneer response to request_offers:")
-            if response["payload"]["status"]!="OK":
+            if reply_status(response) != "OK":
                 print(json.dumps(response, indent=2, default=str))
             else:
                 print(json.dumps(response["payload"], indent=2, default=str)) 
-            offer = response["payload"]["offer"]
-            offer_id, bid = self.calculate_bid(offer)
-            
-            auction_time = response["timeout"]
-            self._wait_until(auction_time+1)  # Wait to auction time
-            # perform bidding
-            response = self.request_handler.send_bid(offer_id, bid)  # Send a bid
-            print("\n Auctioneer response to bid:")
-            if response["payload"]["status"]!="OK":
-                print(json.dumps(response, indent=2, default=str))
-            else:
-                print(json.dumps(response["payload"], indent=2, default=str)) 
-            auction_time = response["timeout"]
-            self._wait_until(auction_time+1)  # Wait to auction time
+            # no item for this carrier (it missed the phase, nothing is on auction) or no reply: no bids in
+            # this round, the carrier still takes part in its results and confirmation
+            if reply_status(response) == "OK":
+                # several items in a simultaneous round, each bid is calculated against the current tour
+                offers = response["payload"]["offers"]
+
+                # perform bidding
+                if response["payload"].get("package_bids"):
+                    response = self.request_handler.send_packages(*self.calculate_package_bids(offers))  # Send package bids
+                else:
+                    bids = dict(self.calculate_bid(offer) for offer in offers)
+                    if len(bids) == 1:
+                        response = self.request_handler.send_bid(*next(iter(bids.items())))  # Send a bid
+                    else:
+                        response = self.request_handler.send_bids(bids)  # Send one bid per item
+                print("\n Auctioneer response to bid:")
+                if reply_status(response) != "OK":
+                    print(json.dumps(response, indent=2, default=str))
+                else:
+                    print(json.dumps(response["payload"], indent=2, default=str))
 
             # perform request auction results: Receives list of single offers; bundles no longer needed
             response = self.request_handler.request_auction_results()  # Request auction results
             
             print("\n Auctioneer response to request_results:")
-            if response["payload"]["status"]!="OK":
+            if reply_status(response) != "OK":
                 print(json.dumps(response, indent=2, default=str))
             else:
                 print(json.dumps(response["payload"], indent=2, default=str)) 
 
-            auction_time = response["timeout"]
-            self._wait_until(auction_time+1)  # Wait to auction time
 
             response = self.request_handler.confirm_results()
             print("\n Auctioneer response to confirm_results:")
-            print(json.dumps(response["payload"], indent=2, default=str))
+            print(json.dumps(response.get("payload", response), indent=2, default=str))
+            if reply_status(response) != "OK":
+                # e.g. CONFIRMATION_TIMEOUT or a connection error, the carrier goes on with the next round
+                failed_rounds += 1
+                if failed_rounds >= MAX_FAILED_ROUNDS:
+                    print(f"\nNo confirmation in {failed_rounds} rounds, leaving the auction")
+                    self.request_handler.close_session()
+                    exit()
+                continue
+            failed_rounds = 0
             # payload: [offer1, offer2, ...]
             received_offers = response["payload"]["offers"]
             for received_offer in received_offers:
@@ -114,11 +168,11 @@ class Carrier:
             if not response["payload"]["next_round"]:
                 self.routing.update_statistics()
                 self.print_offer_list(show_cost=True, show_profit=True)
+                print(f"\nBids: {self.routing.bid_stats['bids']}, answered without solving: {self.routing.bid_stats['pruned']}")
                 print("\nAuction day over")
+                self.request_handler.close_session()
                 exit()
 
-            auction_time = response["timeout"]
-            self._wait_until(auction_time+1)
 
     def print_offer_list(self, show_cost=False, show_profit=False):
         list_dict = [offer.to_dict(show_profit, show_cost) for offer in self.routing.offers]
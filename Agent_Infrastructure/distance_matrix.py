@@ -0,0 +1,97 @@
+import numpy as np
+import utilities as utils
+
+
+class DistanceMatrix:
+    """
+    Persistent distance matrix of the carrier's locations.
+    New stops only add one row and column each, removed stops are dropped from the
+    index so the matrix of the current locations is always a view into the buffer.
+    Attributes:
+        mode (str)          : "manhattan" or "euclid"
+        scale (int)         : Fixed-point scale factor of the distances
+        points (np.ndarray) : (capacity, 2) coordinates of all stored stops
+        buffer (np.ndarray) : (capacity, capacity) int64 distances between all stored stops
+        size (int)          : Number of stored stops (rows in use)
+        index (np.ndarray)  : Buffer row of each current location, in location order
+        ids (np.ndarray)    : Stop id of each buffer row, stable across compactions
+    """
+    def __init__(self, locations=[], mode="manhattan", scale=1):
+        self.mode = mode
+        self.scale = scale
+        self.points = np.empty((0, 2))
+        self.buffer = np.zeros((0, 0), dtype=np.int64)
+        self.size = 0
+        self.index = np.empty(0, dtype=np.intp)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.next_id = 0
+        self.append(locations)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _reserve(self, size):
+        # grow the buffer geometrically so appends cost O(n) amortized,
+        # rows of removed stops are dropped on the way
+        if size <= len(self.buffer):
+            return
+        live = len(self.index)
+        capacity = max(16, 2 * (live + size - self.size))
+        points = np.empty((capacity, 2))
+        ids = np.empty(capacity, dtype=np.int64)
+        buffer = np.zeros((capacity, capacity), dtype=np.int64)
+        points[:live] = self.points[self.index]
+        ids[:live] = self.ids[self.index]
+        buffer[:live, :live] = self.buffer[np.ix_(self.index, self.index)]
+        self.points, self.buffer, self.ids = points, buffer, ids
+        self.size = live
+        self.index = np.arange(live)
+
+    def append(self, locations):
+        """
+        Append locations, computes one row and column of distances per new stop.
+        """
+        new_points = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        if not len(new_points):
+            return
+        self._reserve(self.size + len(new_points))
+        start, end = self.size, self.size + len(new_points)
+        self.points[start:end] = new_points
+        self.ids[start:end] = np.arange(self.next_id, self.next_id + len(new_points))
+        self.next_id += len(new_points)
+        rows = utils.create_distance_matrix(self.points[:end], self.mode, self.scale, targets=new_points)
+        self.buffer[start:end, :end] = rows
+        self.buffer[:end, start:end] = rows.T
+        self.size = end
+        self.index = np.concatenate([self.index, np.arange(start, end)])
+
+    def select(self, keep):
+        """
+        Keep only the locations at the positions 'keep' (in that order).
+        """
+        self.index = self.index[np.asarray(keep, dtype=np.intp)]
+
+    def get_stop_ids(self, keep=None):
+        """
+        Stop ids of the current locations (restricted to 'keep').
+        """
+        index = self.index if keep is None else self.index[np.asarray(keep, dtype=np.intp)]
+        return self.ids[index]
+
+    def get_matrix(self, keep=None, extra=[]):
+        """
+        Distance matrix of the current locations (restricted to 'keep') followed by 'extra' locations,
+        the extra locations are not stored.
+        """
+        index = self.index if keep is None else self.index[np.asarray(keep, dtype=np.intp)]
+        base = self.buffer[np.ix_(index, index)]
+        extra = np.asarray(extra, dtype=np.float64).reshape(-1, 2)
+        if not len(extra):
+            return base
+        n, k = len(index), len(extra)
+        rows = utils.create_distance_matrix(np.vstack([self.points[index], extra]), self.mode, self.scale, targets=extra)
+        dist_mat = np.empty((n + k, n + k), dtype=np.int64)
+        dist_mat[:n, :n] = base
+        dist_mat[n:, :] = rows
+        dist_mat[:n, n:] = rows[:, :n].T
+        return dist_mat
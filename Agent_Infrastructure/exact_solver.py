@@ -0,0 +1,69 @@
+from functools import lru_cache
+import numpy as np
+
+INFINITY = np.iinfo(np.int64).max // 4
+
+
+@lru_cache(maxsize=None)
+def precedence_layers(n_requests):
+    """
+    Subsets of the 2*n_requests request nodes (bit 2i: pickup i, bit 2i+1: dropoff i) in which
+    no dropoff is visited before its pickup, grouped by the number of visited nodes.
+    """
+    masks = np.arange(1 << (2 * n_requests), dtype=np.int64)
+    valid = np.ones(len(masks), dtype=bool)
+    count = np.zeros(len(masks), dtype=np.int64)
+    for i in range(n_requests):
+        pickup, dropoff = (masks >> (2 * i)) & 1, (masks >> (2 * i + 1)) & 1
+        valid &= dropoff <= pickup
+        count += pickup + dropoff
+    return [masks[valid & (count == size)] for size in range(2 * n_requests + 1)]
+
+
+def solve_exact(dist_mat, pickups_deliveries, depot=0):
+    """
+    Optimal single vehicle tour with every pickup before its dropoff (Held-Karp dynamic program
+    over the visited subsets, O(3^n * 4n^2) for n requests).
+    Args:
+        dist_mat (np.ndarray)   : Distance matrix of all nodes
+        pickups_deliveries (list): [pickup, dropoff] node indices of the requests
+        depot (int)             : Start and end node of the tour
+    Returns:
+        list of int: The tour as node indices, first and last node is the depot
+        int: The length of the tour
+    """
+    dist_mat = np.asarray(dist_mat, dtype=np.int64)
+    nodes = np.asarray(pickups_deliveries, dtype=np.intp).reshape(-1)
+    size = len(nodes)
+    if not size:
+        return [depot, depot], 0
+    between = dist_mat[np.ix_(nodes, nodes)]
+    cost = np.full((1 << size, size), INFINITY, dtype=np.int64)
+    parent = np.full((1 << size, size), -1, dtype=np.int8)
+    pickups = np.arange(0, size, 2)
+    cost[1 << pickups, pickups] = dist_mat[depot, nodes[pickups]]
+    layers = precedence_layers(size // 2)
+    for masks in layers[1:-1]:
+        for node in range(size):
+            bit = 1 << node
+            # extend by 'node' if it is not visited yet and, for a dropoff, its pickup is
+            allowed = (masks & bit) == 0
+            if node % 2:
+                allowed &= (masks & (bit >> 1)) != 0
+            source = masks[allowed]
+            if not len(source):
+                continue
+            candidates = cost[source] + between[:, node]
+            best = candidates.argmin(axis=1)
+            cost[source | bit, node] = candidates[np.arange(len(source)), best]
+            parent[source | bit, node] = best
+    full = (1 << size) - 1
+    total = cost[full] + dist_mat[nodes, depot]
+    last = int(total.argmin())
+    length = int(total[last])
+    route = []
+    mask = full
+    while last >= 0:
+        route.append(int(nodes[last]))
+        mask, last = mask & ~(1 << last), int(parent[mask, last])
+    return [depot] + route[::-1] + [depot], length
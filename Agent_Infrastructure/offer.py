@@ -1,4 +1,5 @@
 import numpy as np
+from bid_book import BidBook, clear
 
 
 class Offer:
@@ -11,39 +12,34 @@ class Offer:
         self.profit = profit
         self.revenue = revenue
         self.cost = cost
-        self.bids = {}     
+        self.book = BidBook() # bids of the carriers, see bids
         self.on_auction = False     
         self.winner = winner     
         self.winning_bid = winning_bid        
 
+    @property
+    def bids(self):
+        """
+        Carrier ID -> bid, add bids with add_bid(), assigning a dict replaces all bids.
+        """
+        return self.book.bids
+
+    @bids.setter
+    def bids(self, bids):
+        self.book = BidBook(bids)
+
     def add_bid(self, bidder ,bid):
-        self.bids[bidder] = bid
+        self.book.add(bidder, bid)
 
     def get_second_highest_bid(self):
-        if not self.bids.values():
-            return False 
-        else:
-            sorted_bids = sorted(self.bids.items(), key=lambda k: k[1])
-            second_highest_bid = sorted_bids[1][1]
-            winner = sorted_bids[0][0]
-            if second_highest_bid <= self.profit:
-                return self.get_highest_bid()
-            return winner, second_highest_bid
+        return clear(self.book, self.profit, 'vickrey') or False
         
     def get_highest_bid(self):
-        if not self.bids.values():
-            return False 
-        else:
-            highest_bid = max(self.bids.items(), key=lambda k: k[1])
-            if highest_bid[1] <= self.profit:
-                return False
-            return highest_bid
+        return clear(self.book, self.profit) or False
 
-    def update_results(self, mode=None):
-        if mode=='vickrey':
-            highest_bid = self.get_second_highest_bid()
-        else:
-            highest_bid = self.get_highest_bid()
+    def update_results(self, mode='first_price'):
+        # mode: 'first_price', 'vickrey' or 'reserve', see bid_book.clear()
+        highest_bid = clear(self.book, self.profit, mode)
         if highest_bid:
             winner_carrier_id, winning_bid = highest_bid
         else:
@@ -4,13 +4,29 @@ import time
 import uuid
 import traceback #tmps
 
+SESSION_RETRIES = 3 # reconnects for one request of a session before it fails
+RECONNECT_DELAY = 0.5 # seconds between reconnects
+
 
 class RequestHandler:
+    """
+    Sends the requests of a carrier to the auctioneer. By default every request opens a connection that
+    the auctioneer closes after its response. In session mode the carrier keeps one connection for the
+    auction day and sends its requests over it, each with a request ID the response carries back; a lost
+    connection is reopened and the request sent again (the auctioneer answers it from its last reply).
+    Attributes:
+        session (bool)                  : Session mode
+        session_socket (socket.socket)  : Connection of the session, None until the first request
+        session_stream (io.BufferedReader): Responses of the session, one line each
+    """
 
-    def __init__(self, carrier_id, server_host, server_port):
+    def __init__(self, carrier_id, server_host, server_port, session=False):
         self.carrier_id = carrier_id
         self.server_host = server_host
         self.server_port = server_port
+        self.session = session
+        self.session_socket = None
+        self.session_stream = None
 
     def connect_to_auctioneer(self):
         carrier_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -22,17 +38,22 @@ class RequestHandler:
         return carrier_socket
 
     def send_request(self, action, payload):
+        request = {
+            "carrier_id": self.carrier_id,
+            "action": action,
+            "time": str(int(time.time())),
+            "payload": payload
+        }
+        if self.session:
+            return self.send_session_request(request)
         with self.connect_to_auctioneer() as carrier_socket:
             if carrier_socket is None:
                 return {"error": "Connection error"}
-            request = {
-                "carrier_id": self.carrier_id,
-                "action": action,
-                "time": str(int(time.time())),
-                "payload": payload
-            }
-            carrier_socket.send(json.dumps(request).encode('utf-8'))
-            response = carrier_socket.recv(2048)
+            carrier_socket.sendall(json.dumps(request).encode('utf-8'))
+            # the auctioneer closes the connection after its response, which may not fit a single recv()
+            response = b""
+            while chunk := carrier_socket.recv(4096):
+                response += chunk
             try:
                 return json.loads(response.decode('utf-8'))
             except json.JSONDecodeError:
@@ -41,6 +62,52 @@ class RequestHandler:
 
                 return {"error": "Failed to decode JSON response"}
 
+    def send_session_request(self, request):
+        '''Sends a request over the session connection, (re)opened as needed, and waits for its response.
+
+        Args:
+            request (dict): The request, it gets a request ID.
+
+        Returns:
+            dict: The response with the request ID of the request.
+        '''
+        request['request_id'] = uuid.uuid4().hex
+        message = (json.dumps(request) + "\n").encode('utf-8')
+        for attempt in range(SESSION_RETRIES + 1):
+            if attempt:
+                time.sleep(RECONNECT_DELAY)
+            if self.session_socket is None and not self.open_session():
+                continue
+            try:
+                self.session_socket.sendall(message)
+                while line := self.session_stream.readline():
+                    response = json.loads(line)
+                    if response.get('request_id') == request['request_id']:
+                        return response
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Session connection to the auctioneer lost: {e}")
+            # connection lost, the request is sent again over a new one
+            self.close_session()
+        return {"error": "Connection error"}
+
+    def open_session(self):
+        carrier_socket = self.connect_to_auctioneer()
+        if carrier_socket is None:
+            return False
+        self.session_socket = carrier_socket
+        self.session_stream = carrier_socket.makefile('rb')
+        return True
+
+    def close_session(self):
+        """
+        Closes the connection of the session, e.g. at the end of the auction day.
+        """
+        if self.session_socket is not None:
+            self.session_stream.close()
+            self.session_socket.close()
+        self.session_socket = None
+        self.session_stream = None
+
     def register(self):
         return self.send_request("register", {})
 
@@ -64,6 +131,21 @@ class RequestHandler:
         }
         return self.send_request("bid", payload)
 
+    def send_bids(self, bids):
+        # one bid per item of a simultaneous round, {offer_id: bid}
+        payload = {
+            "bids": bids
+        }
+        return self.send_request("bid", payload)
+
+    def send_packages(self, packages, bids={}):
+        # package bids of a combinatorial round [{"offer_ids": [...], "bid": ...}] and single bids {offer_id: bid}
+        payload = {
+            "packages": packages,
+            "bids": bids
+        }
+        return self.send_request("bid", payload)
+
     def request_auction_results(self):
         return self.send_request("request_auction_results", {})
     
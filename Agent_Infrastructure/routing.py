@@ -5,11 +5,17 @@ import utilities as utils
 from algorithm import AlgorithmBase
 from cost_model import CostModel
 from offer import Offer
+from solver_executor import shared_executor
+from search_budget import SearchBudget
 from datetime import datetime
 
 current_date = datetime.now()
 formatted_date = current_date.strftime('%y%m%d')
 
+BID_ENGINE = 'exact' # 'exact': solve the tour with the offer, 'insertion': cheapest insertion into the current tour
+MARGINAL_COST_MODE = 'resolve' # 'resolve': solve the tour without each offer, 'removal': splice it out of the tour
+BID_PRUNING = True # skip the solver when the best possible bid (added distance bound) is not positive
+
 def load_config(config_file):
     """
     Load configuration data from a YAML file
@@ -37,9 +43,28 @@ class Routing(AlgorithmBase):
         self.depot_location = self.set_depot_location(config_data)
         self.offers = self.create_offer_list(n)
         self.on_auction_indices = []
+        self.bid_engine = config_data.get('bid_engine', BID_ENGINE) if config_data else BID_ENGINE
+        self.marginal_cost_mode = config_data.get('marginal_cost_mode', MARGINAL_COST_MODE) if config_data else MARGINAL_COST_MODE
+        self.removal_window = config_data.get('removal_window', 0) if config_data else 0
+        self.bid_pruning = config_data.get('bid_pruning', BID_PRUNING) if config_data else BID_PRUNING
+        # 'pruned': bids answered by get_added_distance_bound() without solving
+        self.bid_stats = {'bids': 0, 'pruned': 0}
 
         locations, assignments = self.get_locations_and_assignments()
         super().__init__(locations, assignments)
+        # one pool per process, not per carrier
+        self.solver_executor = shared_executor(config_data.get('solver_workers', 0) if config_data else 0)
+        if config_data and 'routing_backend' in config_data:
+            self.routing_backend = config_data['routing_backend']
+        if config_data and 'exact_max_requests' in config_data:
+            self.exact_max_requests = config_data['exact_max_requests']
+        if config_data and config_data.get('deterministic_search'):
+            # reproducible bids: no wall-clock limits and no warm start, see SearchBudget
+            self.search_budget = SearchBudget(deterministic=True)
+        # baseline tour (without offers on auction) cached per tour_version,
+        # the version changes whenever the carrier's requests change
+        self.tour_version = 0
+        self._baseline_tour = None
 
 
     def create_offer_list(self, n):
@@ -72,19 +97,23 @@ class Routing(AlgorithmBase):
         return loc
     
 
+    def get_tour_offers(self):
+        # interested only in transport requests that were not sold or that were bought by the carrier,
+        # the i-th offer is the i-th assignment of get_locations_and_assignments()
+        return [offer for offer in self.offers if offer.on_auction == False]
+
+
     def get_locations_and_assignments(self): 
         locations = [self.depot_location]
         assignments = []
-        for offer in self.offers:
-            if offer.on_auction == False : 
-                # interested only in transport requests that were not sold or that were bought by the carrier
-                # extract positions and append to locations
-                pickup_index = len(locations)  # Index of the next pickup location
-                locations.append((offer.loc_pickup["pos_x"], offer.loc_pickup["pos_y"]))
-                dropoff_index = len(locations)  # Index of the next dropoff location
-                locations.append((offer.loc_dropoff["pos_x"], offer.loc_dropoff["pos_y"]))
-                # Append the indices to the assignment list
-                assignments.append([pickup_index, dropoff_index])
+        for offer in self.get_tour_offers():
+            # extract positions and append to locations
+            pickup_index = len(locations)  # Index of the next pickup location
+            locations.append((offer.loc_pickup["pos_x"], offer.loc_pickup["pos_y"]))
+            dropoff_index = len(locations)  # Index of the next dropoff location
+            locations.append((offer.loc_dropoff["pos_x"], offer.loc_dropoff["pos_y"]))
+            # Append the indices to the assignment list
+            assignments.append([pickup_index, dropoff_index])
         return locations, assignments
     
 
@@ -93,10 +122,11 @@ class Routing(AlgorithmBase):
             thresh = self.cost_model.threshold
         # calcualte optimal tour including all transport requests
         optimal_tour = self.get_optimal_tour()
+        # calcualte optimal tours without each transport request on the solver executor
+        optimal_tours_without_offer = self.get_optimal_tours([{'ignore_indices': [i]} for i in range(len(self.offers))])
         requests_below_thresh = []
         for i, offer in enumerate(self.offers):
-            # calcualte optimal tour without the i-th transport request
-            optimal_tour_without_offer = self.get_optimal_tour(ignore_indices=[i])
+            optimal_tour_without_offer = optimal_tours_without_offer[i]
             # calcualte marginal distance of the i-th transport request
             margin_distance = float(optimal_tour['distance']) - float(optimal_tour_without_offer['distance'])
             # calcualte marginal cost of the i-th transport request
@@ -118,24 +148,46 @@ class Routing(AlgorithmBase):
             self.delete_location(self.on_auction_indices)
             print(f"\nindices on auction: {self.on_auction_indices}\n")
         # update the optimal tour
-        self.optimal_tour = self.get_optimal_tour()
+        self.optimal_tour = self.get_baseline_tour()
         print(f"\nOptimal tour: {self.optimal_tour}, \nlength: {len(optimal_tour['optimalTour'])}\n")
         # retrun the requests that are for sale
         print(f"statistics: {self.stats}")
         return requests_below_thresh
 
 
+    def get_baseline_tour(self):
+        """
+        Optimal tour of the carrier's current requests, solved at most once per tour_version.
+        """
+        if self._baseline_tour is None or self._baseline_tour[0] != self.tour_version:
+            self._baseline_tour = (self.tour_version, self.get_optimal_tour())
+        return self._baseline_tour[1]
+
+
     def calculate_bid(self, loc_pickup, loc_dropoff, revenue):
         n_jobs = len(loc_pickup) # number of offers in the bundle
-        optimal_tour_distance = float(self.optimal_tour['distance'])
-        optimal_tour_with_offer_distance = float(self.get_optimal_tour(include_pickups=loc_pickup, include_dropoffs=loc_dropoff)['distance'])
-        margin_distance = optimal_tour_with_offer_distance - optimal_tour_distance
+        self.bid_stats['bids'] += 1
+        if self.bid_pruning:
+            # best possible bid, the added distance is at least the bound
+            bound = self.get_added_distance_bound(loc_pickup, loc_dropoff)
+            best_bid = revenue - self.cost_model.get_marginal_cost(bound, n_jobs) - (self.cost_model.threshold*n_jobs)
+            if best_bid <= 0:
+                self.bid_stats['pruned'] += 1
+                return best_bid
+        optimal_tour = self.get_baseline_tour()
+        if self.bid_engine == 'insertion':
+            margin_distance = self.get_insertion_distance(optimal_tour, include_pickups=loc_pickup, include_dropoffs=loc_dropoff)
+        else:
+            optimal_tour_distance = float(optimal_tour['distance'])
+            optimal_tour_with_offer_distance = float(self.get_optimal_tour(include_pickups=loc_pickup, include_dropoffs=loc_dropoff)['distance'])
+            margin_distance = optimal_tour_with_offer_distance - optimal_tour_distance
         margin_cost = self.cost_model.get_marginal_cost(margin_distance, n_jobs)
         profit = revenue - margin_cost
         return profit - (self.cost_model.threshold*n_jobs)
 
 
     def update_offer_list(self, offer_to_update):
+        self.tour_version += 1
         if self.carrier_id==offer_to_update['offeror']:
             # carrier is the offeror and maybe the winner
             for i,offer in enumerate(self.offers):
@@ -146,33 +198,26 @@ class Routing(AlgorithmBase):
                         offer.on_auction = False
                         # carrier is the winner -> add location back to tour
                         self.add_location(pickup=[offer_to_update['loc_pickup']], dropoff=[offer_to_update['loc_dropoff']])
-                        self.optimal_tour = self.get_optimal_tour()
+                        self.optimal_tour = self.get_baseline_tour()
         else:                  
             # carrier is the winner but not the offeror          
             self.add_offer(offer_to_update)
-            self.optimal_tour = self.get_optimal_tour()
+            self.optimal_tour = self.get_baseline_tour()
         # if carrier was the seller no need to calculate optimal tour...
 
 
     def add_location(self, pickup=[], dropoff=[]):
-        loc_pickup = []
-        loc_dropoff = []
-        for i in range(len(pickup)):
-                loc_pickup.append(tuple(utils.dict_to_float(pickup[i]).values()))
-                loc_dropoff.append(tuple(utils.dict_to_float(dropoff[i]).values()))
-
-        for include_location in zip(loc_pickup, loc_dropoff): # zip( [(1,2),()], [(3,4),()] ) -> [ ( (1,2), (3,4) ), () ]
-            self.locations.extend(list(include_location)) 
-            self.assignments.append([len(self.locations)-2, len(self.locations)-1])
+        self.add_locations(utils.positions_to_array(pickup), utils.positions_to_array(dropoff))
+        self.tour_version += 1
 
 
     def delete_location(self, ignore_indices):
-        locations = []; assignments = []
-        locations, assignments = self.filter_requests_by_index(ignore_indices)
-        self.locations = locations; self.assignments = assignments
+        self.tour_version += 1
+        self.remove_requests(ignore_indices)
 
 
     def add_offer(self, offer):
+        self.tour_version += 1
         carrier_id = offer['offeror']
         offer_id = offer['offer_id']
         loc_pickup = offer['loc_pickup']
@@ -200,13 +245,15 @@ class Routing(AlgorithmBase):
         for offer in self.offers:
             if offer.winner == "NONE":
                 offer.on_auction = False
-        # get ALL unsold offers
-        offers_not_sold = [offer for offer in self.offers if not offer.on_auction]
+        # get ALL unsold offers, in the order of the assignments
+        offers_not_sold = self.get_tour_offers()
         # set new locations and assignments lists
         locations, assignments = self.get_locations_and_assignments()
-        self.locations, self.assignments = locations, assignments
+        self.locations = locations
+        self.store.set_assignments(assignments, [offer.offer_id for offer in offers_not_sold])
+        self.tour_version += 1
         assert len(self.locations) == len(offers_not_sold)*2+1
-        self.optimal_tour = self.get_optimal_tour()
+        self.optimal_tour = self.get_baseline_tour()
         new_stats = {
         'new_revenue': 0,
         'new_cost': 0,
@@ -218,12 +265,10 @@ class Routing(AlgorithmBase):
                 new_stats['new_revenue'] += offer.winning_bid
                 assert offer.winner != "NONE" and offer.winner != self.carrier_id
         # calculate revenue and cost of unsold and bought offers
-        for i, offer in enumerate(offers_not_sold):
+        margin_distances = self.get_marginal_distances(self.optimal_tour, self.marginal_cost_mode, self.removal_window)
+        for offer, margin_distance in zip(offers_not_sold, margin_distances):
             new_stats['new_revenue'] += offer.revenue
             
-            optimal_tour_without_offer = self.get_optimal_tour(ignore_indices=[i])
-            assert len(optimal_tour_without_offer['optimalTour']) == len(self.optimal_tour['optimalTour'])-2
-            margin_distance = float(self.optimal_tour['distance']) - float(optimal_tour_without_offer['distance'])
             margin_cost = self.cost_model.get_marginal_cost(margin_distance)
             new_stats['new_cost'] += margin_cost
            
@@ -252,8 +297,6 @@ class Routing(AlgorithmBase):
 
     def update_locations_and_assignments(self, ignore_indices=[], include_pickups=[], include_dropoffs=[]):
         if ignore_indices:
-            self.locations, self.assignments = self.filter_requests_by_index(ignore_indices)
+            self.remove_requests(ignore_indices)
         if include_pickups:
-            for include_location in zip(include_pickups, include_dropoffs): # zip( [(1,2),()], [(3,4),()] ) -> [ ( (1,2), (3,4) ), () ]
-                self.locations.extend(list(include_location)) 
-                self.assignments.append([len(self.locations)-2, len(self.locations)-1])
\ No newline at end of file
+            self.add_locations(include_pickups, include_dropoffs)
\ No newline at end of file
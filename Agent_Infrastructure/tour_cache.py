@@ -0,0 +1,128 @@
+import sys
+import time
+import threading
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+CACHE_MAX_ENTRIES = 1024
+CACHE_MAX_BYTES = 32 * 1024 * 1024 # estimated size of the cached tours
+CACHE_TTL_SECONDS = 600 # 0: entries never expire
+
+
+def tour_key(data, params=()):
+    '''Canonical key of a routing problem: hash of the distance matrix, the transport requests
+    (in any order), the depot, the number of vehicles and the solver parameters.
+
+    Args:
+        data (dict): Tour data, see create_tour_data().
+        params (tuple): Solver parameters that change the result (backend, limits, ...), hashed by repr().
+
+    Returns:
+        str: Hex digest.
+    '''
+    dist_mat = np.ascontiguousarray(data["distance_matrix"], dtype=np.int64)
+    key = hashlib.blake2b(digest_size=16)
+    key.update(np.int64(len(dist_mat)).tobytes())
+    key.update(dist_mat.tobytes())
+    requests = sorted((int(pickup), int(dropoff)) for pickup, dropoff in data["pickups_deliveries"])
+    key.update(repr((requests, data["depot"], data["num_vehicles"], params)).encode())
+    return key.hexdigest()
+
+
+def _size(value):
+    # rough memory footprint of a cached value (containers are followed)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class TourCache:
+    """
+    LRU cache of solved tours with expiry, bounded by the number of entries and their estimated size.
+    The values are shared with the callers and must not be modified. A lock guards the entries, so one
+    cache can be shared by threads (e.g. the request handlers of the web app).
+    Attributes:
+        max_entries (int)  : Maximum number of cached tours
+        max_bytes (int)    : Maximum estimated size of the cached tours
+        ttl_seconds (float): Lifetime of an entry, 0: no expiry
+        entries (OrderedDict): key -> (expiry time, size, value), least recently used first
+        size (int)         : Estimated size of the cached tours
+        hits, misses, evictions, expirations (int): Counters
+    """
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Returns the value of the key or None.
+        """
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[2]
+
+    def put(self, key, value):
+        """
+        Stores the value, evicts the least recently used tours beyond the limits.
+        """
+        size = _size(value)
+        with self._lock:
+            self._put(key, value, size)
+
+    def _put(self, key, value, size):
+        if key in self.entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        expiry = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        self.entries[key] = (expiry, size, value)
+        self.size += size
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,69 @@
+from ortools.sat.python import cp_model
+
+WDP_TIME_LIMIT_S = 2.0 # time budget of the winner determination, the best allocation found so far is used
+WDP_WORKERS = 8
+PRICE_SCALE = 100 # CP-SAT needs integer coefficients, bids are rounded to cents
+
+
+def greedy_allocation(packages):
+    '''Accepts the package bids by decreasing bid as long as they do not overlap, fallback if
+    CP-SAT finds no allocation within its time budget.'''
+    winners, sold, bidders = [], set(), set()
+    for package in sorted(packages, key=lambda package: package[2], reverse=True):
+        bidder, offer_ids, _ = package
+        if bidder in bidders or sold.intersection(offer_ids):
+            continue
+        winners.append(package)
+        sold.update(offer_ids)
+        bidders.add(bidder)
+    return winners
+
+
+def solve_winner_determination(packages, reserves={}, time_limit_s=WDP_TIME_LIMIT_S, workers=WDP_WORKERS):
+    '''Winner determination of a combinatorial auction, a set packing integer program: accepts the
+    package bids with the highest total such that every offer is sold at most once and every bidder
+    wins at most one package (XOR bids, a package bid is the value of exactly that set of offers).
+
+    Args:
+        packages (list): Package bids (bidder, offer_ids, bid). Bids of different bidders are
+            independent (OR), use one bidder per bid for independent bids of the same carrier.
+        reserves (dict): Offer id -> minimum price, a package has to bid more than the sum of the
+            minimum prices of its offers.
+        time_limit_s (float): Time budget of CP-SAT.
+        workers (int): CP-SAT search workers.
+
+    Returns:
+        dict: 'winners' (the accepted package bids), 'revenue' (sum of their bids) and 'status'
+            ('OPTIMAL', 'FEASIBLE', 'GREEDY' or 'NO_BIDS').
+    '''
+    valid = []
+    for bidder, offer_ids, bid in packages:
+        offer_ids = tuple(dict.fromkeys(offer_ids))
+        if offer_ids and bid > sum(reserves.get(offer_id, 0) for offer_id in offer_ids):
+            valid.append((bidder, offer_ids, bid))
+    if not valid:
+        return {'winners': [], 'revenue': 0, 'status': 'NO_BIDS'}
+
+    model = cp_model.CpModel()
+    accepted = [model.NewBoolVar(f"package_{i}") for i in range(len(valid))]
+    by_offer, by_bidder = {}, {}
+    for package, (bidder, offer_ids, _) in zip(accepted, valid):
+        by_bidder.setdefault(bidder, []).append(package)
+        for offer_id in offer_ids:
+            by_offer.setdefault(offer_id, []).append(package)
+    for packages_of in (*by_offer.values(), *by_bidder.values()):
+        if len(packages_of) > 1:
+            model.AddAtMostOne(packages_of)
+    model.Maximize(sum(int(round(bid * PRICE_SCALE)) * package for package, (_, _, bid) in zip(accepted, valid)))
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit_s
+    solver.parameters.num_workers = workers
+    status = solver.Solve(model)
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        winners = [package for package, variable in zip(valid, accepted) if solver.Value(variable)]
+        status = 'OPTIMAL' if status == cp_model.OPTIMAL else 'FEASIBLE'
+    else:
+        winners = greedy_allocation(valid)
+        status = 'GREEDY'
+    return {'winners': winners, 'revenue': sum(bid for _, _, bid in winners), 'status': status}
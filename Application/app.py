@@ -11,6 +11,8 @@ from handle_files import get_cost_list, get_revenue_list, get_profit_list
 
 # from utilities import generate_requests
 from auctioneer_server import AuctioneerServer
+from async_server import AsyncAuctioneerServer
+from auctioneer import server_mode
 from carrier import Carrier
 from handle_files import handle_file
 
@@ -45,7 +47,12 @@ def simulation():
 
 @app.route('/init_auctioneer')
 def init_auctioneer():
-    auctioneer_server = AuctioneerServer(socketio)
+    if server_mode == 'asyncio':
+        auctioneer_server = AsyncAuctioneerServer(socketio)
+    elif server_mode == 'threaded':
+        auctioneer_server = AuctioneerServer(socketio)
+    else:
+        raise ValueError(f"Unknown server mode '{server_mode}', use 'threaded' or 'asyncio'")
     auctioneer_server.start_server()
 
 @app.route('/init_carrier', methods=['POST'])
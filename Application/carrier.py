@@ -1,7 +1,8 @@
 import socket
 import json 
 import time
-from routing import Routing
+import itertools
+from routing import Routing, config
 import utilities as utils
 from requests_handler import RequestHandler
 
@@ -9,6 +10,24 @@ import numpy as np
 from tabulate import tabulate
 import pandas as pd
 
+PACKAGE_CANDIDATES = 3 # offers with the best single bids, every combination of them is a package bid (combinatorial round)
+# one connection to the auctioneer for the auction day instead of one per request, see RequestHandler
+session_mode = config['constants'].get('session_mode', True)
+MAX_FAILED_ROUNDS = 3 # consecutive rounds without a confirmation before the carrier leaves the auction
+
+
+def reply_status(response):
+    '''Status of a reply of the auctioneer.
+
+    Args:
+        response (dict): Reply of RequestHandler, {"error": ...} if the request failed.
+
+    Returns:
+        str: The status of the payload, None for a failed request.
+    '''
+    return response.get("payload", {}).get("status")
+
+
 class Carrier:
 
     def __init__(self, carrier_id, socketio, dt_data, depot, cost_model, server_host=socket.gethostname(), server_port=12350):
@@ -19,7 +38,7 @@ class Carrier:
         self.routing = Routing(carrier_id, socketio, dt_data, depot, cost_model)
         print("\nTransport requests:") # FIXME
         self.print_offer_list()  # FIXME
-        self.request_handler = RequestHandler(carrier_id, socketio, server_host, server_port)
+        self.request_handler = RequestHandler(carrier_id, socketio, server_host, server_port, session=session_mode)
 
 
     def _wait_until(self, timeout):
@@ -30,14 +49,35 @@ class Carrier:
         offer_id = offer['offer_id']
         revenue = float(offer['revenue'])
         # offer['loc_pickup'] = [{'pos_x': ..., 'pos_y': ...}, {'pos_x': ..., 'pos_y': ...}]
-        loc_pickup = []
-        loc_dropoff = []
-        for i in range(len(offer['loc_pickup'])):
-            loc_pickup.append(tuple(utils.dict_to_float(offer['loc_pickup'][i]).values()))
-            loc_dropoff.append(tuple(utils.dict_to_float(offer['loc_dropoff'][i]).values()))
+        loc_pickup = utils.positions_to_array(offer['loc_pickup'])
+        loc_dropoff = utils.positions_to_array(offer['loc_dropoff'])
         bid = self.routing.calculate_bid(loc_pickup, loc_dropoff, revenue)
         return offer_id, bid
 
+    def calculate_package_bids(self, offers):
+        '''Bids of a combinatorial round: every combination of the PACKAGE_CANDIDATES offers with the best
+        single bids is a package (the auctioneer accepts one of them at most), the other offers get single bids.
+
+        Returns:
+            tuple: Package bids [{"offer_ids": [...], "bid": ...}] and single bids {offer_id: bid}, positive bids only.
+        '''
+        singles = dict(self.calculate_bid(offer) for offer in offers)
+        ranked = sorted((offer for offer in offers if singles[offer['offer_id']] > 0), key=lambda offer: singles[offer['offer_id']], reverse=True)
+        candidates = ranked[:PACKAGE_CANDIDATES]
+        packages = [{"offer_ids": [offer['offer_id']], "bid": singles[offer['offer_id']]} for offer in candidates]
+        for size in range(2, len(candidates)+1):
+            for package in itertools.combinations(candidates, size):
+                _, bid = self.calculate_bid({
+                    "offer_id": None,
+                    "loc_pickup": [location for offer in package for location in offer['loc_pickup']],
+                    "loc_dropoff": [location for offer in package for location in offer['loc_dropoff']],
+                    "revenue": sum(float(offer['revenue']) for offer in package)
+                    })
+                if bid > 0:
+                    packages.append({"offer_ids": [offer['offer_id'] for offer in package], "bid": bid})
+        bids = {offer['offer_id']: singles[offer['offer_id']] for offer in ranked[PACKAGE_CANDIDATES:]}
+        return packages, bids
+
     def update_offer_list(self, offer):
         if (offer['offeror']==self.carrier_id and offer['winner']!="NONE") or offer['winner']==self.carrier_id :
             self.routing.update_offer_list(offer)
@@ -69,52 +109,67 @@ class Carrier:
         auction_time = response["timeout"]
         self._wait_until(auction_time+1)  # Wait to auction time
 
+        failed_rounds = 0
         while True:
+            # no sleeping until the phase deadlines, the auctioneer holds early requests until their phase opens
             # perform request offer
             response = self.request_handler.request_offer() # Request current offers
             
             print("\n Auctioneer response to request_offers:")
-            if response["payload"]["status"]!="OK":
-                print(json.dumps(response, indent=2, default=str))
-                self.socketio.emit(self.carrier_id, response) 
-            else:
-                print(json.dumps(response["payload"], indent=2, default=str)) 
-                self.socketio.emit(self.carrier_id, response) 
-            offer = response["payload"]["offer"]
-            offer_id, bid = self.calculate_bid(offer)
-            
-            auction_time = response["timeout"]
-            self._wait_until(auction_time+1)  # Wait to auction time
-            # perform bidding
-            response = self.request_handler.send_bid(offer_id, bid)  # Send a bid
-            print("\n Auctioneer response to bid:")
-            if response["payload"]["status"]!="OK":
+            if reply_status(response) != "OK":
                 print(json.dumps(response, indent=2, default=str))
                 self.socketio.emit(self.carrier_id, response) 
             else:
                 print(json.dumps(response["payload"], indent=2, default=str)) 
                 self.socketio.emit(self.carrier_id, response) 
-            auction_time = response["timeout"]
-            self._wait_until(auction_time+1)  # Wait to auction time
+            # no item for this carrier (it missed the phase, nothing is on auction) or no reply: no bids in
+            # this round, the carrier still takes part in its results and confirmation
+            if reply_status(response) == "OK":
+                # several items in a simultaneous round, each bid is calculated against the current tour
+                offers = response["payload"]["offers"]
+
+                # perform bidding
+                if response["payload"].get("package_bids"):
+                    response = self.request_handler.send_packages(*self.calculate_package_bids(offers))  # Send package bids
+                else:
+                    bids = dict(self.calculate_bid(offer) for offer in offers)
+                    if len(bids) == 1:
+                        response = self.request_handler.send_bid(*next(iter(bids.items())))  # Send a bid
+                    else:
+                        response = self.request_handler.send_bids(bids)  # Send one bid per item
+                print("\n Auctioneer response to bid:")
+                if reply_status(response) != "OK":
+                    print(json.dumps(response, indent=2, default=str))
+                    self.socketio.emit(self.carrier_id, response) 
+                else:
+                    print(json.dumps(response["payload"], indent=2, default=str)) 
+                    self.socketio.emit(self.carrier_id, response)
 
             # perform request auction results: Receives list of single offers; bundles no longer needed
             response = self.request_handler.request_auction_results()  # Request auction results
             
             print("\n Auctioneer response to request_results:")
-            if response["payload"]["status"]!="OK":
+            if reply_status(response) != "OK":
                 print(json.dumps(response, indent=2, default=str))
                 self.socketio.emit(self.carrier_id, response) 
             else:
                 print(json.dumps(response["payload"], indent=2, default=str)) 
                 self.socketio.emit(self.carrier_id, response) 
 
-            auction_time = response["timeout"]
-            self._wait_until(auction_time+1)  # Wait to auction time
 
             response = self.request_handler.confirm_results()
             print("\n Auctioneer response to confirm_results:")
-            print(json.dumps(response["payload"], indent=2, default=str))
+            print(json.dumps(response.get("payload", response), indent=2, default=str))
             self.socketio.emit(self.carrier_id, response) 
+            if reply_status(response) != "OK":
+                # e.g. CONFIRMATION_TIMEOUT or a connection error, the carrier goes on with the next round
+                failed_rounds += 1
+                if failed_rounds >= MAX_FAILED_ROUNDS:
+                    print(f"\nNo confirmation in {failed_rounds} rounds, leaving the auction")
+                    self.request_handler.close_session()
+                    exit()
+                continue
+            failed_rounds = 0
             # payload: [offer1, offer2, ...]
             received_offers = response["payload"]["offers"]
             for received_offer in received_offers:
@@ -124,6 +179,7 @@ class Carrier:
                 self.routing.update_statistics()
                 self.print_offer_list()
                 print("\nAuction day over")
+                self.request_handler.close_session()
                 ######################################################### Do the plot and data send  FIXME
                 offers_list = [offer.to_dict() for offer in self.routing.offers]
                 offers_json = json.dumps(offers_list)
@@ -131,8 +187,6 @@ class Carrier:
                 #########################################################
                 exit()
 
-            auction_time = response["timeout"]
-            self._wait_until(auction_time+1)
 
 
     def print_offer_list(self):
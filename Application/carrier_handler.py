@@ -2,12 +2,28 @@ import socket
 import threading
 import json
 import time
-import re
 import utilities as utils
+from phase_scheduler import wall_clock
+from state_actor import command
+from concurrent.futures import Future
 import traceback #tmp
 
 
-BASE_TIMEOUT = 10
+BASE_TIMEOUT = 10 # registration ends 2*BASE_TIMEOUT after the first offer
+PHASE_GRACE = 2 # seconds an early request waits beyond the deadline of the phase before its own
+
+
+def parse_bids(payload):
+    '''Reads a bid request: a single bid {"offer_id", "bid"}, one bid per item of a simultaneous round
+    {"bids": {offer_id: bid}} and/or package bids of a combinatorial round {"packages": [{"offer_ids": [...], "bid": ...}]}.
+
+    Returns:
+        tuple: (bids {offer_id: bid}, packages, ID of the first offer bid on, it names the item)
+    '''
+    packages = payload.get('packages') or []
+    bids = payload.get('bids') or ({} if packages else {payload.get('offer_id'): payload.get('bid')})
+    first_id = next(iter(bids), None) or next((offer_id for package in packages for offer_id in package['offer_ids']), None)
+    return bids, packages, first_id
 
 
 class CarrierHandler(threading.Thread):
@@ -15,32 +31,18 @@ class CarrierHandler(threading.Thread):
     def __init__(self, auctioneer, carrier_socket, socketio):
         super().__init__()
         self.auctioneer = auctioneer
+        self.actor = auctioneer.actor # methods that touch the auctioneer state run as its commands (@command)
         self.carrier_socket = carrier_socket
+        self.item = None # item on auction the request was answered for
         self.socketio = socketio
 
     def run(self):
         try:
-            message = self.carrier_socket.recv(1024).decode('utf-8')
-            if message:
-                data = json.loads(message)
-                action = data['action']
-                if action == 'register':
-                    self.register_carrier(data)
-                elif action == 'offer':
-                    if self.auctioneer.auction_time is None and data['carrier_id'] in self.auctioneer.registered_carriers:
-                        self.auctioneer.auction_time = int(time.time()) + 2*BASE_TIMEOUT
-                    self.receive_offer(data)
-                elif action == 'request_offer':
-                        self.send_offer(data)
-                elif action == 'bid':
-                    self.receive_bid(data)
-                elif action == 'request_auction_results':
-                    self.send_results(data)
-                elif action == 'confirm':
-                    self.confirm(data)
-                else:
-                    self.carrier_socket.close()
-                    print("Invalid action from carrier. Connection closed.")
+            data, buffer = utils.receive_json(self.carrier_socket)
+            # a session: the carrier sends its requests of the day over this connection, one line each
+            session = data is not None and 'request_id' in data
+            while data and self.handle_request(data) and session:
+                data, buffer = utils.receive_json(self.carrier_socket, buffer)
         except Exception as e:
             print(f"\nError occurred during handling connection with carrier. \nError: {e}\n")
             print(traceback.format_exc()) #tmp
@@ -48,33 +50,116 @@ class CarrierHandler(threading.Thread):
 
 
 
+    def handle_request(self, data):
+        """
+        Answers one request, returns False for an invalid action.
+        """
+        self.item = None
+        action = data['action']
+        if action == 'register':
+            self.register_carrier(data)
+        elif action == 'offer':
+            self.receive_offer(data)
+        elif action == 'request_offer':
+            self.send_offer(data)
+        elif action == 'bid':
+            self.receive_bid(data)
+        elif action == 'request_auction_results':
+            self.send_results(data)
+        elif action == 'confirm':
+            self.confirm(data)
+        else:
+            print("Invalid action from carrier. Connection closed.")
+            return False
+        return True
+
     def send_response(action):
         """
         Decorator to construct and send a JSON response to the carrier.
         """
         def func_decorator(func):
             def decorator(self, data):
-                response = {
-                    "carrier_id": data['carrier_id'],
-                    "action": action,
-                    "time": data['time'],
-                    "timeout": self.auctioneer.auction_time if self.auctioneer.auction_time else "NONE",
-                    "payload": func(self, data)
-                }
+                # the handler may wait for its phase, the timeout is the deadline of the phase it answered in
+                reply, new = self.session_reply(data)
+                if new:
+                    try:
+                        payload = func(self, data)
+                        response = self.response(action, data, payload)
+                    except BaseException as e:
+                        if reply is not None:
+                            reply.set_exception(e)
+                        raise
+                    if reply is not None:
+                        reply.set_result(response)
+                else:
+                    # resent after a reconnect, the first attempt may still be running
+                    response = reply.result()
                 # self.socketio.emit(data['carrier_id'], response) # All responses to carriers
-                self.carrier_socket.send(json.dumps(response).encode('utf-8'))
-                self.carrier_socket.close()
+                # one line per response, a session reads them with readline()
+                self.carrier_socket.sendall((json.dumps(response) + "\n").encode('utf-8'))
             return decorator
         return func_decorator
 
     
 
+    def response(self, action, data, payload):
+        """
+        The response to a request, the timeout is the deadline of the phase the handler answered in.
+        """
+        timeout = wall_clock(self.item.scheduler.deadline) if self.item is not None else self.auctioneer.auction_time
+        response = {
+            "carrier_id": data['carrier_id'],
+            "action": action,
+            "time": data['time'],
+            "timeout": timeout if timeout else "NONE",
+            "payload": payload
+        }
+        if 'request_id' in data:
+            # a carrier in a session matches the response to its request
+            response['request_id'] = data['request_id']
+        return response
+
+    @command
+    def session_reply(self, data):
+        '''Records a request of a session as in flight before it runs, so a resent copy (after a reconnect)
+        is not executed again but waits for the response of the first attempt.
+
+        Returns:
+            tuple: (concurrent.futures.Future of the response, None outside a session,
+                    True if the caller has to answer the request and set the Future, False for a resent request)
+        '''
+        if 'request_id' not in data:
+            return None, True
+        last = self.auctioneer.session_replies.get(data['carrier_id'])
+        if last is not None and last[0] == data['request_id']:
+            return last[1], False
+        reply = Future()
+        self.auctioneer.session_replies[data['carrier_id']] = (data['request_id'], reply)
+        return reply, True
+
+    def wait_for_item(self, phase, carrier_id, item_id=None):
+        """
+        Finds the item on auction the request is for (self.item), waits while it is in an earlier phase,
+        returns its current phase.
+        """
+        self.item, current_phase = self.auctioneer.pipeline.wait_for_item(phase, carrier_id, PHASE_GRACE, item_id)
+        return current_phase
+
+
+    @command
+    def is_registered(self, carrier_id):
+        return carrier_id in self.auctioneer.registered_carriers
+
+
     @send_response("register")
     def register_carrier(self, data):
         """
         Register a carrier.
         """
-        carrier_id = data['carrier_id']
+        return self.registration(data['carrier_id'])
+
+    @command
+    def registration(self, carrier_id):
         if self.auctioneer.phase != "REGIST":
             return {"status": "NO_REGISTRATION_PHASE"}
         if carrier_id in self.auctioneer.registered_carriers:
@@ -89,14 +174,19 @@ class CarrierHandler(threading.Thread):
         """
         Receive an offer from a carrier.
         """
-        carrier_id = data['carrier_id']
+        return self.offer_submission(data['carrier_id'], data['payload'])
+
+    @command
+    def offer_submission(self, carrier_id, offer):
+        if carrier_id in self.auctioneer.registered_carriers:
+            self.auctioneer.start_countdown(2*BASE_TIMEOUT)
         if self.auctioneer.phase != "REGIST":
             return {"response": "OFFER_SUBMISSION_TIMEOUT"}
         if carrier_id not in self.auctioneer.registered_carriers:
             return {"response": "NOT_REGISTERED"}
-        self.auctioneer.add_offer(carrier_id, data['payload'])
+        self.auctioneer.add_offer(carrier_id, offer)
         payload = {
-            "offer_id": data['payload']['offer_id'],
+            "offer_id": offer['offer_id'],
             "response": "OK"
         }
         return payload
@@ -109,34 +199,36 @@ class CarrierHandler(threading.Thread):
         Send the current offer on auction.
         """
         carrier_id = data['carrier_id']
-        if self.auctioneer.phase != "REQ_OFFER":
+        if self.wait_for_item("REQ_OFFER", carrier_id) != "REQ_OFFER":
             return {"status": "OFFER_REQUEST_TIMEOUT"}
-        elif carrier_id not in self.auctioneer.registered_carriers:
+        return self.offer_payload(carrier_id)
+
+    @command
+    def offer_payload(self, carrier_id):
+        if carrier_id not in self.auctioneer.registered_carriers:
             return {"status": "NOT_REGISTERED"}
         elif not self.auctioneer.offers:
             return {"status": "NO_OFFERS_AVAILABLE"}
-        loc_pickup = []
-        loc_dropoff = []
-        revenue = 0 
-        '''
-        for offer in self.auctioneer.offers:
-        '''
-        for i in self.auctioneer.indices_on_auction:
-            offer = self.auctioneer.offers[i]
-            if offer.on_auction:
-                loc_pickup.append(offer.loc_pickup) #{'pos_x':.., 'pos_y': ...}
-                loc_dropoff.append(offer.loc_dropoff)
-                revenue += offer.revenue
+        # one entry per item on auction (several in a simultaneous round), "offer" is the first one
+        offers = []
+        for offer_id, indices in self.item.lots.items():
+            lot = [self.auctioneer.offers[i] for i in indices if self.auctioneer.offers[i].on_auction]
+            if lot:
+                offers.append({
+                    "offer_id": offer_id, # boundle id for bundle
+                    "loc_pickup": [offer.loc_pickup for offer in lot], #{'pos_x':.., 'pos_y': ...}
+                    "loc_dropoff": [offer.loc_dropoff for offer in lot],
+                    "revenue": sum(offer.revenue for offer in lot)
+                    })
+        self.item.act(carrier_id, "REQ_OFFER")
+        if not offers:
+            return {"status": "NO_ACTIVE_OFFERS"} 
         payload = {
             "status": "OK",
-            "offer": {
-                "offer_id": self.auctioneer.id_on_auction, # boundle id for bundle
-                "loc_pickup": loc_pickup,
-                "loc_dropoff": loc_dropoff,
-                "revenue": revenue
-                }}
-        if not loc_pickup:
-            return {"status": "NO_ACTIVE_OFFERS"} 
+            "offer": offers[0],
+            "offers": offers,
+            "package_bids": self.item.package_bids
+            }
         return payload
 
         
@@ -146,46 +238,56 @@ class CarrierHandler(threading.Thread):
         """
         Receive a bid from a carrier.
         """
-        error = 1
-
         carrier_id = data['carrier_id']
-        if self.auctioneer.phase != "BID":
-            print("Bidding timeout, current phase: ", self.auctioneer.phase)
+        bids, packages, first_id = parse_bids(data['payload'])
+        phase = self.wait_for_item("BID", carrier_id, first_id)
+        if phase != "BID":
+            print("Bidding timeout, current phase: ", phase)
             return {"status": "BIDDING_TIMEOUT"}
+        return self.accept_bids(carrier_id, bids, packages)
+
+    @command
+    def accept_bids(self, carrier_id, bids, packages):
         if carrier_id not in self.auctioneer.registered_carriers:
             return {"status": "NOT_REGISTERED"}
         
-        offer_id = data['payload']['offer_id']
-        bid = data['payload']['bid']
-        #for offer in self.auctioneer.offers:
-        for i in self.auctioneer.indices_on_auction:
-            offer = self.auctioneer.offers[i]
-            #check if it is bundle
-            if re.match("bundle_.*", offer_id): # Case: Bundle
-                # Get bundle_key to access the offers in bundles
-                first_offer_in_bundle = offer_id.replace("bundle_", "")
-                bundle_key = utils.get_key_from_bundle_by_first_element(self.auctioneer.bundles, first_offer_in_bundle)
-                # Check if offer is in Bundle
-                if offer.offer_id in self.auctioneer.bundles[bundle_key]:
-                    # obtain bid and distribute it to all single offers; here one case
-                    bid_share = self.auctioneer.calculate_share(offer.offer_id, bid)
+        accepted = []
+        for offer_id, bid in bids.items():
+            indices = self.item.lots.get(offer_id)
+            if not indices or bid is None:
+                continue
+            shares = self.item.shares.get(offer_id)
+            for n, i in enumerate(indices):
+                offer = self.auctioneer.offers[i]
+                if not offer.on_auction:
+                    continue
+                #check if it is bundle
+                if shares is not None: # Case: Bundle
+                    # distribute the bid to all single offers of the bundle by their revenue shares
+                    bid_share = shares[n] * bid
                     offer.add_bid(carrier_id, bid_share)
                     self.socketio.emit('auctioneer', {"message": f"{carrier_id} bid a share of {round(bid_share, 2)}€ on the bundle.",
                                                     "payload": {"carrierId": carrier_id, "bid": bid_share, "offerId": offer_id},
                                                     "action": "addBundleBid"})
-                    error = 0
-            else: # Case: No Bundle (Single Offer)
-                if offer.offer_id == offer_id and offer.on_auction:
+                else: # Case: No Bundle (Single Offer)
                     offer.add_bid(carrier_id, bid)
                     self.socketio.emit('auctioneer', {"message": f"{carrier_id} bid {round(bid, 2)}€ on the offer.",
                                                     "payload": {"carrierId": carrier_id, "bid": bid, "offerId": offer_id},
                                                     "action": "addBid"})
-                    error = 0
+            accepted.append(offer_id)
+        if self.item.package_bids:
+            # one package per carrier is accepted at most, see Auctioneer.determine_winners()
+            valid_packages = [(carrier_id, tuple(package['offer_ids']), package['bid']) for package in packages
+                              if package['offer_ids'] and all(offer_id in self.item.lots for offer_id in package['offer_ids'])]
+            self.item.set_packages(carrier_id, valid_packages)
+            accepted += ["+".join(map(str, offer_ids)) for _, offer_ids, _ in valid_packages]
+        self.item.act(carrier_id, "BID")
         # Send response here
-        if not error:
+        if accepted:
             payload = {
                 "status": "OK",
-                "offer_id": offer_id
+                "offer_id": accepted[0],
+                "offer_ids": accepted
                 }
             return payload
         return {"status": "INVALID_BID"}
@@ -197,19 +299,23 @@ class CarrierHandler(threading.Thread):
         Send the auction results to a carrier.
         """
         carrier_id = data['carrier_id']
-        if carrier_id not in self.auctioneer.registered_carriers:
+        if not self.is_registered(carrier_id):
             return {"status": "NOT_REGISTERED"}
-        if self.auctioneer.phase != "RESULTS":
+        if self.wait_for_item("RESULTS", carrier_id) != "RESULTS":
             return {"status": "NO_RESULTS_PHASE"}
-        
+        return self.results_payload(carrier_id)
+
+    @command
+    def results_payload(self, carrier_id):
         self.auctioneer.active_carriers.append(carrier_id)
         results_available = 0
         offers_on_auction = []
 
-        for i in self.auctioneer.indices_on_auction:
+        for i in self.item.indices:
                 offers_on_auction.append(self.auctioneer.offers[i])
                 results_available = True
 
+        self.item.act(carrier_id, "RESULTS")
         if results_available:
             # send results
             payload = {
@@ -227,24 +333,30 @@ class CarrierHandler(threading.Thread):
         Confirm results and next round.
         """
         carrier_id = data['carrier_id']
-        if self.auctioneer.phase != "CONFIRM":
+        if self.wait_for_item("CONFIRM", carrier_id) != "CONFIRM":
             return {"status": "CONFIRMATION_TIMEOUT"}
+        return self.confirm_payload(carrier_id)
+
+    @command
+    def confirm_payload(self, carrier_id):
         if carrier_id not in self.auctioneer.registered_carriers:
             return {"status": "NOT_REGISTERED"}
         
         results_available = 0
         offers_on_auction = []
-        for i in self.auctioneer.indices_on_auction:
+        for i in self.item.indices:
                 offers_on_auction.append(self.auctioneer.offers[i])
                 results_available = 1
 
+        # the offers are built before acting, the last confirmation lets the auctioneer move on
+        payload = {
+            "status": "OK",
+            "offers": [ob.to_dict() for ob in offers_on_auction],
+            "next_round": self.auctioneer.next_round
+        }
+        self.item.act(carrier_id, "CONFIRM")
         if results_available:
             # send results
-            payload = {
-                "status": "OK",
-                "offers": [ob.to_dict() for ob in offers_on_auction],
-                "next_round": self.auctioneer.next_round
-            }
             return payload
         
         return {"status": "NO_CONFIRMATION_AVAILABLE"}
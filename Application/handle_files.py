@@ -1,9 +1,13 @@
 import pandas as pd
 import utilities as utils
-from tour_calculation import create_tour_data, get_optimal_tour
+from tour_calculation import create_tour_data, get_optimal_tour, get_removal_distances, MARGINAL_COST_MODE, SOLVER_WORKERS
 from create_plot import create_plot
+from solver_executor import shared_executor
 # from utilities import get_cost_list, get_revenue_list, get_optimal_tour, get_profit_list, create_plot
 
+# shared with the carriers and the requests of the web app, the worker processes are started once
+SOLVER_EXECUTOR = shared_executor(SOLVER_WORKERS)
+
 def handle_file(uploaded_file):
     if 'file' not in uploaded_file:
         print("No file part") 
@@ -109,13 +113,19 @@ def get_revenue_list(locations, deliveries, base_price, kilometer_price):
         multiplier = multiplier + 1
     return revenues
 
-def get_cost_list(locations, deliveries, loading_cost, kilometer_cost):
+def get_cost_list(locations, deliveries, loading_cost, kilometer_cost, mode=MARGINAL_COST_MODE):
     # Cost für request = Laderate + Kilometerkosten * Auftrags distanz
     costs = []
     multiplier = 0
     original_data = create_tour_data(locations, deliveries)
     original_tour = get_optimal_tour(original_data)
     original_distance = original_tour['distance']
+    if mode == 'removal':
+        # splice every request out of the original tour instead of solving without it
+        for request_distance in get_removal_distances(original_data, original_tour):
+            costs.append(round(loading_cost + kilometer_cost * (request_distance / 1000), 2))
+        return costs
+    tours_data = []
     for i in range(0, len(deliveries)):
         locations_without_request = locations[:]
         del locations_without_request[i + 1 + multiplier]
@@ -124,14 +134,16 @@ def get_cost_list(locations, deliveries, loading_cost, kilometer_cost):
         deliveries_without_request = deliveries[:]
         del deliveries_without_request[-1]
 
-        data = create_tour_data(locations_without_request, deliveries_without_request)
-        tour_calculation_without_request = get_optimal_tour(data)
+        tours_data.append(create_tour_data(locations_without_request, deliveries_without_request))
+        multiplier = multiplier + 1
+
+    # the tours without each request are independent, solve them on the process pool
+    for tour_calculation_without_request in SOLVER_EXECUTOR.map(get_optimal_tour, tours_data):
         distance_without_request = tour_calculation_without_request['distance']
         
         request_distance = original_distance - distance_without_request
         cost = round(loading_cost + kilometer_cost * (request_distance / 1000), 2)
         costs.append(cost) 
-        multiplier = multiplier + 1
     return costs
 
 def get_profit_list(individual_revenues, individual_real_cost):
@@ -0,0 +1,284 @@
+import time
+import numpy as np
+
+
+def route_length(dist_mat, route):
+    '''Length of a tour.
+
+    Args:
+        dist_mat (np.ndarray): Distance matrix.
+        route (list of int): Tour as node indices, first and last node is the depot.
+
+    Returns:
+        int: Sum of the distances along the tour.
+    '''
+    route = np.asarray(route, dtype=np.intp)
+    return int(np.asarray(dist_mat)[route[:-1], route[1:]].sum())
+
+
+def cheapest_insertion(dist_mat, route, pickup, dropoff):
+    '''Inserts a transport request into a tour at the cheapest positions with the pickup before the dropoff.
+
+    Args:
+        dist_mat (np.ndarray): Distance matrix.
+        route (list of int): Tour as node indices, first and last node is the depot.
+        pickup (int): Node index of the pickup location.
+        dropoff (int): Node index of the dropoff location.
+
+    Returns:
+        list of int: The new tour.
+        int: The added distance.
+    '''
+    route = np.asarray(route, dtype=np.intp)
+    prev, succ = route[:-1], route[1:]
+    edge = dist_mat[prev, succ]
+    # added distance of inserting the pickup (dropoff) on edge i
+    delta_pickup = dist_mat[prev, pickup] + dist_mat[pickup, succ] - edge
+    delta_dropoff = dist_mat[prev, dropoff] + dist_mat[dropoff, succ] - edge
+    # both on the same edge: prev -> pickup -> dropoff -> succ
+    delta_same = dist_mat[prev, pickup] + dist_mat[pickup, dropoff] + dist_mat[dropoff, succ] - edge
+    best_i = int(np.argmin(delta_same))
+    best_j = best_i
+    best_delta = delta_same[best_i]
+    if len(edge) > 1:
+        # pickup on edge i, dropoff on a later edge j: cheapest pickup edge before j is a prefix minimum
+        best_pickup = np.minimum.accumulate(delta_pickup)[:-1]
+        delta_split = best_pickup + delta_dropoff[1:]
+        j = int(np.argmin(delta_split))
+        if delta_split[j] < best_delta:
+            best_delta = delta_split[j]
+            best_j = j + 1
+            best_i = int(np.argmin(delta_pickup[:best_j]))
+    route = route.tolist()
+    route.insert(best_j + 1, dropoff)
+    route.insert(best_i + 1, pickup)
+    return route, int(best_delta)
+
+
+def _relocate_segment(dist_mat, route, lo, hi, partner, pickups):
+    # first improvement relocate moves of the nodes at positions [lo, hi) to positions in [lo, hi),
+    # a pickup stays before its dropoff
+    improvement = 0
+    lo, hi = max(lo, 1), min(hi, len(route)-1)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(lo, hi):
+            node = route[i]
+            gain = dist_mat[route[i-1], node] + dist_mat[node, route[i+1]] - dist_mat[route[i-1], route[i+1]]
+            rest = route[:i] + route[i+1:]
+            partner_position = rest.index(partner[node]) if node in partner else None
+            for j in range(lo, min(hi, len(rest))):
+                if j == i:
+                    continue
+                if partner_position is not None and (j > partner_position if node in pickups else j <= partner_position):
+                    continue
+                cost = dist_mat[rest[j-1], node] + dist_mat[node, rest[j]] - dist_mat[rest[j-1], rest[j]]
+                if cost < gain:
+                    route = rest[:j] + [node] + rest[j:]
+                    improvement += gain - cost
+                    improved = True
+                    break
+            if improved:
+                break
+    return route, improvement
+
+
+def removal_savings(dist_mat, route, requests, window=0):
+    '''Distance saved by removing each transport request from a tour. The pickup and dropoff are spliced
+    out using the distances to their predecessors and successors, O(1) per request.
+
+    Args:
+        dist_mat (np.ndarray): Distance matrix.
+        route (list of int): Tour as node indices, first and last node is the depot.
+        requests (list of lists): [pickup, dropoff] node indices of the requests.
+        window (int): If > 0 the segment of 'window' positions around the removed nodes is
+                      re-optimized with relocate moves afterwards, O(window^2) per request.
+
+    Returns:
+        np.ndarray: Saved distance of every request.
+    '''
+    route = np.asarray(route, dtype=np.intp)
+    requests = np.asarray(requests, dtype=np.intp).reshape(-1, 2)
+    position = np.zeros(len(dist_mat), dtype=np.intp)
+    position[route[:-1]] = np.arange(len(route)-1)
+    pickup_position, dropoff_position = position[requests[:, 0]], position[requests[:, 1]]
+    pickup, dropoff = route[pickup_position], route[dropoff_position]
+    before_pickup, after_pickup = route[pickup_position-1], route[pickup_position+1]
+    before_dropoff, after_dropoff = route[dropoff_position-1], route[dropoff_position+1]
+    # dropoff directly after the pickup: before_pickup -> pickup -> dropoff -> after_dropoff
+    savings_adjacent = dist_mat[before_pickup, pickup] + dist_mat[pickup, dropoff] + dist_mat[dropoff, after_dropoff] \
+                       - dist_mat[before_pickup, after_dropoff]
+    savings_split = dist_mat[before_pickup, pickup] + dist_mat[pickup, after_pickup] - dist_mat[before_pickup, after_pickup] \
+                    + dist_mat[before_dropoff, dropoff] + dist_mat[dropoff, after_dropoff] - dist_mat[before_dropoff, after_dropoff]
+    savings = np.where(dropoff_position == pickup_position+1, savings_adjacent, savings_split)
+    if window > 0:
+        partner = {}
+        for p, d in requests.tolist():
+            partner[p], partner[d] = d, p
+        pickups = set(requests[:, 0].tolist())
+        for k, (p, d) in enumerate(requests.tolist()):
+            reduced = [node for node in route.tolist() if node != p and node != d]
+            lo, hi = pickup_position[k] - window, dropoff_position[k] - 1 + window
+            _, improvement = _relocate_segment(dist_mat, reduced, lo, hi, partner, pickups)
+            savings[k] += improvement
+    return savings
+
+
+def _partner_positions(route, partner):
+    # position of every node of the route and of its partner (pickup <-> dropoff), -1 for the depot
+    position = np.zeros(len(partner), dtype=np.intp)
+    position[route[:-1]] = np.arange(len(route)-1)
+    partner_position = np.where(partner[route] >= 0, position[np.maximum(partner[route], 0)], -1)
+    return partner_position
+
+
+def two_opt_move(dist_mat, route, partner, is_pickup):
+    '''Best 2-opt move (reversal of route[s:e+1]) that keeps every pickup before its dropoff,
+    i.e. the reversed segment must not contain both nodes of a request.
+
+    Returns:
+        int: Change of the tour length (>= 0 if there is no improving move).
+        list of int: The new tour.
+    '''
+    m = len(route)
+    if m < 4:
+        return 0, route
+    partner_position = _partner_positions(route, partner)
+    positions = np.arange(m)
+    # first dropoff position of the requests picked up at or after position s (suffix minimum)
+    dropoff_after = np.full(m + 1, m, dtype=np.intp)
+    pickups = is_pickup[route] & (partner_position >= 0)
+    dropoff_after[positions[pickups]] = partner_position[pickups]
+    dropoff_after = np.minimum.accumulate(dropoff_after[::-1])[::-1]
+    forward = dist_mat[route[:-1], route[1:]]
+    # change of the inner path when it is traversed backwards (0 for symmetric distances)
+    inner = np.concatenate([[0], np.cumsum(dist_mat[route[1:], route[:-1]] - forward)])
+    s = positions[1:m-2, None]
+    e = positions[None, 1:m-1]
+    delta = dist_mat[route[s-1], route[e]] + dist_mat[route[s], route[e+1]] - forward[s-1] - forward[e] + inner[e] - inner[s]
+    valid = (e > s) & (e < dropoff_after[s])
+    delta = np.where(valid, delta, 0)
+    best = np.unravel_index(np.argmin(delta), delta.shape)
+    if delta[best] >= 0:
+        return 0, route
+    start, end = best[0] + 1, best[1] + 1
+    new_route = np.concatenate([route[:start], route[start:end+1][::-1], route[end+1:]])
+    return int(delta[best]), new_route
+
+
+def or_opt_move(dist_mat, route, partner, is_pickup, max_length=3):
+    '''Best Or-opt move: a segment of 1 to max_length consecutive nodes is moved to another edge
+    of the tour in the same order, pickups stay before their dropoffs.
+
+    Returns:
+        int: Change of the tour length (>= 0 if there is no improving move).
+        list of int: The new tour.
+    '''
+    m = len(route)
+    partner_position = _partner_positions(route, partner)
+    forward = dist_mat[route[:-1], route[1:]]
+    best_delta, best_move = 0, None
+    for length in range(1, max_length + 1):
+        starts = np.arange(1, m - length)
+        if not len(starts):
+            break
+        ends = starts + length - 1
+        removal = forward[starts-1] + forward[ends] - dist_mat[route[starts-1], route[ends+1]]
+        # the segment has to stay before the dropoffs of its pickups and after the pickups of its dropoffs
+        lo = np.zeros(len(starts), dtype=np.intp)
+        hi = np.full(len(starts), m, dtype=np.intp)
+        for offset in range(length):
+            node_position = starts + offset
+            other = partner_position[node_position]
+            outside = (other >= 0) & ((other < starts) | (other > ends))
+            pickup = is_pickup[route[node_position]]
+            hi = np.where(outside & pickup, np.minimum(hi, other), hi)
+            lo = np.where(outside & ~pickup, np.maximum(lo, other), lo)
+        edges = np.arange(m - 1)[None, :]
+        insertion = dist_mat[route[edges], route[starts, None]] + dist_mat[route[ends, None], route[edges+1]] - forward[edges]
+        delta = insertion - removal[:, None]
+        valid = (edges >= lo[:, None]) & (edges < hi[:, None]) \
+                & ((edges < starts[:, None] - 1) | (edges > ends[:, None]))
+        delta = np.where(valid, delta, 0)
+        best = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[best] < best_delta:
+            best_delta, best_move = int(delta[best]), (starts[best[0]], ends[best[0]], best[1])
+    if best_move is None:
+        return 0, route
+    start, end, edge = best_move
+    segment = route[start:end+1]
+    if edge < start:
+        new_route = np.concatenate([route[:edge+1], segment, route[edge+1:start], route[end+1:]])
+    else:
+        new_route = np.concatenate([route[:start], route[end+1:edge+1], segment, route[edge+1:]])
+    return best_delta, new_route
+
+
+def relocate_pair_move(dist_mat, route, requests):
+    '''Best relocation of a whole transport request: its pickup and dropoff are removed and
+    inserted again at the cheapest positions.
+
+    Returns:
+        int: Change of the tour length (>= 0 if there is no improving move).
+        list of int: The new tour.
+    '''
+    savings = removal_savings(dist_mat, route, requests)
+    best_delta, best_route = 0, route
+    # most expensive requests first, a request can not improve by more than it saves
+    for k in np.argsort(-savings):
+        if -savings[k] >= best_delta:
+            break
+        pickup, dropoff = requests[k]
+        reduced = route[(route != pickup) & (route != dropoff)]
+        new_route, added = cheapest_insertion(dist_mat, reduced, pickup, dropoff)
+        if added - savings[k] < best_delta:
+            best_delta, best_route = int(added - savings[k]), np.asarray(new_route, dtype=np.intp)
+    return best_delta, best_route
+
+
+def improve_route(dist_mat, route, requests, deadline=None, solution_limit=0, trace=None):
+    '''Local search with 2-opt, Or-opt and request relocate moves until no move improves
+    the tour (or the deadline / solution limit is reached), best improvement per move type.
+
+    Args:
+        dist_mat (np.ndarray): Distance matrix.
+        route (list of int): Tour as node indices, first and last node is the depot.
+        requests (list of lists): [pickup, dropoff] node indices of the requests.
+        deadline (float): time.monotonic() at which the search stops, None: no time limit.
+        solution_limit (int): Maximum number of improving moves, 0: no limit.
+        trace (list): If given, (ms since start, length) of every improved tour is appended.
+
+    Returns:
+        list of int: The improved tour.
+        int: The number of improving moves.
+        bool: Whether the tour is a local optimum.
+    '''
+    start = time.monotonic()
+    dist_mat = np.asarray(dist_mat)
+    route = np.asarray(route, dtype=np.intp)
+    requests = np.asarray(requests, dtype=np.intp).reshape(-1, 2)
+    partner = np.full(len(dist_mat), -1, dtype=np.intp)
+    partner[requests[:, 0]], partner[requests[:, 1]] = requests[:, 1], requests[:, 0]
+    is_pickup = np.zeros(len(dist_mat), dtype=bool)
+    is_pickup[requests[:, 0]] = True
+    moves = [
+        lambda route: two_opt_move(dist_mat, route, partner, is_pickup),
+        lambda route: or_opt_move(dist_mat, route, partner, is_pickup),
+        lambda route: relocate_pair_move(dist_mat, route, requests),
+    ]
+    length = route_length(dist_mat, route)
+    improvements = 0
+    while True:
+        if (deadline is not None and time.monotonic() >= deadline) or (solution_limit and improvements >= solution_limit):
+            return route.tolist(), improvements, False
+        for move in moves:
+            delta, new_route = move(route)
+            if delta < 0:
+                route, length = new_route, length + delta
+                improvements += 1
+                if trace is not None:
+                    trace.append(((time.monotonic() - start) * 1000, length))
+                break
+        else:
+            return route.tolist(), improvements, True
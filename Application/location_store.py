@@ -0,0 +1,167 @@
+import numpy as np
+
+COMPACT_RATIO = 1.0 # compact once the deleted requests outnumber this fraction of the live ones
+
+
+class LocationStore:
+    """
+    Struct of arrays of the carrier's locations and transport requests. Requests are appended in O(1)
+    (amortized), deleted requests are only flagged (tombstones) and dropped by compact() once they
+    outnumber the live ones. Positions are counted over the live entries in insertion order, so
+    get_coordinates() and get_assignments() match the locations and assignments lists they replace.
+    Attributes:
+        points (np.ndarray)         : (capacity, 2) float64 coordinates of the location slots
+        location_active (np.ndarray): (capacity,) False for the locations of deleted requests
+        size (int)                  : Number of location slots in use
+        slots (np.ndarray)          : (capacity, 2) int32 pickup and dropoff location slot of every request
+        request_active (np.ndarray) : (capacity,) False for deleted requests
+        requests (int)              : Number of request slots in use
+        tombstones (int)            : Deleted requests that still occupy slots
+        dead (int)                  : Locations of deleted requests that still occupy slots
+    The returned views are shared with the store and must not be modified.
+    """
+    def __init__(self, locations=[], assignments=[]):
+        self.points = np.empty((0, 2))
+        self.location_active = np.zeros(0, dtype=bool)
+        self.size = 0
+        self.slots = np.empty((0, 2), dtype=np.int32)
+        self.request_active = np.zeros(0, dtype=bool)
+        self.requests = 0
+        self.tombstones = 0
+        self.dead = 0
+        self.append_locations(locations)
+        self.set_assignments(assignments)
+
+    def __len__(self):
+        return self.size - self.dead
+
+    def count_requests(self):
+        return self.requests - self.tombstones
+
+    def _reserve_locations(self, size):
+        if size <= len(self.points):
+            return
+        capacity = max(16, 2 * size)
+        points = np.empty((capacity, 2))
+        location_active = np.zeros(capacity, dtype=bool)
+        points[:self.size] = self.points[:self.size]
+        location_active[:self.size] = self.location_active[:self.size]
+        self.points, self.location_active = points, location_active
+
+    def _reserve_requests(self, requests):
+        if requests <= len(self.slots):
+            return
+        capacity = max(8, 2 * requests)
+        slots = np.empty((capacity, 2), dtype=np.int32)
+        request_active = np.zeros(capacity, dtype=bool)
+        slots[:self.requests] = self.slots[:self.requests]
+        request_active[:self.requests] = self.request_active[:self.requests]
+        self.slots, self.request_active = slots, request_active
+
+    def append_locations(self, locations):
+        """
+        Appends locations without a transport request (e.g. the depot), returns their slots.
+        """
+        new_points = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        start, end = self.size, self.size + len(new_points)
+        self._reserve_locations(end)
+        self.points[start:end] = new_points
+        self.location_active[start:end] = True
+        self.size = end
+        return np.arange(start, end)
+
+    def set_assignments(self, assignments):
+        """
+        Replaces the transport requests, 'assignments' are positions of the live locations.
+        """
+        positions = np.asarray(assignments, dtype=np.intp).reshape(-1, 2)
+        live = np.flatnonzero(self.location_active[:self.size])
+        self.requests = self.tombstones = 0
+        self._reserve_requests(len(positions))
+        self.slots[:len(positions)] = live[positions]
+        self.request_active[:len(positions)] = True
+        self.requests = len(positions)
+
+    def append(self, pickups, dropoffs):
+        '''Appends transport requests, their pickup and dropoff locations follow the current locations.
+
+        Args:
+            pickups (array-like): (k, 2) pickup locations (x, y).
+            dropoffs (array-like): (k, 2) dropoff locations (x, y).
+
+        Returns:
+            np.ndarray: (2k, 2) view of the new locations, pickup and dropoff interleaved.
+        '''
+        pickups = np.asarray(pickups, dtype=np.float64).reshape(-1, 2)
+        dropoffs = np.asarray(dropoffs, dtype=np.float64).reshape(-1, 2)
+        k = len(pickups)
+        start = self.size
+        self.append_locations(np.hstack([pickups, dropoffs]))
+        self._reserve_requests(self.requests + k)
+        first, last = self.requests, self.requests + k
+        self.slots[first:last] = start + np.arange(2 * k, dtype=np.int32).reshape(-1, 2)
+        self.request_active[first:last] = True
+        self.requests = last
+        return self.points[start:self.size]
+
+    def delete(self, positions):
+        '''Deletes the transport requests at the positions (of the live requests) and their locations.
+        Compacts the arrays once the tombstones outnumber the live requests.
+
+        Returns:
+            np.ndarray: Positions of the live locations before the deletion that are kept, in order.
+        '''
+        live_requests = np.flatnonzero(self.request_active[:self.requests])
+        kept = self.location_active[:self.size].copy()
+        deleted = np.unique(live_requests[np.asarray(positions, dtype=np.intp)])
+        self.request_active[deleted] = False
+        dropped = np.unique(self.slots[deleted].ravel())
+        self.dead += int(np.count_nonzero(self.location_active[dropped]))
+        self.location_active[dropped] = False
+        self.tombstones += len(deleted)
+        keep = np.flatnonzero(self.location_active[:self.size][kept])
+        if self.tombstones > COMPACT_RATIO * self.count_requests():
+            self.compact()
+        return keep
+
+    def compact(self):
+        """
+        Drops the slots of the deleted requests, the live entries keep their order (and positions).
+        """
+        location_active = self.location_active[:self.size]
+        new_slot = (np.cumsum(location_active) - 1).astype(np.int32)
+        live_requests = np.flatnonzero(self.request_active[:self.requests])
+        live = len(live_requests)
+        self.points[:len(self)] = self.points[:self.size][location_active]
+        self.slots[:live] = new_slot[self.slots[live_requests]]
+        self.size = len(self)
+        self.dead = 0
+        self.location_active[:] = False
+        self.location_active[:self.size] = True
+        self.request_active[:] = False
+        self.request_active[:live] = True
+        self.requests = live
+        self.tombstones = 0
+
+    def get_coordinates(self):
+        """
+        (n, 2) float64 coordinates of the live locations, a view into the store without tombstones.
+        """
+        if not self.dead:
+            return self.points[:self.size]
+        return self.points[:self.size][self.location_active[:self.size]]
+
+    def get_assignments(self):
+        """
+        (m, 2) pickup and dropoff positions of the live requests, a view into the store without tombstones.
+        """
+        if not self.tombstones and not self.dead:
+            return self.slots[:self.requests]
+        position = np.cumsum(self.location_active[:self.size]) - 1
+        return position[self.slots[:self.requests][self.request_active[:self.requests]]]
+
+    def get_locations(self):
+        """
+        The live locations as a list of (x, y) tuples.
+        """
+        return [tuple(location) for location in self.get_coordinates().tolist()]
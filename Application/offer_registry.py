@@ -0,0 +1,59 @@
+class OfferRegistry:
+    """
+    Offers of the auctioneer in order of submission with an index by offer ID, so bids and bundles
+    find their offers in O(1). Behaves like the list it replaces: positions, iteration, len() and slices.
+    Attributes:
+        offers (list)   : Offer objects in order
+        positions (dict): Offer ID -> position in 'offers'
+    """
+    def __init__(self, offers=()):
+        self.offers = []
+        self.positions = {}
+        self.replace(offers)
+
+    def __len__(self):
+        return len(self.offers)
+
+    def __iter__(self):
+        return iter(self.offers)
+
+    def __getitem__(self, position):
+        return self.offers[position]
+
+    def append(self, offer):
+        self.positions[offer.offer_id] = len(self.offers)
+        self.offers.append(offer)
+
+    def pop(self, position=-1):
+        offer = self.offers.pop(position)
+        self.replace(self.offers)
+        return offer
+
+    def clear(self):
+        self.replace([])
+
+    def replace(self, offers):
+        """
+        Replaces the offers (e.g. by the unsold ones after a round) and rebuilds the index.
+        """
+        self.offers = list(offers)
+        self.positions = {offer.offer_id: i for i, offer in enumerate(self.offers)}
+
+    def position(self, offer_id):
+        """
+        Position of the offer, None if it is not (or no longer) on the list.
+        """
+        return self.positions.get(offer_id)
+
+    def revenue_shares(self, positions):
+        '''Shares of the offers in the revenue of all of them, a bundle bid is split by these shares.
+
+        Args:
+            positions (list): Positions of the offers of the bundle.
+
+        Returns:
+            list: Share of every offer in the order of 'positions', sums to 1.
+        '''
+        revenues = [self.offers[i].revenue for i in positions]
+        total = sum(revenues)
+        return [revenue / total for revenue in revenues]
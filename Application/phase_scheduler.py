@@ -0,0 +1,234 @@
+import threading
+import time
+
+# phases of one item on auction in order, a carrier request that arrives during an earlier phase waits for its own
+ITEM_PHASES = ("REQ_OFFER", "BID", "RESULTS", "CONFIRM")
+
+
+def wall_clock(deadline):
+    '''Wall clock time (time.time()) of a time.monotonic() deadline, the carriers get deadlines as wall clock time.'''
+    return time.time() + (deadline - time.monotonic())
+
+
+class WatchedCondition(threading.Condition):
+    """
+    Condition variable that also calls its watchers on notify_all(), e.g. to wake waiters of an asyncio
+    event loop (see async_server.py). Watchers are called with the lock held and must not block.
+    Attributes:
+        watchers (list): Functions without arguments
+    """
+    def __init__(self):
+        super().__init__()
+        self.watchers = []
+
+    def notify_all(self):
+        super().notify_all()
+        for watcher in self.watchers:
+            watcher()
+
+
+class PhaseScheduler:
+    """
+    Auction phases driven by a condition variable. A phase ends as soon as every expected carrier
+    has acted in it, the deadline (time.monotonic(), fractions of a second are fine) only bounds it.
+    Attributes:
+        condition (threading.Condition): Guards the attributes below, notified on every change, may be shared
+        phase (str)        : Current phase
+        deadline (float)   : time.monotonic() at which the current phase ends, None: not set yet
+        expected (frozenset): Carriers the current phase waits for, empty: the phase lasts until the deadline
+        acted (set)        : Carriers that have acted in the current phase
+        closed_early, timed_out (int): Phases that ended because everyone acted / at their deadline
+    """
+    def __init__(self, phase="REGIST", condition=None):
+        self.condition = condition or WatchedCondition()
+        self.phase = phase
+        self.deadline = None
+        self.expected = frozenset()
+        self.acted = set()
+        self.closed_early = 0
+        self.timed_out = 0
+
+    def enter(self, phase, timeout, expected=()):
+        """
+        Starts the phase, it ends after 'timeout' seconds or once all 'expected' carriers have acted.
+        """
+        with self.condition:
+            self.phase = phase
+            self.deadline = time.monotonic() + timeout
+            self.expected = frozenset(expected)
+            self.acted = set()
+            self.condition.notify_all()
+
+    def set_deadline(self, timeout):
+        """
+        Sets the deadline of the current phase unless it already has one, returns the deadline.
+        """
+        with self.condition:
+            if self.deadline is None:
+                self.deadline = time.monotonic() + timeout
+                self.condition.notify_all()
+            return self.deadline
+
+    def act(self, carrier_id, phase):
+        """
+        Records that the carrier has acted in 'phase', ignored if that phase is over.
+        """
+        with self.condition:
+            if phase != self.phase:
+                return False
+            self.acted.add(carrier_id)
+            if self._complete():
+                self.condition.notify_all()
+            return True
+
+    def _complete(self):
+        return bool(self.expected) and self.expected <= self.acted
+
+    def wait(self):
+        '''Blocks until every expected carrier has acted in the current phase or its deadline has passed.
+
+        Returns:
+            bool: True if the phase was closed early.
+        '''
+        with self.condition:
+            while not self._complete():
+                if self.deadline is None:
+                    self.condition.wait()
+                    continue
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timed_out += 1
+                    return False
+                self.condition.wait(remaining)
+            self.closed_early += 1
+            return True
+
+
+class AuctionItem:
+    """
+    Offers that go through the phases together (one offer, one bundle or all items of a simultaneous
+    round). Every item has its own phase, so the next item can be offered while this one is cleared.
+    Attributes:
+        lots (dict)               : Item ID (offer ID or "bundle_<first offer ID>") -> indices of its offers
+        indices (list)            : Indices of all offers of the item
+        scheduler (PhaseScheduler): Phase of the item and its deadline
+        served (dict)             : Phase -> carriers that have been answered in it
+        sold (int)                : Number of sold offers, known after the results
+        package_bids (bool)       : Carriers may bid on packages of the offers (combinatorial round)
+        packages (list)           : Package bids (carrier_id, offer_ids, bid) of the carriers
+        shares (dict)             : Bundle ID -> revenue shares of its offers (order of lots), a bundle bid is split by them
+    """
+    def __init__(self, lots, condition=None, package_bids=False, shares=None):
+        self.lots = lots
+        self.indices = [i for indices in lots.values() for i in indices]
+        self.scheduler = PhaseScheduler(ITEM_PHASES[0], condition)
+        self.served = {phase: set() for phase in ITEM_PHASES}
+        self.sold = 0
+        self.package_bids = package_bids
+        self.packages = []
+        self.shares = shares or {}
+
+    @property
+    def phase(self):
+        return self.scheduler.phase
+
+    def set_packages(self, carrier_id, packages):
+        """
+        Replaces the package bids of the carrier.
+        """
+        with self.scheduler.condition:
+            self.packages = [package for package in self.packages if package[0] != carrier_id] + packages
+
+    def act(self, carrier_id, phase):
+        """
+        Records that the carrier has been answered in 'phase', see PhaseScheduler.act().
+        """
+        with self.scheduler.condition:
+            self.served[phase].add(carrier_id)
+            return self.scheduler.act(carrier_id, phase)
+
+
+class Pipeline:
+    """
+    Items on auction, oldest first. A carrier request is routed to the item it names (bids) or to the
+    oldest item that has not answered the carrier in the phase yet, and waits while the item is in an
+    earlier phase. All items share the condition of the day scheduler (registration).
+    Attributes:
+        scheduler (PhaseScheduler)     : Phase of the auction day (registration)
+        condition (threading.Condition): Guards the items, notified when an item is added or removed
+        items (list)                   : AuctionItems on auction
+        closed_early, timed_out (int)  : Phases of the removed items that ended early / at their deadline
+    """
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.condition = scheduler.condition
+        self.items = []
+        self.closed_early = 0
+        self.timed_out = 0
+
+    def add(self, item):
+        with self.condition:
+            if item not in self.items:
+                self.items.append(item)
+                self.condition.notify_all()
+
+    def remove(self, item):
+        with self.condition:
+            if item in self.items:
+                self.items.remove(item)
+                self.closed_early += item.scheduler.closed_early
+                self.timed_out += item.scheduler.timed_out
+                self.condition.notify_all()
+
+    def find(self, phase, carrier_id, item_id=None):
+        """
+        The item 'item_id' belongs to, else the oldest item not past 'phase' that has not answered the carrier in it.
+        """
+        with self.condition:
+            for item in self.items:
+                if item_id in item.lots:
+                    return item
+            position = ITEM_PHASES.index(phase)
+            for item in self.items:
+                if carrier_id not in item.served[phase] and ITEM_PHASES.index(item.phase) <= position:
+                    return item
+            return None
+
+    def _deadline(self):
+        deadlines = [item.scheduler.deadline for item in self.items] + [self.scheduler.deadline]
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        return max(deadlines) if deadlines else None
+
+    def wait_for_item(self, phase, carrier_id, grace, item_id=None):
+        '''Finds the item of a carrier request for 'phase' and waits while it is in an earlier phase (or, for
+        REQ_OFFER, until the next item is offered), so carriers do not have to sleep until the deadlines.
+        Gives up 'grace' seconds after the latest deadline of the day and the items.
+
+        Returns:
+            tuple: (AuctionItem, its current phase), (None, None) if there is no item for the request.
+        '''
+        start = time.monotonic()
+        with self.condition:
+            while True:
+                result, remaining = self.poll(phase, carrier_id, grace, start, item_id)
+                if result is not None:
+                    return result
+                self.condition.wait(remaining)
+
+    def poll(self, phase, carrier_id, grace, start, item_id=None):
+        '''One check of wait_for_item() for a request that started waiting at 'start', call it with the condition held.
+
+        Returns:
+            tuple: (result of wait_for_item(), None) once the wait is over, else (None, seconds until the next check).
+        '''
+        position = ITEM_PHASES.index(phase)
+        item = self.find(phase, carrier_id, item_id)
+        if item is not None and ITEM_PHASES.index(item.phase) >= position:
+            return (item, item.phase), None
+        if item is None and phase != ITEM_PHASES[0]:
+            return (None, None), None
+        deadline = self._deadline()
+        remaining = max(deadline if deadline is not None else start, start) + grace - time.monotonic()
+        if remaining <= 0:
+            return (item, item.phase if item is not None else None), None
+        return None, remaining
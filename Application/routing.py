@@ -1,10 +1,13 @@
 import numpy as np
 import yaml
+import os
 import uuid
 import utilities as utils
 from algorithm import AlgorithmBase
 from cost_model import CostModel
 from offer import Offer
+from solver_executor import shared_executor
+from search_budget import SearchBudget
 from datetime import datetime
 
 current_date = datetime.now()
@@ -27,6 +30,28 @@ def load_config(config_file):
             return None
 
 
+script_dir = os.path.dirname(__file__)
+config_path = os.path.join(script_dir, os.pardir, 'config', 'carrier_config.yaml')
+config = load_config(config_path)
+
+# 'exact': solve the tour with the offer, 'insertion': cheapest insertion into the current tour
+bid_engine = config['constants'].get('bid_engine', 'exact')
+# worker processes for independent solves, 0: one per core
+solver_workers = config['constants'].get('solver_workers', 0)
+# 'resolve': solve the tour without each offer, 'removal': splice the offer out of the tour
+marginal_cost_mode = config['constants'].get('marginal_cost_mode', 'resolve')
+# positions around a spliced out offer that are re-optimized, 0: plain splice
+removal_window = config['constants'].get('removal_window', 0)
+# tours with up to this many requests are solved by the exact dynamic program, 0: always OR-Tools
+exact_max_requests = config['constants'].get('exact_max_requests', 8)
+# 'ortools' or 'local_search' (NumPy 2-opt/Or-opt/relocate, faster but only local optima)
+routing_backend = config['constants'].get('routing_backend', 'ortools')
+# reproducible bids: no wall-clock limits and no warm start, see SearchBudget
+deterministic_search = config['constants'].get('deterministic_search', False)
+# skip the solver when the best possible bid (added distance bound) is not positive
+bid_pruning = config['constants'].get('bid_pruning', True)
+
+
 class Routing(AlgorithmBase):
 
     def __init__(self, carrier_id, socketio, dt_data, depot, cost_model):
@@ -38,9 +63,24 @@ class Routing(AlgorithmBase):
         self.stats = {'revenue':0, 'cost':0, 'profit':0}
         self.offers = self.create_offer_list()
         self.on_auction_indices = []
+        self.bid_engine = bid_engine
+        self.marginal_cost_mode = marginal_cost_mode
+        self.removal_window = removal_window
+        self.bid_pruning = bid_pruning
+        # 'pruned': bids answered by get_added_distance_bound() without solving
+        self.bid_stats = {'bids': 0, 'pruned': 0}
         
         locations, assignments = self.get_locations_and_assignments()
         super().__init__(locations, assignments)
+        # the carriers are threads of the web app, they share one pool
+        self.solver_executor = shared_executor(solver_workers)
+        self.search_budget = SearchBudget(deterministic=deterministic_search)
+        self.exact_max_requests = exact_max_requests
+        self.routing_backend = routing_backend
+        # baseline tour (without offers on auction) cached per tour_version,
+        # the version changes whenever the carrier's requests change
+        self.tour_version = 0
+        self._baseline_tour = None
 
         
     def create_offer_list(self):
@@ -64,19 +104,23 @@ class Routing(AlgorithmBase):
             offers.append(Offer(self.carrier_id, offer_id, loc_pickup, loc_dropoff, revenue, min_price))
         return offers
 
+    def get_tour_offers(self):
+        # interested only in transport requests that were not sold or that were bought by the carrier,
+        # the i-th offer is the i-th assignment of get_locations_and_assignments()
+        return [offer for offer in self.offers if offer.on_auction == False]
+
+
     def get_locations_and_assignments(self): 
         locations = [self.depot_location]
         assignments = []
-        for offer in self.offers:
-            if offer.on_auction == False : 
-                # interested only in transport requests that were not sold or that were bought by the carrier
-                # extract positions and append to locations
-                pickup_index = len(locations)  # Index of the next pickup location
-                locations.append((offer.loc_pickup["pos_x"], offer.loc_pickup["pos_y"]))
-                dropoff_index = len(locations)  # Index of the next dropoff location
-                locations.append((offer.loc_dropoff["pos_x"], offer.loc_dropoff["pos_y"]))
-                # Append the indices to the assignment list
-                assignments.append([pickup_index, dropoff_index])
+        for offer in self.get_tour_offers():
+            # extract positions and append to locations
+            pickup_index = len(locations)  # Index of the next pickup location
+            locations.append((offer.loc_pickup["pos_x"], offer.loc_pickup["pos_y"]))
+            dropoff_index = len(locations)  # Index of the next dropoff location
+            locations.append((offer.loc_dropoff["pos_x"], offer.loc_dropoff["pos_y"]))
+            # Append the indices to the assignment list
+            assignments.append([pickup_index, dropoff_index])
         return locations, assignments
     
     def get_requests_below_threshold(self): 
@@ -93,17 +137,39 @@ class Routing(AlgorithmBase):
         return requests_below_thresh
 
 
+    def get_baseline_tour(self):
+        """
+        Optimal tour of the carrier's current requests, solved at most once per tour_version.
+        """
+        if self._baseline_tour is None or self._baseline_tour[0] != self.tour_version:
+            self._baseline_tour = (self.tour_version, self.get_optimal_tour())
+        return self._baseline_tour[1]
+
+
     def calculate_bid(self, loc_pickup, loc_dropoff, revenue):
-        optimal_tour_distance = float(self.get_optimal_tour(ignore_indices=self.on_auction_indices)['distance'])
-        optimal_tour_with_offer_distance = float(self.get_optimal_tour(ignore_indices=self.on_auction_indices,\
-                                                              include_pickups=loc_pickup, include_dropoffs=loc_dropoff)['distance'])
-        added_distance = optimal_tour_with_offer_distance - optimal_tour_distance
+        self.bid_stats['bids'] += 1
+        if self.bid_pruning:
+            # best possible bid, the added distance is at least the bound
+            bound = self.get_added_distance_bound(loc_pickup, loc_dropoff)
+            best_bid = revenue - (self.cost_model.b1 + self.cost_model.b2 * (bound / 1000)) - self.cost_model.buy_threshold
+            if best_bid <= 0:
+                self.bid_stats['pruned'] += 1
+                return best_bid
+        # requests on auction were already removed from the tour by get_requests_below_threshold()
+        optimal_tour = self.get_baseline_tour()
+        if self.bid_engine == 'insertion':
+            added_distance = self.get_insertion_distance(optimal_tour, include_pickups=loc_pickup, include_dropoffs=loc_dropoff)
+        else:
+            optimal_tour_distance = float(optimal_tour['distance'])
+            optimal_tour_with_offer_distance = float(self.get_optimal_tour(include_pickups=loc_pickup, include_dropoffs=loc_dropoff)['distance'])
+            added_distance = optimal_tour_with_offer_distance - optimal_tour_distance
         added_cost = self.cost_model.b1 + self.cost_model.b2 * (added_distance / 1000)
         bid = revenue - added_cost - self.cost_model.buy_threshold
         return bid
 
 
     def update_offer_list(self, offer_to_update):
+        self.tour_version += 1
         if self.carrier_id==offer_to_update['offeror']:
             # carrier is the offeror and maybe the winner
             for i,offer in enumerate(self.offers):
@@ -114,33 +180,26 @@ class Routing(AlgorithmBase):
                         offer.on_auction = False
                         # carrier is the winner -> add location back to tour
                         self.add_location(pickup=[offer_to_update['loc_pickup']], dropoff=[offer_to_update['loc_dropoff']])
-                        self.optimal_tour = self.get_optimal_tour()
+                        self.optimal_tour = self.get_baseline_tour()
         else:                  
             # carrier is the winner but not the offeror          
             self.add_offer(offer_to_update)
-            self.optimal_tour = self.get_optimal_tour()
+            self.optimal_tour = self.get_baseline_tour()
         # if carrier was the seller no need to calculate optimal tour...
 
 
     def add_location(self, pickup=[], dropoff=[]):
-        loc_pickup = []
-        loc_dropoff = []
-        for i in range(len(pickup)):
-                loc_pickup.append(tuple(utils.dict_to_float(pickup[i]).values()))
-                loc_dropoff.append(tuple(utils.dict_to_float(dropoff[i]).values()))
-
-        for include_location in zip(loc_pickup, loc_dropoff): # zip( [(1,2),()], [(3,4),()] ) -> [ ( (1,2), (3,4) ), () ]
-            self.locations.extend(list(include_location)) 
-            self.assignments.append([len(self.locations)-2, len(self.locations)-1])
+        self.add_locations(utils.positions_to_array(pickup), utils.positions_to_array(dropoff))
+        self.tour_version += 1
 
 
     def delete_location(self, ignore_indices):
-        locations = []; assignments = []
-        locations, assignments = self.filter_requests_by_index(ignore_indices)
-        self.locations = locations; self.assignments =assignments
+        self.tour_version += 1
+        self.remove_requests(ignore_indices)
 
 
     def add_offer(self, offer):
+        self.tour_version += 1
         carrier_id = offer['offeror']
         offer_id = offer['offer_id']
         loc_pickup = offer['loc_pickup']
@@ -169,12 +228,14 @@ class Routing(AlgorithmBase):
         for offer in self.offers:
             if offer.winner == "NONE":
                 offer.on_auction = False
-        # get ALL unsold offers
-        offers_not_sold = [offer for offer in self.offers if not offer.on_auction]
+        # get ALL unsold offers, in the order of the assignments
+        offers_not_sold = self.get_tour_offers()
         # set new locations and assignments lists
         locations, assignments = self.get_locations_and_assignments()
-        self.locations, self.assignments = locations, assignments
-        self.optimal_tour = self.get_optimal_tour()
+        self.locations = locations
+        self.store.set_assignments(assignments, [offer.offer_id for offer in offers_not_sold])
+        self.tour_version += 1
+        self.optimal_tour = self.get_baseline_tour()
         new_stats = {
         'new_revenue': 0,
         'new_cost': 0,
@@ -186,11 +247,10 @@ class Routing(AlgorithmBase):
                 new_stats['new_revenue'] += offer.winning_bid
                 assert offer.winner != "NONE" and offer.winner != self.carrier_id
         # calculate revenue and cost of unsold and bought offers
-        for i, offer in enumerate(offers_not_sold):
+        margin_distances = self.get_marginal_distances(self.optimal_tour, self.marginal_cost_mode, self.removal_window)
+        for offer, margin_distance in zip(offers_not_sold, margin_distances):
             new_stats['new_revenue'] += offer.revenue
             
-            optimal_tour_without_offer = self.get_optimal_tour(ignore_indices=[i])
-            margin_distance = float(self.optimal_tour['distance']) - float(optimal_tour_without_offer['distance'])
             margin_cost = self.cost_model.get_marginal_cost(margin_distance)
             new_stats['new_cost'] += margin_cost
            
@@ -0,0 +1,251 @@
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+from ortools.constraint_solver import routing_enums_pb2
+from ortools.constraint_solver import pywrapcp
+from local_search import route_length, cheapest_insertion, removal_savings, improve_route
+from exact_solver import solve_exact
+
+ROUTING_BACKEND = 'ortools' # 'ortools', 'local_search' or 'exact', see create_backend()
+
+
+class RoutingBackend(ABC):
+    """
+    Interface of the tour solvers. solve() computes a tour for the tour data of create_tour_data(),
+    insert(), remove() and evaluate() work on a given tour without solving.
+    Tours are node index lists, first and last node is the depot, distances are in the units of
+    the (fixed-point) distance matrix. A backend has to implement solve().
+    """
+    name = None
+
+    @abstractmethod
+    def solve(self, data, max_distance, search_budget, initial_route=None, trace=False):
+        """
+        Args:
+            data (dict)                 : Tour data, see AlgorithmBase.create_tour_data()
+            max_distance (int)          : Maximum length of the tour
+            search_budget (SearchBudget): Search limits
+            initial_route (list of int) : Route without the depot to start from (warm start), optional
+            trace (bool)                : Record (wall time ms, objective) of every solution in stats['trace']
+        Returns:
+            list of int: The tour, None if there is no tour within max_distance
+            int: The length of the tour
+            dict: Search statistics (solver, branches, solutions, wall_time, time_limit_ms, stagnated, trace)
+        """
+
+    def insert(self, dist_mat, route, pickup, dropoff):
+        """
+        Inserts a transport request at the cheapest positions, returns the new tour and the added distance.
+        """
+        return cheapest_insertion(dist_mat, route, pickup, dropoff)
+
+    def remove(self, dist_mat, route, requests, window=0):
+        """
+        Distance saved by removing each of the transport requests from the tour (np.ndarray).
+        """
+        return removal_savings(dist_mat, route, requests, window)
+
+    def evaluate(self, dist_mat, route):
+        """
+        Length of the tour.
+        """
+        return route_length(dist_mat, route)
+
+
+class ORToolsBackend(RoutingBackend):
+    """
+    OR-Tools routing solver, PARALLEL_CHEAPEST_INSERTION or the initial route followed by its local search.
+    Attributes:
+        transit_mode (str): 'matrix' or 'callback', see register_transit()
+    """
+    name = 'ortools'
+
+    def __init__(self, transit_mode='matrix'):
+        self.transit_mode = transit_mode
+
+    def register_transit(self, routing, manager, distance_matrix):
+        '''Registers the arc costs of the distance matrix with the solver.
+
+        In 'matrix' mode the whole integer matrix is handed to OR-Tools once, so the
+        search loop never calls back into Python. 'callback' keeps the per arc Python callback.
+
+        Args:
+            routing (pywrapcp.RoutingModel): The routing model.
+            manager (pywrapcp.RoutingIndexManager): The index manager of the routing model.
+            distance_matrix (list of lists): Distance matrix.
+
+        Returns:
+            int: Transit callback index.
+        '''
+        if self.transit_mode == 'matrix':
+            return routing.RegisterTransitMatrix(np.asarray(distance_matrix, dtype=np.int64).tolist())
+
+        def distance_callback(from_index, to_index):
+            """Returns the manhattan distance between the two nodes."""
+            # Convert from routing variable Index to distance matrix NodeIndex.
+            from_node = manager.IndexToNode(from_index)
+            to_node = manager.IndexToNode(to_index)
+            return int(distance_matrix[from_node][to_node])
+
+        return routing.RegisterTransitCallback(distance_callback)
+
+    def solve(self, data, max_distance, search_budget, initial_route=None, trace=False):
+        manager = pywrapcp.RoutingIndexManager(len(data["distance_matrix"]), data["num_vehicles"], data["depot"])
+        routing = pywrapcp.RoutingModel(manager)
+
+        transit_callback_index = self.register_transit(routing, manager, data["distance_matrix"])
+        routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+        # Add Distance constraint.
+        dimension_name = "Distance"
+        routing.AddDimension(
+            transit_callback_index,
+            0,  # no slack
+            max_distance,
+            True,  # start cumul to zero
+            dimension_name,
+        )
+        distance_dimension = routing.GetDimensionOrDie(dimension_name)
+        distance_dimension.SetGlobalSpanCostCoefficient(100)
+
+        # Define Transportation Requests.
+        for request in data["pickups_deliveries"]:
+            pickup_index = manager.NodeToIndex(request[0])
+            delivery_index = manager.NodeToIndex(request[1])
+            routing.AddPickupAndDelivery(pickup_index, delivery_index)
+            routing.solver().Add(
+                routing.VehicleVar(pickup_index) == routing.VehicleVar(delivery_index)
+            )
+            routing.solver().Add(
+                distance_dimension.CumulVar(pickup_index)
+                <= distance_dimension.CumulVar(delivery_index)
+            )
+
+        # Setting first solution heuristic.
+        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+        search_parameters.first_solution_strategy = (
+            routing_enums_pb2.FirstSolutionStrategy.PARALLEL_CHEAPEST_INSERTION
+        )
+        # the monitor has to stay referenced until the search is done
+        monitor = search_budget.apply(routing, search_parameters, len(data["distance_matrix"]))
+
+        solutions = []
+        if trace:
+            routing.AddAtSolutionCallback(lambda: solutions.append((routing.solver().WallTime(), routing.CostVar().Value())))
+
+        solution = None
+        if initial_route:
+            # warm start: local search from the initial route
+            routing.CloseModelWithParameters(search_parameters)
+            initial_assignment = routing.ReadAssignmentFromRoutes([[manager.NodeToIndex(node) for node in initial_route]], True)
+            if initial_assignment:
+                solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+        if not solution:
+            solution = routing.SolveWithParameters(search_parameters)
+        stats = {
+            'solver': self.name,
+            'branches': routing.solver().Branches(),
+            'solutions': routing.solver().Solutions(),
+            'wall_time': routing.solver().WallTime(), # ms
+            'time_limit_ms': None if search_budget.deterministic else search_budget.time_limit_ms(len(data["distance_matrix"])),
+            'stagnated': monitor.stagnated,
+            'trace': solutions,
+        }
+        if not solution:
+            return None, 0, stats
+
+        route = []
+        vehicle_id = 0
+        index = routing.Start(vehicle_id)
+        route_distance = 0
+        while not routing.IsEnd(index):
+            route.append(manager.IndexToNode(index))
+            previous_index = index
+            index = solution.Value(routing.NextVar(index))
+            route_distance += routing.GetArcCostForVehicle(
+                previous_index, index, vehicle_id
+            )
+        route.append(manager.IndexToNode(index))
+        return route, route_distance, stats
+
+
+class LocalSearchBackend(RoutingBackend):
+    """
+    NumPy local search (2-opt, Or-opt, request relocate) from the initial route or a
+    cheapest insertion tour, single vehicle only. Cheaper than building an OR-Tools model for
+    small repeated problems, the tours are local optima. stats['stagnated'] tells whether
+    the search stopped in a local optimum before the budget ran out.
+    """
+    name = 'local_search'
+
+    def solve(self, data, max_distance, search_budget, initial_route=None, trace=False):
+        start = time.monotonic()
+        dist_mat = np.asarray(data["distance_matrix"])
+        depot = data["depot"]
+        if initial_route:
+            route = [depot] + list(initial_route) + [depot]
+        else:
+            route = [depot, depot]
+            for pickup, dropoff in data["pickups_deliveries"]:
+                route, _ = cheapest_insertion(dist_mat, route, pickup, dropoff)
+        nodes = len(dist_mat)
+        deadline = None if search_budget.deterministic else start + search_budget.time_limit_ms(nodes) / 1000
+        solutions = [] if trace else None
+        route, improvements, local_optimum = improve_route(dist_mat, route, data["pickups_deliveries"], deadline,
+                                                           search_budget.solution_limit, solutions)
+        route_distance = route_length(dist_mat, route)
+        stats = {
+            'solver': self.name,
+            'branches': 0,
+            'solutions': improvements + 1,
+            'wall_time': (time.monotonic() - start) * 1000, # ms
+            'time_limit_ms': None if deadline is None else search_budget.time_limit_ms(nodes),
+            'stagnated': local_optimum,
+            'trace': solutions or [],
+        }
+        if route_distance > max_distance:
+            return None, 0, stats
+        return route, route_distance, stats
+
+
+class ExactBackend(RoutingBackend):
+    """
+    Optimal tours by the dynamic program of exact_solver.solve_exact(), single vehicle and
+    small tours only (O(3^n) for n requests), ignores the search budget and the initial route.
+    """
+    name = 'exact'
+
+    def solve(self, data, max_distance, search_budget, initial_route=None, trace=False):
+        start = time.perf_counter()
+        route, route_distance = solve_exact(data["distance_matrix"], data["pickups_deliveries"], data["depot"])
+        stats = {
+            'solver': self.name,
+            'branches': 0,
+            'solutions': 1,
+            'wall_time': (time.perf_counter() - start) * 1000, # ms
+            'time_limit_ms': None,
+            'stagnated': False,
+            'trace': [],
+        }
+        if route_distance > max_distance:
+            return None, 0, stats
+        return route, route_distance, stats
+
+
+def create_backend(name=ROUTING_BACKEND, transit_mode='matrix'):
+    '''Routing backend by name.
+
+    Args:
+        name (str): 'ortools', 'local_search' or 'exact'.
+        transit_mode (str): Transit mode of the OR-Tools backend.
+
+    Returns:
+        RoutingBackend: The backend.
+    '''
+    if name == 'ortools':
+        return ORToolsBackend(transit_mode)
+    if name == 'local_search':
+        return LocalSearchBackend()
+    if name == 'exact':
+        return ExactBackend()
+    raise ValueError(f"Unknown routing backend '{name}', use 'ortools', 'local_search' or 'exact'")
@@ -0,0 +1,93 @@
+import time
+
+TIME_LIMIT_BASE_MS = 50 # time limit of a tour without locations
+TIME_LIMIT_PER_NODE_MS = 40 # added per location
+TIME_LIMIT_MAX_MS = 10000
+SOLUTION_LIMIT = 0 # 0: no limit (DETERMINISTIC_SOLUTION_LIMIT in deterministic mode)
+DETERMINISTIC_SOLUTION_LIMIT = 10
+STAGNATION_MS = 1000 # stop when the best tour did not improve for this long, 0: off
+STAGNATION_SOLUTIONS = 100 # stop after this many solutions without improvement, 0: off
+
+
+class SearchBudget:
+    """
+    Limits of one routing search, the time limit grows with the number of locations.
+    Attributes:
+        base_ms (int)              : Time limit of a tour without locations
+        per_node_ms (int)          : Time limit added per location
+        max_ms (int)               : Upper bound of the time limit
+        solution_limit (int)       : Maximum number of solutions, 0: no limit (deterministic: DETERMINISTIC_SOLUTION_LIMIT)
+        stagnation_ms (int)        : Stop when the best tour did not improve for this long, 0: off
+        stagnation_solutions (int) : Stop after this many solutions without improvement, 0: off
+        deterministic (bool)       : No wall-clock limits (only solution counts), so the same
+                                     tour data always gives the same tour
+    """
+    def __init__(self, base_ms=TIME_LIMIT_BASE_MS, per_node_ms=TIME_LIMIT_PER_NODE_MS, max_ms=TIME_LIMIT_MAX_MS,
+                 solution_limit=SOLUTION_LIMIT, stagnation_ms=STAGNATION_MS, stagnation_solutions=STAGNATION_SOLUTIONS,
+                 deterministic=False):
+        self.base_ms = base_ms
+        self.per_node_ms = per_node_ms
+        self.max_ms = max_ms
+        self.solution_limit = solution_limit
+        self.stagnation_ms = stagnation_ms
+        self.stagnation_solutions = stagnation_solutions
+        self.deterministic = deterministic
+
+    def time_limit_ms(self, nodes):
+        return min(self.max_ms, self.base_ms + self.per_node_ms * nodes)
+
+    def apply(self, routing, search_parameters, nodes):
+        """
+        Sets the limits on the search parameters and adds the stagnation monitor to the routing model,
+        has to be called before the model is closed. Returns the monitor.
+        """
+        if self.deterministic:
+            # bound the work by the number of solutions instead of the wall-clock time
+            search_parameters.solution_limit = self.solution_limit or DETERMINISTIC_SOLUTION_LIMIT
+        else:
+            if self.solution_limit:
+                search_parameters.solution_limit = self.solution_limit
+            search_parameters.time_limit.FromMilliseconds(self.time_limit_ms(nodes))
+        stagnation_ms = 0 if self.deterministic else self.stagnation_ms
+        return StagnationMonitor(routing, stagnation_ms, self.stagnation_solutions)
+
+
+class StagnationMonitor:
+    """
+    Stops the search when the best cost stops improving. Stagnation is only checked when the solver
+    finds a solution (AddAtSolutionCallback), there is no Python call per search step.
+    Attributes:
+        best_cost (int)        : Cost of the best solution so far (None before the first one)
+        since_improvement (int): Solutions since the last improvement
+        stagnated (bool)       : Whether the monitor stopped the search
+    """
+    def __init__(self, routing, stagnation_ms=STAGNATION_MS, stagnation_solutions=STAGNATION_SOLUTIONS):
+        self.routing = routing
+        self.stagnation_ms = stagnation_ms
+        self.stagnation_solutions = stagnation_solutions
+        self.best_cost = None
+        self.last_improvement = time.monotonic()
+        self.since_improvement = 0
+        self.stagnated = False
+        routing.AddAtSolutionCallback(self.on_solution)
+
+    def on_solution(self):
+        cost = self.routing.CostVar().Value()
+        if self.best_cost is None or cost < self.best_cost:
+            self.best_cost = cost
+            self.last_improvement = time.monotonic()
+            self.since_improvement = 0
+        else:
+            self.since_improvement += 1
+        if self.check():
+            # the best solution so far is kept as the result
+            self.routing.solver().FinishCurrentSearch()
+
+    def check(self):
+        if self.best_cost is None:
+            return False
+        if self.stagnation_solutions and self.since_improvement >= self.stagnation_solutions:
+            self.stagnated = True
+        elif self.stagnation_ms and (time.monotonic() - self.last_improvement) * 1000 >= self.stagnation_ms:
+            self.stagnated = True
+        return self.stagnated
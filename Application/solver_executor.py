@@ -0,0 +1,80 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+SOLVER_WORKERS = os.cpu_count() or 1
+
+
+class SolverExecutor:
+    """
+    Runs independent solves in a process pool and collects the results in order. The pool is started
+    on the first parallel map() and reused by the following ones, so the worker processes (and their
+    imports) are paid once per executor. The workers are spawned, not forked: they do not inherit the
+    threads and held locks of the process (e.g. the carriers and the tour cache of the web app).
+    Attributes:
+        workers (int): Number of worker processes, capped at the number of cores.
+                       With one worker (e.g. single-core machines) the solves run serially.
+        pool (ProcessPoolExecutor): The worker processes, None until the first parallel map() or after shutdown()
+    """
+    def __init__(self, workers=SOLVER_WORKERS):
+        self.workers = max(1, min(workers or SOLVER_WORKERS, os.cpu_count() or 1))
+        self.pool = None
+        self._pool_workers = None
+        self._lock = threading.Lock()
+
+    def map(self, func, tasks):
+        """
+        Returns [func(task) for task in tasks], func has to be a module level function.
+        """
+        tasks = list(tasks)
+        if self.workers <= 1 or len(tasks) <= 1:
+            return [func(task) for task in tasks]
+        return list(self.get_pool().map(func, tasks))
+
+    def get_pool(self):
+        with self._lock:
+            if self.pool is not None and self._pool_workers != self.workers:
+                # the number of workers was changed since the pool was started
+                self.pool.shutdown()
+                self.pool = None
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pool_workers = self.workers
+            return self.pool
+
+    def shutdown(self):
+        """
+        Stops the worker processes, the next parallel map() starts new ones.
+        """
+        with self._lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+
+_shared_executors = {}
+_shared_lock = threading.Lock()
+
+
+def shared_executor(workers=SOLVER_WORKERS):
+    '''The executor of this process for the number of workers, shared by all carriers and tour
+    calculations instead of a pool per carrier.
+
+    Args:
+        workers (int): Number of worker processes, 0: one per core.
+
+    Returns:
+        SolverExecutor: The same executor for every call with the same (capped) number of workers.
+    '''
+    executor = SolverExecutor(workers)
+    with _shared_lock:
+        return _shared_executors.setdefault(executor.workers, executor)
+
+
+@atexit.register
+def shutdown_shared_executors():
+    with _shared_lock:
+        for executor in _shared_executors.values():
+            executor.shutdown()
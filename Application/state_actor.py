@@ -0,0 +1,95 @@
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class StateActor(threading.Thread):
+    """
+    Single owner of the auctioneer state: the carrier handlers and the auction loop send commands
+    (a function and its arguments) through one queue and wait for the reply, only this thread
+    executes them. Every command sees and leaves a consistent state without a lock, and the time a
+    command waits in the queue and takes to execute is measured per command.
+    Attributes:
+        commands (queue.Queue): Pending commands (name, function, args, kwargs, reply future, enqueue time)
+        latency (dict)        : Command name -> [count, total seconds, max seconds] from enqueueing to the reply
+    """
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.commands = queue.Queue()
+        self.latency = {}
+        self._stats_lock = threading.Lock()
+
+    def run(self):
+        while True:
+            command = self.commands.get()
+            if command is None:
+                break
+            name, function, args, kwargs, reply, enqueued = command
+            try:
+                reply.set_result(function(*args, **kwargs))
+            except BaseException as e:
+                reply.set_exception(e)
+            self._record(name, time.perf_counter() - enqueued)
+
+    def call(self, name, function, *args, **kwargs):
+        '''Executes the function on the actor thread and waits for its result, exceptions are raised
+        in the caller. Commands issued by a command run inline, they are part of the same step.
+
+        Returns:
+            The result of the function.
+        '''
+        if threading.current_thread() is self:
+            return function(*args, **kwargs)
+        return self.submit(name, function, *args, **kwargs).result()
+
+    def submit(self, name, function, *args, **kwargs):
+        '''Queues the function as a command without waiting for it.
+
+        Returns:
+            concurrent.futures.Future: The reply, asyncio.wrap_future() makes it awaitable.
+        '''
+        reply = Future()
+        self.commands.put((name, function, args, kwargs, reply, time.perf_counter()))
+        return reply
+
+    def stop(self):
+        self.commands.put(None)
+
+    def _record(self, name, seconds):
+        with self._stats_lock:
+            stats = self.latency.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def latency_report(self):
+        '''Latency of the commands so far.
+
+        Returns:
+            dict: Command name -> {'count', 'mean_ms', 'max_ms'}.
+        '''
+        with self._stats_lock:
+            return {name: {'count': count, 'mean_ms': 1000 * total / count, 'max_ms': 1000 * longest}
+                    for name, (count, total, longest) in self.latency.items()}
+
+
+def submit_command(bound_method, *args, **kwargs):
+    '''Queues a call of a @command method of an object without blocking the caller (e.g. an event loop).
+
+    Returns:
+        concurrent.futures.Future: The reply, see StateActor.submit().
+    '''
+    owner, method = bound_method.__self__, bound_method.__func__.__wrapped__
+    return owner.actor.submit(method.__name__, method, owner, *args, **kwargs)
+
+
+def command(method):
+    """
+    Decorator for methods of an object with an 'actor' (StateActor): the method runs as a command on the actor thread.
+    """
+    @functools.wraps(method)
+    def decorator(self, *args, **kwargs):
+        return self.actor.call(method.__name__, method, self, *args, **kwargs)
+    return decorator
@@ -1,119 +1,115 @@
-from ortools.constraint_solver import routing_enums_pb2
-from ortools.constraint_solver import pywrapcp
+import os
+import yaml
+import utilities as utils
+from local_search import removal_savings
+from search_budget import SearchBudget
+from routing_backend import create_backend
+from tour_cache import TourCache, tour_key
 
 VEHICLE_MAXIMUM_DISTANCE = 3000
 NUM_VEHICLES = 1
 DEPOT_LOCATION = 0
-
-def create_tour_data(locations, assigned_deliveries):
+TRANSIT_MODE = 'matrix' # 'matrix': register the distance matrix once, 'callback': per arc python callback
+DISTANCE_MODE = 'manhattan'
+DISTANCE_SCALE = 1000 # distances are handed to the solver as fixed-point integers (1/DISTANCE_SCALE units)
+
+script_dir = os.path.dirname(__file__)
+config_path = os.path.join(script_dir, os.pardir, 'config', 'carrier_config.yaml')
+with open(config_path, 'r') as config_file:
+    config = yaml.safe_load(config_file)
+# 'ortools' or 'local_search' (NumPy 2-opt/Or-opt/relocate, faster but only local optima)
+ROUTING_BACKEND = config['constants'].get('routing_backend', 'ortools')
+# marginal costs of get_cost_list(), 'resolve': solve the tour without each request, 'removal': splice it out of the tour
+MARGINAL_COST_MODE = config['constants'].get('marginal_cost_mode', 'resolve')
+# positions around a spliced out request that are re-optimized, 0: plain splice
+REMOVAL_WINDOW = config['constants'].get('removal_window', 0)
+# worker processes of the independent solves of get_cost_list(), 0: one per core
+SOLVER_WORKERS = config['constants'].get('solver_workers', 0)
+# tours solved by get_optimal_tour(), e.g. /generate_deliveries and get_cost_list() solve the same tour
+TOUR_CACHE = TourCache()
+
+
+def create_tour_data(locations, assigned_deliveries, scale=DISTANCE_SCALE):
     '''Create data required for 'get_optimal_tour()'.
 
     Args:
         locations (list of tuples): List of tuples containing (x, y) coordinates.
         assigned_deliveries (list of lists): List of pairs [x, y] representing assigned delivery locations.
+        scale (int): Fixed-point scale factor of the distance matrix.
 
     Returns:
         dict: Dictionary containing tour data.
     '''
     data = {}
-    data["distance_matrix"] = create_distance_matrix(locations)
+    data["distance_matrix"] = create_distance_matrix(locations, scale)
+    data["distance_scale"] = scale
     data["pickups_deliveries"] = assigned_deliveries
     data["num_vehicles"] = NUM_VEHICLES
     data["depot"] = DEPOT_LOCATION
     return data
 
 
-def create_distance_matrix(locations):
+def create_distance_matrix(locations, scale=DISTANCE_SCALE):
     '''Create distance matrix using taxicab geometry. https://en.wikipedia.org/wiki/Taxicab_geometry
     
     Args:
         locations (list of tuples): List of locations (x, y).
+        scale (int): Fixed-point scale factor.
     
     Returns:
-        list of lists: Distance matrix. https://en.wikipedia.org/wiki/Distance_matrix 
+        np.ndarray: Distance matrix scaled by 'scale' as int64. https://en.wikipedia.org/wiki/Distance_matrix 
     '''
-    dist_mat = []
-    for x in locations:
-        distance_for_location_x = []
-        for y in locations:
-            distance = round(abs(x[0] - y[0]) + abs(x[1] - y[1]), 2)
-            distance_for_location_x.append(distance) 
-        dist_mat.append(distance_for_location_x) 
-    return dist_mat 
+    return utils.create_distance_matrix(locations, mode=DISTANCE_MODE, scale=scale)
 
 
-def get_optimal_tour(data):
+def get_optimal_tour(data, transit_mode=TRANSIT_MODE, search_budget=None, backend=ROUTING_BACKEND, cache=TOUR_CACHE):
     '''Calculates the optimal tour.
 
     Args:
         data (dict): Dictionary containing necessary data for routing.
+        transit_mode (str): 'matrix' or 'callback', see ORToolsBackend.register_transit().
+        search_budget (SearchBudget): Search limits, default: time limit scaled with the number of locations.
+        backend (str): Routing backend, see routing_backend.create_backend().
+        cache (TourCache): Cache of solved tours, None: always solve.
 
     Returns:
         list: List representing the optimal tour.
     '''
-    manager = pywrapcp.RoutingIndexManager(len(data["distance_matrix"]), data["num_vehicles"], data["depot"])
-    routing = pywrapcp.RoutingModel(manager)
-
-    def distance_callback(from_index, to_index):
-        """Returns the manhattan distance between the two nodes."""
-        # Convert from routing variable Index to distance matrix NodeIndex.
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return data["distance_matrix"][from_node][to_node]
-
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
-
-    # Add Distance constraint.
-    dimension_name = "Distance"
-    routing.AddDimension(
-        transit_callback_index,
-        0,  # no slack
-        VEHICLE_MAXIMUM_DISTANCE,
-        True,  # start cumul to zero
-        dimension_name,
-    )
-    distance_dimension = routing.GetDimensionOrDie(dimension_name)
-    distance_dimension.SetGlobalSpanCostCoefficient(100)
-
-    # Define Transportation Requests.
-    for request in data["pickups_deliveries"]:
-        pickup_index = manager.NodeToIndex(request[0])
-        delivery_index = manager.NodeToIndex(request[1])
-        routing.AddPickupAndDelivery(pickup_index, delivery_index)
-        routing.solver().Add(
-            routing.VehicleVar(pickup_index) == routing.VehicleVar(delivery_index)
-        )
-        routing.solver().Add(
-            distance_dimension.CumulVar(pickup_index)
-            <= distance_dimension.CumulVar(delivery_index)
-        )
-
-    # Setting first solution heuristic.
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (
-        routing_enums_pb2.FirstSolutionStrategy.PARALLEL_CHEAPEST_INSERTION
-    )
-
-    solution = routing.SolveWithParameters(search_parameters)
-    optimalTour = []
-    vehicle_id = 0
-    total_distance = 0
-    index = routing.Start(vehicle_id)
-    route_distance = 0
-    while not routing.IsEnd(index):
-        optimalTour.append(str(manager.IndexToNode(index)))
-        previous_index = index
-        index = solution.Value(routing.NextVar(index))
-        route_distance += routing.GetArcCostForVehicle(
-            previous_index, index, vehicle_id
-        )
-        total_distance += route_distance
-    optimalTour.append(str(manager.IndexToNode(index)))
+    search_budget = search_budget or SearchBudget()
+    scale = data.get("distance_scale", 1)
+    key = tour_key(data, (backend, transit_mode, VEHICLE_MAXIMUM_DISTANCE * scale, sorted(vars(search_budget).items())))
+    cached = cache.get(key) if cache is not None else None
+    if cached:
+        route, route_distance = cached
+    else:
+        route, route_distance, _ = create_backend(backend, transit_mode).solve(data, VEHICLE_MAXIMUM_DISTANCE * scale, search_budget)
+        if cache is not None:
+            cache.put(key, (None if route is None else tuple(route), route_distance))
+    if route is None:
+        raise ValueError(f"No tour within the maximum distance of {VEHICLE_MAXIMUM_DISTANCE}")
+    optimalTour = [str(node) for node in route]
+    # back from fixed-point to the units of the locations
+    total_distance = route_distance / scale
 
     result = {
         'optimalTour': optimalTour,
         'distance': total_distance,
     }
 
-    return result
\ No newline at end of file
+    return result
+
+
+def get_removal_distances(data, tour, window=REMOVAL_WINDOW):
+    '''Distance each transport request adds to the tour, by splicing it out of the solved tour.
+
+    Args:
+        data (dict): Result of create_tour_data() the tour was solved for.
+        tour (dict): Result of get_optimal_tour(data).
+        window (int): Positions around a removed request that are re-optimized, see removal_savings().
+
+    Returns:
+        list: Distance of every request in data["pickups_deliveries"].
+    '''
+    route = [int(node) for node in tour['optimalTour']]
+    savings = removal_savings(data["distance_matrix"], route, data["pickups_deliveries"], window)
+    return (savings / data.get("distance_scale", 1)).tolist()
@@ -1,3 +1,4 @@
+import json
 import numpy as np
 import pandas as pd
 from tabulate import tabulate
@@ -63,6 +64,39 @@ def get_distance(p0, p1, mode="euclid"):
     elif mode=="manhattan":
         distance = np.sum(np.abs(np.array(p_0) - np.array(p_1)))
     return distance
+
+def create_distance_matrix(locations, mode="manhattan", scale=1, targets=None):
+    '''Create an integer distance matrix in a single broadcast.
+
+    Distances are multiplied by 'scale' and rounded, i.e. stored as fixed-point integers,
+    so coordinates given in degrees keep their precision when handed to the solver.
+    Every temporary has the size of the result, so this also works for thousands of stops.
+
+    Args:
+        locations (list of tuples or np.ndarray): Locations (x, y).
+        mode (str): "manhattan" (taxicab geometry) or "euclid".
+        scale (int): Fixed-point scale factor.
+        targets (list of tuples or np.ndarray): Only compute the rows of these locations.
+
+    Returns:
+        np.ndarray: (len(targets), len(locations)) int64 distance matrix, square if no targets are given.
+    '''
+    points = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    rows = points if targets is None else np.asarray(targets, dtype=np.float64).reshape(-1, 2)
+    dist_mat = np.subtract.outer(rows[:, 0], points[:, 0])
+    dy = np.subtract.outer(rows[:, 1], points[:, 1])
+    if mode=="euclid":
+        np.hypot(dist_mat, dy, out=dist_mat)
+    elif mode=="manhattan":
+        np.abs(dist_mat, out=dist_mat)
+        np.abs(dy, out=dy)
+        dist_mat += dy
+    else:
+        raise ValueError(f"Unknown distance mode: {mode}")
+    del dy
+    dist_mat *= scale
+    np.rint(dist_mat, out=dist_mat)
+    return dist_mat.astype(np.int64)
     
 
 def random_cost_model():
@@ -89,11 +123,56 @@ def dict_to_float(dict):
         dict[k] = float(v)
     return dict
 
-def get_key_from_bundle_by_first_element(dictionary, value):
-    for key, val in dictionary.items():
-        if val[0] == value:
-            return key
-    return None
+def positions_to_array(positions):
+    '''Converts {'pos_x': ..., 'pos_y': ...} dicts to coordinates in one step, the dicts are not modified.
+
+    Args:
+        positions (list of dicts): Positions as sent with the offers, values may be strings.
+
+    Returns:
+        np.ndarray: (n, 2) float64 coordinates (x, y).
+    '''
+    return np.array([(position['pos_x'], position['pos_y']) for position in positions], dtype=np.float64).reshape(-1, 2)
+
+def split_json(buffer):
+    '''Splits the first JSON message off the received bytes, whitespace (the newline after a message of
+    a session) before it is skipped.
+
+    Args:
+        buffer (bytes): Bytes received from the peer.
+
+    Returns:
+        tuple: (message, bytes after the message), message is None while the bytes hold no complete message.
+    '''
+    try:
+        text = buffer.decode('utf-8').lstrip()
+        message, end = json.JSONDecoder().raw_decode(text)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None, buffer
+    return message, text[end:].encode('utf-8')
+
+def receive_json(sock, buffer=b"", bufsize=1024):
+    '''Reads one JSON message, a message of several items on auction does not fit a single recv() and a
+    recv() of a session may hold (parts of) the following messages as well.
+
+    Args:
+        sock (socket.socket): Connected socket, the peer sends one message per connection or, in a
+                              session, one message per line.
+        buffer (bytes): Bytes received after the previous message of the connection.
+        bufsize (int): Bytes per recv().
+
+    Returns:
+        tuple: (message, bytes received after it), message is None if the peer closed the connection
+               before a complete message.
+    '''
+    while True:
+        message, buffer = split_json(buffer)
+        if message is not None:
+            return message, buffer
+        chunk = sock.recv(bufsize)
+        if not chunk:
+            return (json.loads(buffer.decode('utf-8')) if buffer.strip() else None), b""
+        buffer += chunk
 
 def print_offer_list(offer_dictionaries):
     offers = [flatten_and_round_dict(offer) for offer in offer_dictionaries]
@@ -0,0 +1,42 @@
+'''
+Compares the routing backends (OR-Tools and the NumPy local search) for random carriers on a
+100 x 100 grid. Reports the solve time and the tour distance of every backend.
+
+    python benchmarks/bench_backends.py [n_requests ...]
+'''
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure')))
+import numpy as np
+from tabulate import tabulate
+from algorithm import AlgorithmBase
+
+BACKENDS = ['ortools', 'local_search']
+
+
+def random_carrier(n_requests, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.integers(0, 100, (2*n_requests+1,2))
+    locations = [tuple(p) for p in points]
+    assignments = [[2*i+1, 2*i+2] for i in range(n_requests)]
+    return locations, assignments
+
+
+def run(n_requests, backend):
+    locations, assignments = random_carrier(n_requests)
+    algorithm = AlgorithmBase(locations, assignments)
+    algorithm.exact_max_requests = 0
+    algorithm.routing_backend = backend
+    start = time.perf_counter()
+    result = algorithm.get_optimal_tour()
+    return [n_requests, backend, round((time.perf_counter() - start) * 1000, 2), result['distance']]
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [3, 10, 25, 40]
+    rows = []
+    for n in sizes:
+        for backend in BACKENDS:
+            rows.append(run(n, backend))
+    print(tabulate(rows, headers=['requests', 'backend', 'ms', 'distance'], tablefmt='psql'))
@@ -0,0 +1,64 @@
+'''
+Compares the 'exact' and 'insertion' bid engines of Routing.calculate_bid.
+For random carriers and random offers (single offers and bundles of two) it reports the
+time per bid and how far the insertion estimate of the added distance is from the exact one.
+
+    python benchmarks/bench_bid_engine.py [n_requests ...]
+'''
+import sys
+import os
+import time
+import contextlib
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure')))
+import numpy as np
+from tabulate import tabulate
+import utilities as utils
+from routing import Routing
+
+N_OFFERS = 10
+
+
+def random_offers(rng, n_offers, bundle_size):
+    offers = []
+    for _ in range(n_offers):
+        points = np.round(rng.uniform((81.9698,37.5281,81.9698,37.5281),(93.2898,46.2281,93.2898,46.2281),(bundle_size,4)), 3)
+        offers.append(([tuple(p[:2]) for p in points], [tuple(p[2:]) for p in points]))
+    return offers
+
+
+def added_distance(routing, loc_pickup, loc_dropoff):
+    if routing.bid_engine == 'insertion':
+        return routing.get_insertion_distance(routing.optimal_tour, include_pickups=loc_pickup, include_dropoffs=loc_dropoff)
+    with_offer = routing.get_optimal_tour(include_pickups=loc_pickup, include_dropoffs=loc_dropoff)
+    return float(with_offer['distance']) - float(routing.optimal_tour['distance'])
+
+
+def run(n_requests, bundle_size, seed=0):
+    np.random.seed(seed)
+    rng = np.random.default_rng(seed)
+    with contextlib.redirect_stdout(None):
+        routing = Routing('bench', n=n_requests)
+    routing.optimal_tour = routing.get_optimal_tour()
+    offers = random_offers(rng, N_OFFERS, bundle_size)
+    distances = {}
+    seconds = {}
+    for engine in ['exact', 'insertion']:
+        routing.bid_engine = engine
+        start = time.perf_counter()
+        distances[engine] = np.array([added_distance(routing, p, d) for p, d in offers])
+        seconds[engine] = (time.perf_counter() - start) / N_OFFERS
+    error = distances['insertion'] - distances['exact']
+    return [n_requests, bundle_size, round(seconds['exact']*1000, 2), round(seconds['insertion']*1000, 3),
+            round(seconds['exact']/seconds['insertion']), round(np.mean(distances['exact']), 3),
+            round(np.mean(error), 3), round(np.max(np.abs(error)), 3)]
+
+
+if __name__ == '__main__':
+    utils.load_transport_requests = lambda path, n: utils.generate_random_requests(n=n, show=False)
+    sizes = [int(n) for n in sys.argv[1:]] or [5, 10, 20]
+    rows = []
+    for n in sizes:
+        for bundle_size in [1, 2]:
+            rows.append(run(n, bundle_size))
+    print(tabulate(rows, headers=['requests', 'bundle', 'exact ms/bid', 'insertion ms/bid', 'speedup',
+                                  'mean exact distance', 'mean error', 'max |error|'], tablefmt='psql'))
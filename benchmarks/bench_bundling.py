@@ -0,0 +1,55 @@
+'''
+Compares the bundle methods of the auctioneer (revenue pairing, grid and k-means clustering) for random
+offers on a 100 x 100 grid. Reports the time of generate_bundles() and the mean distance of the lanes
+(pickup and dropoff, either direction) of a bundle to their mean lane, lower means closer lanes.
+
+    python benchmarks/bench_bundling.py [n_offers ...]
+'''
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure')))
+import numpy as np
+from tabulate import tabulate
+from auctioneer import Auctioneer
+from bundling import lane_features
+from offer import Offer
+
+METHODS = ['revenue', 'grid', 'kmeans']
+
+
+def random_auctioneer(n_offers, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 100, (n_offers, 4))
+    auctioneer = Auctioneer()
+    for i, (px, py, dx, dy) in enumerate(points):
+        auctioneer.offers.append(Offer(f'carrier_{i % 3}', f'offer{i}', {'pos_x': px, 'pos_y': py},
+                                       {'pos_x': dx, 'pos_y': dy}, profit=0, revenue=rng.uniform(50, 500)))
+    return auctioneer, points
+
+
+def spread(auctioneer, points):
+    features = lane_features(points[:, :2], points[:, 2:])
+    index = {offer.offer_id: i for i, offer in enumerate(auctioneer.offers)}
+    distances = []
+    for bundle in auctioneer.bundles.values():
+        lanes = features[[index[offer_id] for offer_id in bundle]]
+        distances.extend(np.linalg.norm(lanes - lanes.mean(axis=0), axis=1))
+    return np.mean(distances)
+
+
+def run(n_offers, method):
+    auctioneer, points = random_auctioneer(n_offers)
+    start = time.perf_counter()
+    auctioneer.generate_bundles(bundle_size=2, method=method)
+    elapsed = time.perf_counter() - start
+    return [n_offers, method, round(elapsed * 1000, 2), len(auctioneer.bundles), round(spread(auctioneer, points), 2)]
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [100, 1000, 10000]
+    rows = []
+    for n in sizes:
+        for method in METHODS:
+            rows.append(run(n, method))
+    print(tabulate(rows, headers=['offers', 'method', 'ms', 'bundles', 'spread'], tablefmt='psql'))
@@ -0,0 +1,41 @@
+'''
+Compares the exact dynamic program (solve_exact) with OR-Tools for small carriers on a
+100 x 100 grid. Reports the solve time and the tour distance of both solvers.
+
+    python benchmarks/bench_exact.py [n_requests ...]
+'''
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure')))
+import numpy as np
+from tabulate import tabulate
+from algorithm import AlgorithmBase
+
+
+def random_carrier(n_requests, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.integers(0, 100, (2*n_requests+1,2))
+    locations = [tuple(p) for p in points]
+    assignments = [[2*i+1, 2*i+2] for i in range(n_requests)]
+    return locations, assignments
+
+
+def run(n_requests, exact_max_requests):
+    locations, assignments = random_carrier(n_requests)
+    algorithm = AlgorithmBase(locations, assignments)
+    algorithm.exact_max_requests = exact_max_requests
+    algorithm.warm_start = False
+    start = time.perf_counter()
+    result = algorithm.get_optimal_tour()
+    return (time.perf_counter() - start) * 1000, result['distance']
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or list(range(1, 10))
+    rows = []
+    for n in sizes:
+        exact_ms, exact_distance = run(n, n)
+        ortools_ms, ortools_distance = run(n, 0)
+        rows.append([n, round(exact_ms, 2), round(ortools_ms, 2), exact_distance, ortools_distance])
+    print(tabulate(rows, headers=['requests', 'exact ms', 'ortools ms', 'exact distance', 'ortools distance'], tablefmt='psql'))
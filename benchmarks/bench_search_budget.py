@@ -0,0 +1,47 @@
+'''
+Compares the former fixed 2 s time limit with the size-scaled SearchBudget (with stagnation stop)
+and the deterministic budget. Reports wall time, tour distance and whether the stagnation monitor
+stopped the search for random carriers on a 100 x 100 grid.
+
+    python benchmarks/bench_search_budget.py [n_requests ...]
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure')))
+import numpy as np
+from tabulate import tabulate
+from algorithm import AlgorithmBase
+from search_budget import SearchBudget
+
+BUDGETS = {
+    'fixed 2s': SearchBudget(2000, 0, 2000, stagnation_ms=0, stagnation_solutions=0),
+    'adaptive': SearchBudget(),
+    'deterministic': SearchBudget(deterministic=True),
+}
+
+
+def random_carrier(n_requests, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.integers(0, 100, (2*n_requests+1,2))
+    locations = [tuple(p) for p in points]
+    assignments = [[2*i+1, 2*i+2] for i in range(n_requests)]
+    return locations, assignments
+
+
+def run(n_requests, budget):
+    locations, assignments = random_carrier(n_requests)
+    algorithm = AlgorithmBase(locations, assignments)
+    algorithm.exact_max_requests = 0 # OR-Tools only
+    algorithm.search_budget = BUDGETS[budget]
+    result = algorithm.get_optimal_tour()
+    stats = algorithm.search_stats
+    return [n_requests, budget, stats['time_limit_ms'], stats['wall_time'], stats['solutions'], stats['stagnated'], result['distance']]
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [2, 10, 25, 40]
+    rows = []
+    for n in sizes:
+        for budget in BUDGETS:
+            rows.append(run(n, budget))
+    print(tabulate(rows, headers=['requests', 'budget', 'limit ms', 'wall ms', 'solutions', 'stagnated', 'distance'], tablefmt='psql'))
@@ -0,0 +1,87 @@
+'''
+Compares the threaded auctioneer server (a thread per connection) with the asyncio server (one
+event loop) under concurrent carriers. Every carrier sends register requests, over a new connection
+each or over one session connection; the server runs in its own process in the registration phase.
+Reports the requests per second and the median and p99 latency of a request.
+
+    python benchmarks/bench_server.py [n_carriers ...]
+'''
+import sys
+import os
+import time
+import socket
+import threading
+import multiprocessing
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure')))
+import numpy as np
+from tabulate import tabulate
+from auctioneer_server import AuctioneerServer
+from async_server import AsyncAuctioneerServer
+from requests_handler import RequestHandler
+
+SERVERS = {'threaded': AuctioneerServer, 'asyncio': AsyncAuctioneerServer}
+HOST = '127.0.0.1'
+PORT = 12990
+REQUESTS = 20 # per carrier
+
+
+def serve(mode, port):
+    sys.stdout = open(os.devnull, 'w') # the threaded server logs every connection
+    server = SERVERS[mode](host=HOST, port=port)
+    server.handle_connections()
+
+
+def wait_for_server(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def carrier(carrier_id, port, latencies, session):
+    handler = RequestHandler(carrier_id, HOST, port, session=session)
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        try:
+            response = handler.register()
+        except OSError:
+            continue # reset by the server, counted as failed
+        if 'error' not in response:
+            latencies.append(time.perf_counter() - start)
+    handler.close_session()
+
+
+def run(n_carriers, mode, session, port):
+    server = multiprocessing.Process(target=serve, args=(mode, port), daemon=True)
+    server.start()
+    wait_for_server(port)
+    latencies = []
+    carriers = [threading.Thread(target=carrier, args=(f"carrier_{i}", port, latencies, session)) for i in range(n_carriers)]
+    start = time.perf_counter()
+    for thread in carriers:
+        thread.start()
+    for thread in carriers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.terminate()
+    server.join()
+    ms = np.array(latencies) * 1000
+    failed = n_carriers * REQUESTS - len(latencies)
+    return [n_carriers, mode, session, round(len(latencies) / elapsed), round(float(np.median(ms)), 2),
+            round(float(np.percentile(ms, 99)), 2), failed]
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [10, 50, 200]
+    rows = []
+    port = PORT
+    for n in sizes:
+        for mode in SERVERS:
+            for session in (False, True):
+                rows.append(run(n, mode, session, port))
+                port += 1
+    print(tabulate(rows, headers=['carriers', 'server', 'session', 'req/s', 'p50 ms', 'p99 ms', 'failed'], tablefmt='psql'))
@@ -0,0 +1,44 @@
+'''
+Compares the 'callback' and 'matrix' transit modes of AlgorithmBase.calculate_optimal_tour.
+Reports how many search branches and solutions the solver gets through in the same
+time limit for random carriers on a 100 x 100 grid.
+
+    python benchmarks/bench_transit.py [n_requests ...]
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure')))
+import numpy as np
+from tabulate import tabulate
+from algorithm import AlgorithmBase
+from search_budget import SearchBudget
+
+
+def random_carrier(n_requests, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.integers(0, 100, (2*n_requests+1,2))
+    locations = [tuple(p) for p in points]
+    assignments = [[2*i+1, 2*i+2] for i in range(n_requests)]
+    return locations, assignments
+
+
+def run(n_requests, transit_mode, time_limit_ms=2000):
+    locations, assignments = random_carrier(n_requests)
+    algorithm = AlgorithmBase(locations, assignments)
+    algorithm.exact_max_requests = 0 # OR-Tools only
+    algorithm.transit_mode = transit_mode
+    # fixed time limit without early stop
+    algorithm.search_budget = SearchBudget(time_limit_ms, 0, time_limit_ms, stagnation_ms=0, stagnation_solutions=0)
+    result = algorithm.get_optimal_tour()
+    stats = algorithm.search_stats
+    branches_per_second = stats['branches'] / max(stats['wall_time'], 1) * 1000
+    return [n_requests, transit_mode, stats['branches'], stats['solutions'], stats['wall_time'], round(branches_per_second), result['distance']]
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [5, 10, 25, 50]
+    rows = []
+    for n in sizes:
+        for mode in ['callback', 'matrix']:
+            rows.append(run(n, mode))
+    print(tabulate(rows, headers=['requests', 'transit', 'branches', 'solutions', 'wall ms', 'branches/s', 'distance'], tablefmt='psql'))
@@ -0,0 +1,62 @@
+'''
+Compares cold starts (PARALLEL_CHEAPEST_INSERTION) with warm starts from the previous tour.
+For random carriers the tour is solved once, then re-solved with one request added and with
+one request removed. Reports the wall time and the tour distance of both start modes, and the
+time each mode needed to reach the final solution quality (objective) of the cold start.
+
+    python benchmarks/bench_warm_start.py [n_requests ...]
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure')))
+import numpy as np
+from tabulate import tabulate
+from algorithm import AlgorithmBase
+from search_budget import SearchBudget
+
+
+def random_carrier(n_requests, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.integers(0, 100, (2*n_requests+3,2))
+    locations = [tuple(p) for p in points[:-2]]
+    assignments = [[2*i+1, 2*i+2] for i in range(n_requests)]
+    return locations, assignments, [tuple(points[-2])], [tuple(points[-1])]
+
+
+def solve(algorithm, warm_start, **kwargs):
+    previous_route = algorithm.previous_route
+    algorithm.warm_start = warm_start
+    result = algorithm.get_optimal_tour(**kwargs)
+    algorithm.previous_route = previous_route
+    return algorithm.search_stats['wall_time'], result['distance'], algorithm.search_stats['trace']
+
+
+def time_to_quality(trace, objective):
+    return next((ms for ms, value in trace if value <= objective), None)
+
+
+def run(n_requests, time_limit_ms=2000):
+    locations, assignments, pickup, dropoff = random_carrier(n_requests)
+    algorithm = AlgorithmBase(locations, assignments)
+    algorithm.exact_max_requests = 0 # OR-Tools only
+    # fixed time limit without early stop
+    algorithm.search_budget = SearchBudget(time_limit_ms, 0, time_limit_ms, stagnation_ms=0, stagnation_solutions=0)
+    algorithm.trace_search = True
+    algorithm.get_optimal_tour()
+    rows = []
+    for change, kwargs in [('add', {'include_pickups': pickup, 'include_dropoffs': dropoff}), ('remove', {'ignore_indices': [0]})]:
+        cold_ms, cold_distance, cold_trace = solve(algorithm, False, **kwargs)
+        warm_ms, warm_distance, warm_trace = solve(algorithm, True, **kwargs)
+        objective = cold_trace[-1][1]
+        rows.append([n_requests, change, cold_ms, warm_ms, cold_distance, warm_distance,
+                     time_to_quality(cold_trace, objective), time_to_quality(warm_trace, objective)])
+    return rows
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [5, 10, 25, 50]
+    rows = []
+    for n in sizes:
+        rows.extend(run(n))
+    print(tabulate(rows, headers=['requests', 'change', 'cold ms', 'warm ms', 'cold distance', 'warm distance',
+                                  'cold ms to quality', 'warm ms to quality'], tablefmt='psql'))
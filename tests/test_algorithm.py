@@ -0,0 +1,308 @@
+import unittest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure')))
+from algorithm import AlgorithmBase
+from local_search import cheapest_insertion, removal_savings
+from search_budget import SearchBudget
+from exact_solver import solve_exact
+from tour_cache import TourCache
+from location_store import LocationStore
+from solver_executor import SolverExecutor, shared_executor
+from routing_backend import RoutingBackend, create_backend
+import itertools
+import threading
+import utilities as utils
+import numpy as np
+
+class Test_Algorithm(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(Test_Algorithm, self).__init__(*args, **kwargs)
+        rng = np.random.default_rng(9)
+        self.locations = [tuple(p) for p in rng.integers(0, 100, (9,2)).tolist()]
+        self.assignments = [[1,2], [3,4], [5,6], [7,8]]
+
+    def test_transit_modes_agree(self):
+        distances = []
+        for mode in ['callback', 'matrix']:
+            algorithm = AlgorithmBase(self.locations[:], [a[:] for a in self.assignments])
+            algorithm.transit_mode = mode
+            algorithm.exact_max_requests = 0
+            distances.append(algorithm.get_optimal_tour()['distance'])
+        self.assertEqual(distances[0], distances[1])
+
+    def test_distance_matrix_scaled(self):
+        locations = [(81.9698, 37.5281), (82.1234, 37.6), (93.2898, 46.2281)]
+        dist_mat = utils.create_distance_matrix(locations, mode="manhattan", scale=1000)
+        for i, x in enumerate(locations):
+            for j, y in enumerate(locations):
+                self.assertEqual(dist_mat[i][j], round((abs(x[0] - y[0]) + abs(x[1] - y[1])) * 1000))
+        euclid = utils.create_distance_matrix(locations, mode="euclid", scale=1000)
+        self.assertEqual(euclid[0][2], round(np.hypot(93.2898-81.9698, 46.2281-37.5281) * 1000))
+        self.assertEqual(dist_mat.dtype, np.int64)
+
+    def test_incremental_distance_matrix(self):
+        algorithm = AlgorithmBase(self.locations[:5], [[1,2], [3,4]])
+        algorithm.add_locations(self.locations[5::2], self.locations[6::2])
+        algorithm.remove_requests([1])
+        algorithm.add_locations([(1.5, 2.5)]*20, [(3.25, 4.0)]*20)
+        full = algorithm.create_distance_matrix(algorithm.locations)
+        np.testing.assert_array_equal(algorithm.distance_matrix.get_matrix(), full)
+        # including locations for a bid must not change the carrier's tour
+        n = len(algorithm.locations)
+        data = algorithm.create_tour_data(ignore_indices=[0], include_pickups=[(7, 7)], include_dropoffs=[(8, 8)])
+        self.assertEqual(len(algorithm.locations), n)
+        np.testing.assert_array_equal(data["distance_matrix"], algorithm.create_distance_matrix(algorithm.locations[:1] + algorithm.locations[3:] + [(7, 7), (8, 8)]))
+
+    def test_filter_requests_by_index(self):
+        algorithm = AlgorithmBase(self.locations[:], [a[:] for a in self.assignments])
+        locations, assignments = algorithm.filter_requests_by_index([3, 0])
+        self.assertEqual(locations.tolist(), [list(self.locations[i]) for i in [0, 3, 4, 5, 6]])
+        self.assertEqual(assignments.tolist(), [[1, 2], [3, 4]])
+        data = algorithm.create_tour_data(ignore_indices=[1, 2], include_pickups=[(1, 1)], include_dropoffs=[(2, 2)])
+        self.assertEqual(data["pickups_deliveries"], [[1, 2], [3, 4], [5, 6]])
+        self.assertEqual(len(data["distance_matrix"]), 7)
+
+    def test_cheapest_insertion(self):
+        dist_mat = utils.create_distance_matrix(self.locations, scale=1)
+        route = [0, 1, 3, 2, 4, 0]
+        length = lambda r: sum(dist_mat[a][b] for a, b in zip(r[:-1], r[1:]))
+        # brute force over all positions with the pickup before the dropoff
+        best = min(length(r[:j] + [6] + r[j:]) for i in range(1, len(route)) for r in [route[:i] + [5] + route[i:]]
+                   for j in range(i+1, len(r))) - length(route)
+        new_route, delta = cheapest_insertion(dist_mat, route, 5, 6)
+        self.assertEqual(delta, best)
+        self.assertEqual(length(new_route) - length(route), delta)
+        self.assertLess(new_route.index(5), new_route.index(6))
+
+    def test_get_optimal_tours_in_order(self):
+        algorithm = AlgorithmBase(self.locations[:], [a[:] for a in self.assignments])
+        algorithm.warm_start = False
+        tour_requests = [{'ignore_indices': [i]} for i in range(len(self.assignments))]
+        serial = [algorithm.get_optimal_tour(**kwargs)['distance'] for kwargs in tour_requests]
+        algorithm.solver_executor = SolverExecutor(2)
+        algorithm.solver_executor.workers = 2 # force the process pool
+        self.assertEqual([tour['distance'] for tour in algorithm.get_optimal_tours(tour_requests)], serial)
+        algorithm.solver_executor.shutdown()
+
+    def test_solver_executor_reuses_pool(self):
+        executor = SolverExecutor(2)
+        executor.workers = 2 # also on a single core
+        self.assertEqual(executor.map(abs, [-1, -2, 3]), [1, 2, 3])
+        pool = executor.pool
+        self.assertEqual(executor.map(abs, [-4, 5]), [4, 5])
+        self.assertIs(executor.pool, pool)
+        executor.shutdown()
+        self.assertIsNone(executor.pool)
+
+    def test_shared_executor(self):
+        self.assertIs(shared_executor(1), shared_executor(1))
+        self.assertIsNone(shared_executor(1).pool)
+
+    def test_warm_start(self):
+        rng = np.random.default_rng(3)
+        locations = [tuple(p) for p in rng.integers(0, 100, (17,2)).tolist()]
+        assignments = [[2*i+1, 2*i+2] for i in range(8)]
+        algorithm = AlgorithmBase(locations, assignments)
+        algorithm.exact_max_requests = 0
+        algorithm.tour_cache = None
+        algorithm.get_optimal_tour()
+        self.assertEqual((algorithm.previous_route[0], algorithm.previous_route[-1]), (0, 0))
+        # request 2 (stops 5 and 6) is sold, a new request is bought
+        algorithm.update_locations_and_assignments([2], [(50, 50)], [(10, 90)])
+        data = algorithm.create_tour_data()
+        route = algorithm.create_initial_route(data)
+        stops = data["stop_ids"][route].tolist()
+        self.assertNotIn(5, stops)
+        self.assertNotIn(6, stops)
+        # every other node once, the solver adds the depot at the start and the end
+        self.assertEqual(sorted(route), list(range(1, len(data["stop_ids"]))))
+        pickup, dropoff = data["pickups_deliveries"][-1]
+        self.assertLess(route.index(pickup), route.index(dropoff))
+        warm = algorithm.get_optimal_tour()
+        cold_algorithm = AlgorithmBase(algorithm.locations, algorithm.assignments)
+        cold_algorithm.exact_max_requests = 0
+        cold_algorithm.tour_cache = None
+        cold_algorithm.warm_start = False
+        cold = cold_algorithm.get_optimal_tour()
+        tour = [int(node) for node in warm['optimalTour']]
+        self.assertEqual((tour[0], tour[-1]), (0, 0))
+        self.assertEqual(sorted(tour[1:-1]), list(range(1, len(data["stop_ids"]))))
+        for pickup, dropoff in data["pickups_deliveries"]:
+            self.assertLess(tour.index(pickup), tour.index(dropoff))
+        self.assertLessEqual(warm['distance'], cold['distance'])
+
+    def test_removal_savings(self):
+        dist_mat = utils.create_distance_matrix(self.locations, scale=1)
+        route = [0, 3, 1, 2, 5, 4, 7, 6, 8, 0]
+        length = lambda r: sum(dist_mat[a][b] for a, b in zip(r[:-1], r[1:]))
+        savings = removal_savings(dist_mat, route, self.assignments)
+        for (pickup, dropoff), saving in zip(self.assignments, savings):
+            self.assertEqual(saving, length(route) - length([node for node in route if node not in (pickup, dropoff)]))
+        # re-optimizing around the removed request never saves less
+        self.assertTrue((removal_savings(dist_mat, route, self.assignments, window=3) >= savings).all())
+
+    def test_marginal_distances_removal(self):
+        algorithm = AlgorithmBase(self.locations[:], [a[:] for a in self.assignments])
+        tour = algorithm.get_optimal_tour()
+        margins = algorithm.get_marginal_distances(tour, mode='removal')
+        self.assertEqual(len(margins), len(self.assignments))
+        # splicing out a request cannot beat solving the tour without it
+        resolved = algorithm.get_marginal_distances(tour, mode='resolve')
+        for margin, resolve in zip(margins, resolved):
+            self.assertLessEqual(margin, resolve + 1e-9)
+
+    def test_search_budget(self):
+        budget = SearchBudget(base_ms=50, per_node_ms=10, max_ms=300)
+        self.assertEqual(budget.time_limit_ms(5), 100)
+        self.assertEqual(budget.time_limit_ms(1000), 300)
+        algorithm = AlgorithmBase(self.locations[:], [a[:] for a in self.assignments])
+        algorithm.search_budget = budget
+        algorithm.exact_max_requests = 0
+        algorithm.get_optimal_tour()
+        self.assertLessEqual(algorithm.search_stats['wall_time'], budget.time_limit_ms(len(self.locations)) + 50)
+
+    def test_deterministic_search(self):
+        tours = []
+        for _ in range(2):
+            algorithm = AlgorithmBase(self.locations[:], [a[:] for a in self.assignments])
+            algorithm.search_budget = SearchBudget(deterministic=True)
+            algorithm.exact_max_requests = 0
+            algorithm.get_optimal_tour()
+            # the second solve would warm start from the first one without the deterministic budget
+            tours.append(algorithm.get_optimal_tour(ignore_indices=[1]))
+        self.assertEqual(tours[0], tours[1])
+        self.assertIsNone(algorithm.search_stats['time_limit_ms'])
+
+    def test_exact_solver(self):
+        dist_mat = utils.create_distance_matrix(self.locations, scale=1)
+        length = lambda r: sum(dist_mat[a][b] for a, b in zip(r[:-1], r[1:]))
+        nodes = [node for request in self.assignments for node in request]
+        best = min(length([0, *order, 0]) for order in itertools.permutations(nodes)
+                   if all(order.index(p) < order.index(d) for p, d in self.assignments))
+        route, distance = solve_exact(dist_mat, self.assignments)
+        self.assertEqual(distance, best)
+        self.assertEqual(length(route), best)
+        self.assertTrue(all(route.index(p) < route.index(d) for p, d in self.assignments))
+
+    def test_exact_marginal_distances(self):
+        algorithm = AlgorithmBase(self.locations[:], [a[:] for a in self.assignments])
+        tour = algorithm.get_optimal_tour()
+        self.assertEqual(algorithm.search_stats['solver'], 'exact')
+        # optimal tours with and without a request: the marginal distance is never negative
+        for margin in algorithm.get_marginal_distances(tour):
+            self.assertGreaterEqual(margin, 0)
+
+    def test_backend_interface(self):
+        class IncompleteBackend(RoutingBackend):
+            name = 'incomplete'
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+        self.assertIsInstance(create_backend('local_search'), RoutingBackend)
+
+    def test_local_search_backend(self):
+        rng = np.random.default_rng(3)
+        locations = [tuple(p) for p in rng.integers(0, 100, (21,2)).tolist()]
+        assignments = [[2*i+1, 2*i+2] for i in range(10)]
+        distances = {}
+        for backend in ['local_search', 'ortools']:
+            algorithm = AlgorithmBase(locations[:], [a[:] for a in assignments])
+            algorithm.routing_backend = backend
+            algorithm.exact_max_requests = 0
+            tour = algorithm.get_optimal_tour()
+            route = [int(node) for node in tour['optimalTour']]
+            self.assertEqual(algorithm.search_stats['solver'], backend)
+            self.assertEqual(sorted(route[1:-1]), list(range(1, 21)))
+            self.assertTrue(all(route.index(p) < route.index(d) for p, d in assignments))
+            self.assertEqual(algorithm.get_backend().evaluate(algorithm.create_distance_matrix(locations), route), tour['distance'] * algorithm.distance_scale)
+            distances[backend] = tour['distance']
+        self.assertLessEqual(distances['local_search'], distances['ortools'] * 1.1)
+
+    def test_tour_cache(self):
+        cache = TourCache(max_entries=2, ttl_seconds=0)
+        cache.put('a', (1,))
+        cache.put('b', (2,))
+        self.assertEqual(cache.get('a'), (1,))
+        cache.put('c', (3,)) # evicts 'b', the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+        cache = TourCache(ttl_seconds=1e-9)
+        cache.put('a', (1,))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.expirations, 1)
+        cache = TourCache(max_bytes=200)
+        cache.put('a', tuple(range(100)))
+        self.assertEqual(len(cache), 0)
+
+    def test_tour_cache_threads(self):
+        cache = TourCache(max_entries=50, ttl_seconds=0)
+        def worker(n):
+            for i in range(2000):
+                key = (n * 7 + i) % 80
+                if cache.get(key) is None:
+                    cache.put(key, (key,) * (key % 5))
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the LRU order and the size stay consistent with the entries
+        self.assertLessEqual(len(cache), 50)
+        self.assertEqual(cache.size, sum(size for _, size, _ in cache.entries.values()))
+        stats = cache.get_stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 8 * 2000)
+
+    def test_tour_cache_hit(self):
+        algorithm = AlgorithmBase(self.locations[:], [a[:] for a in self.assignments])
+        algorithm.exact_max_requests = 0
+        first = algorithm.get_optimal_tour(ignore_indices=[2])
+        self.assertNotIn('cache_hit', algorithm.search_stats)
+        # same requests in another order give the same key
+        algorithm.assignments = [algorithm.assignments[i] for i in [3, 1, 0, 2]]
+        self.assertEqual(algorithm.get_optimal_tour(ignore_indices=[3]), first)
+        self.assertTrue(algorithm.search_stats['cache_hit'])
+        # tours solved on the pool are cached as well
+        algorithm.get_optimal_tours([{'ignore_indices': [0]}])
+        self.assertEqual(algorithm.tour_cache.get_stats()['entries'], 2)
+
+    def test_added_distance_bound(self):
+        algorithm = AlgorithmBase(self.locations[:5], [[1,2], [3,4]])
+        algorithm.exact_max_requests = 3
+        tour = algorithm.get_optimal_tour()
+        rng = np.random.default_rng(3)
+        for pickup, dropoff in rng.integers(-100, 200, (20, 2, 2)).tolist():
+            bound = algorithm.get_added_distance_bound([pickup], [dropoff])
+            added = algorithm.get_optimal_tour(include_pickups=[pickup], include_dropoffs=[dropoff])['distance'] - tour['distance']
+            self.assertLessEqual(bound, added)
+            self.assertLessEqual(bound, algorithm.get_insertion_distance(tour, include_pickups=[pickup], include_dropoffs=[dropoff]))
+        self.assertEqual(algorithm.get_added_distance_bound([self.locations[1]], [self.locations[2]]), 0)
+
+    def test_location_store(self):
+        store = LocationStore(self.locations[:5], [[1,2], [3,4]])
+        store.append(self.locations[5::2], self.locations[6::2])
+        # without tombstones the coordinates are a view into the store
+        self.assertTrue(np.shares_memory(store.get_coordinates(), store.points))
+        np.testing.assert_array_equal(store.get_coordinates(), self.locations)
+        # deleted requests are flagged until they outnumber the live ones
+        np.testing.assert_array_equal(store.delete([1]), [0, 1, 2, 5, 6, 7, 8])
+        self.assertEqual((len(store), store.tombstones), (7, 1))
+        self.assertEqual(store.get_assignments().tolist(), [[1,2], [3,4], [5,6]])
+        store.delete([0, 2])
+        self.assertEqual((store.size, store.tombstones), (3, 0))
+        self.assertEqual(store.get_locations(), [self.locations[i] for i in [0, 5, 6]])
+        self.assertEqual(store.get_assignments().tolist(), [[1,2]])
+
+    def test_remove_requests_store(self):
+        algorithm = AlgorithmBase(self.locations[:], [a[:] for a in self.assignments])
+        algorithm.remove_requests([0])
+        algorithm.add_locations([(1, 1)], [(2, 2)])
+        algorithm.remove_requests([2])
+        locations = [self.locations[i] for i in [0, 3, 4, 5, 6]] + [(1, 1), (2, 2)]
+        self.assertEqual(algorithm.locations, locations)
+        self.assertEqual(algorithm.assignments, [[1,2], [3,4], [5,6]])
+        np.testing.assert_array_equal(algorithm.distance_matrix.get_matrix(), algorithm.create_distance_matrix(locations))
+
+
+if __name__ == '__main__':
+    unittest.main()
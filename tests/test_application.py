@@ -0,0 +1,139 @@
+import unittest
+import sys
+import os
+import importlib
+import threading
+from unittest import mock
+import numpy as np
+
+APPLICATION = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Application'))
+AGENT_INFRASTRUCTURE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure'))
+
+
+def import_application(*names):
+    '''Imports modules of the web app. They have the same names as the modules of Agent_Infrastructure
+    that the other tests import, so they are imported on their own and taken out of sys.modules again
+    (the third party modules they import stay).
+
+    Args:
+        names (str): Module names.
+
+    Returns:
+        list: The modules.
+    '''
+    saved = sys.modules.copy()
+    for name, module in saved.items():
+        if os.path.dirname(getattr(module, '__file__', None) or '') == AGENT_INFRASTRUCTURE:
+            del sys.modules[name]
+    sys.path.insert(0, APPLICATION)
+    try:
+        return [importlib.import_module(name) for name in names]
+    finally:
+        sys.path.remove(APPLICATION)
+        for name, module in list(sys.modules.items()):
+            if os.path.dirname(getattr(module, '__file__', None) or '') == APPLICATION:
+                del sys.modules[name]
+        sys.modules.update(saved)
+
+
+tour_calculation, auctioneer, async_server, requests_handler, offer, search_budget, tour_cache = import_application(
+    'tour_calculation', 'auctioneer', 'async_server', 'requests_handler', 'offer', 'search_budget', 'tour_cache')
+
+
+class Test_Application(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(Test_Application, self).__init__(*args, **kwargs)
+        rng = np.random.default_rng(9)
+        self.locations = [tuple(p) for p in rng.integers(0, 100, (9,2)).tolist()]
+        self.assignments = [[1,2], [3,4], [5,6], [7,8]]
+
+    def test_config_switches(self):
+        self.assertIn(auctioneer.round_mode, ['sequential', 'simultaneous', 'pipelined', 'combinatorial'])
+        self.assertIn(auctioneer.bundle_method, ['revenue', 'grid', 'kmeans'])
+        self.assertIn(auctioneer.server_mode, ['threaded', 'asyncio'])
+        self.assertIn(tour_calculation.MARGINAL_COST_MODE, ['resolve', 'removal'])
+        self.assertIn(tour_calculation.ROUTING_BACKEND, ['ortools', 'local_search', 'exact'])
+
+    def test_get_optimal_tour(self):
+        data = tour_calculation.create_tour_data(self.locations, self.assignments)
+        cache = tour_cache.TourCache()
+        tours = {}
+        for backend in ['ortools', 'local_search']:
+            tours[backend] = tour_calculation.get_optimal_tour(data, backend=backend, cache=cache)
+            route = [int(node) for node in tours[backend]['optimalTour']]
+            self.assertEqual(sorted(route[:-1]), list(range(len(self.locations))))
+            for pickup, dropoff in self.assignments:
+                self.assertLess(route.index(pickup), route.index(dropoff))
+        # the backend is part of the key, the same request again is a hit
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assertEqual(tour_calculation.get_optimal_tour(data, backend='ortools', cache=cache), tours['ortools'])
+        self.assertEqual(cache.hits, 1)
+
+    def test_search_budget(self):
+        budget = search_budget.SearchBudget(base_ms=50, per_node_ms=10, max_ms=300)
+        self.assertEqual(budget.time_limit_ms(5), 100)
+        self.assertEqual(budget.time_limit_ms(1000), 300)
+        data = tour_calculation.create_tour_data(self.locations, self.assignments)
+        deterministic = search_budget.SearchBudget(deterministic=True)
+        tours = [tour_calculation.get_optimal_tour(data, search_budget=deterministic, backend='ortools', cache=None) for _ in range(2)]
+        self.assertEqual(tours[0], tours[1])
+
+    def test_removal_distances(self):
+        data = tour_calculation.create_tour_data(self.locations, self.assignments)
+        tour = tour_calculation.get_optimal_tour(data, cache=None)
+        distances = tour_calculation.get_removal_distances(data, tour)
+        self.assertEqual(len(distances), len(self.assignments))
+        self.assertTrue(all(distance >= 0 for distance in distances))
+        # splicing out a request cannot beat solving the tour without it
+        for i, distance in enumerate(distances):
+            keep = [0] + [n for j, pair in enumerate(self.assignments) if j != i for n in pair]
+            remaining = [[keep.index(p), keep.index(d)] for j, (p, d) in enumerate(self.assignments) if j != i]
+            without = tour_calculation.get_optimal_tour(
+                tour_calculation.create_tour_data([self.locations[n] for n in keep], remaining), cache=None)
+            self.assertLessEqual(distance, tour['distance'] - without['distance'] + 1e-9)
+
+    @unittest.skipUnless(importlib.util.find_spec('networkx'), "handle_files needs networkx (create_plot)")
+    def test_cost_list_removal(self):
+        handle_files, = import_application('handle_files')
+        costs = handle_files.get_cost_list(self.locations, self.assignments, 10, 2, mode='removal')
+        data = tour_calculation.create_tour_data(self.locations, self.assignments)
+        distances = tour_calculation.get_removal_distances(data, tour_calculation.get_optimal_tour(data))
+        self.assertEqual(costs, [round(10 + 2 * (distance / 1000), 2) for distance in distances])
+
+    def test_bundle_methods(self):
+        auction = auctioneer.Auctioneer(mock.Mock())
+        for i in range(8):
+            base = 0 if i % 2 else 1000
+            auction.offers.append(offer.Offer('carrier_1', f'offer{i}', {'pos_x': base + i, 'pos_y': base},
+                                              {'pos_x': base + 50, 'pos_y': base + i}, revenue=100 + i, min_price=10))
+        for method in ['revenue', 'grid', 'kmeans']:
+            auction.bundles = {}
+            auction.generate_bundles(bundle_size=1, method=method)
+            bundles = list(auction.bundles.values())
+            self.assertEqual(sorted(offer_id for bundle in bundles for offer_id in bundle), sorted(f'offer{i}' for i in range(8)))
+        with self.assertRaises(ValueError):
+            auction.generate_bundles(method='nearest')
+        # an item of a simultaneous round holds every bundle of the round
+        lots = auction.get_round_lots(bundle_round=True)
+        self.assertEqual(sorted(auction.put_on_auction(lots).indices), list(range(8)))
+        auction.actor.stop()
+
+    def test_async_server(self):
+        socketio = mock.Mock()
+        server = async_server.AsyncAuctioneerServer(socketio, host='127.0.0.1', port=0)
+        threading.Thread(target=server.handle_connections, daemon=True).start()
+        self.assertTrue(server.wait_until_started(5))
+        port = server.server.sockets[0].getsockname()[1]
+        for session in (False, True):
+            carrier = requests_handler.RequestHandler(f'carrier_{int(session)}', socketio, '127.0.0.1', port, session=session)
+            self.assertEqual(carrier.register()['payload'], {"status": "OK"})
+            self.assertEqual(carrier.register()['payload'], {"status": "ALREADY_REGISTERED"})
+            carrier.close_session()
+        self.assertEqual(server.auctioneer.registered_carriers, ['carrier_0', 'carrier_1'])
+        server.loop.call_soon_threadsafe(server.server.close)
+        server.auctioneer.actor.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,20 @@ import unittest
 import sys
 #sys.path.insert(0, '/group09/Agent_Infrastructure')
 import os
+import threading
+import json
+import socket
+import time
+from unittest import mock
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Agent_Infrastructure')))
 from offer import Offer
 from auctioneer import Auctioneer
+from phase_scheduler import PhaseScheduler, AuctionItem, Pipeline
+from winner_determination import solve_winner_determination, greedy_allocation
+from bid_book import BidBook, clear
+from state_actor import StateActor
+from async_server import AsyncAuctioneerServer
+from requests_handler import RequestHandler
 import utilities as utils
 
 # from Agent_Infrastructure.offer import Offer
@@ -50,6 +61,25 @@ class Test_Auctioneer(unittest.TestCase):
         expected_bundles = [['offer5', 'offer2', 'offer4', 'offer1'], ['offer6', 'offer3']]
         self.assertEqual(bundles, expected_bundles)
 
+    def test_spatial_bundles(self):
+        # two regions far apart with 8 offers each, the lanes of a region run in both directions
+        self.auctioneer.offers.clear()
+        for i in range(16):
+            base = 0 if i % 2 else 1000
+            pickup, dropoff = {'pos_x': base + i, 'pos_y': base}, {'pos_x': base + 50, 'pos_y': base + i}
+            if i % 4 < 2:
+                pickup, dropoff = dropoff, pickup
+            self.auctioneer.offers.append(Offer('carrier_1', f'offer{i}', pickup, dropoff, revenue=100, profit=10))
+        for method in ['grid', 'kmeans']:
+            self.auctioneer.generate_bundles(bundle_size=1, method=method)
+            bundles = list(self.auctioneer.bundles.values())
+            self.assertEqual(sorted(offer_id for bundle in bundles for offer_id in bundle), sorted(f'offer{i}' for i in range(16)))
+            self.assertTrue(all(len(bundle) <= 2 for bundle in bundles))
+            for bundle in bundles:
+                self.assertEqual(len({int(offer_id[5:]) % 2 for offer_id in bundle}), 1, f"{method}: {bundle}")
+        with self.assertRaises(ValueError):
+            self.auctioneer.generate_bundles(method='nearest')
+
     def test_check_active_carriers(self):
         self.auctioneer.registered_carriers = ['carrier1', 'carrier2']
         self.auctioneer.active_carriers = ['carrier1']
@@ -73,16 +103,225 @@ class Test_Auctioneer(unittest.TestCase):
         self.auctioneer.offers[2].bids = {'bid1': 40, 'bid2': 25}
         self.assertFalse(self.auctioneer.valide_bids_for_unsold_offer())
 
+    def test_bid_book(self):
+        book = BidBook({'carrier_1': 100, 'carrier_2': 150, 'carrier_3': 120})
+        self.assertEqual(book.best(), [('carrier_2', 150), ('carrier_3', 120)])
+        self.assertEqual(clear(book, 90), ('carrier_2', 150))
+        self.assertEqual(clear(book, 90, 'vickrey'), ('carrier_2', 120))
+        self.assertEqual(clear(book, 130, 'vickrey'), ('carrier_2', 150))
+        self.assertEqual(clear(book, 130, 'reserve'), ('carrier_2', 130))
+        self.assertIsNone(clear(book, 150, 'reserve'))
+        # lowering one of the best bids brings back a bid outside the cache
+        book.add('carrier_2', 50)
+        self.assertEqual(book.best(), [('carrier_3', 120), ('carrier_1', 100)])
+        self.assertEqual(BidBook({'carrier_1': 80}).second_highest(), None)
+        with self.assertRaises(ValueError):
+            clear(book, 0, 'english')
+        # the highest bid wins, not the lowest
+        offer = self.auctioneer.offers[0]
+        offer.bids = {'carrier_1': 300, 'carrier_2': 200, 'carrier_3': 150}
+        offer.update_results(mode='vickrey')
+        self.assertEqual((offer.winner, offer.winning_bid), ('carrier_1', 200))
+
     def test_calculate_share(self):
         self.auctioneer.generate_bundles(bundle_size=2)
         current_bundle_set = set(self.auctioneer.bundles[0])
-        self.auctioneer.indices_on_auction = [i for i, offer in enumerate(self.auctioneer.offers) if offer.offer_id in current_bundle_set]
+        indices = [i for i, offer in enumerate(self.auctioneer.offers) if offer.offer_id in current_bundle_set]
         bid = 500
-        share = self.auctioneer.calculate_share('offer1', bid)
+        share = self.auctioneer.calculate_share('offer1', bid, indices)
         total_revenue = 280 + 400 + 220 + 100
         single_revenue = 280
         expected_share = (single_revenue/total_revenue) * bid 
         self.assertEqual(share, expected_share)  
 
+    def test_round_lots(self):
+        self.auctioneer.generate_bundles(bundle_size=2)
+        self.auctioneer.offers.pop(0) # offer1 has been sold
+        lots = self.auctioneer.get_round_lots(bundle_round=True)
+        self.assertEqual(lots, {'bundle_offer5': [3, 0, 2], 'bundle_offer6': [4, 1]})
+        item = self.auctioneer.put_on_auction(lots)
+        self.assertEqual(item.indices, [3, 0, 2, 4, 1])
+        self.assertEqual(self.auctioneer.offers.position('offer6'), 4)
+        self.assertIsNone(self.auctioneer.offers.position('offer1'))
+        self.assertEqual(item.shares['bundle_offer6'], [240 / 500, 260 / 500])
+        # the share of a bundle bid is relative to its own bundle
+        share = self.auctioneer.calculate_share('offer6', 100, lots['bundle_offer6'])
+        self.assertAlmostEqual(share, 240 / (240 + 260) * 100)
+        self.assertEqual(len(self.auctioneer.get_round_lots(bundle_round=False)), 5)
+
+    def test_winner_determination(self):
+        packages = [
+            ('carrier_1', ('a', 'b'), 300),
+            ('carrier_1', ('a',), 200),
+            ('carrier_2', ('a',), 180),
+            ('carrier_2', ('b',), 150),
+            ('carrier_3', ('c',), 50),
+        ]
+        result = solve_winner_determination(packages, reserves={'c': 60})
+        # XOR: carrier_1 wins one package at most, the package loses against carrier_1's 'a' + carrier_2's 'b'
+        self.assertEqual(result['status'], 'OPTIMAL')
+        self.assertEqual(sorted(result['winners']), [('carrier_1', ('a',), 200), ('carrier_2', ('b',), 150)])
+        self.assertEqual(result['revenue'], 350)
+        self.assertEqual(greedy_allocation(packages[:4]), [('carrier_1', ('a', 'b'), 300)])
+        self.assertEqual(solve_winner_determination([], {})['status'], 'NO_BIDS')
+
+    def test_determine_winners(self):
+        item = self.auctioneer.put_on_auction(self.auctioneer.get_round_lots(bundle_round=False), package_bids=True)
+        item.set_packages('carrier_7', [('carrier_7', ('offer1', 'offer2'), 700)])
+        self.auctioneer.offers[0].add_bid('carrier_8', 300)
+        self.auctioneer.offers[2].add_bid('carrier_8', 100)
+        result = self.auctioneer.determine_winners(item)
+        self.assertEqual(result['revenue'], 800)
+        offers = self.auctioneer.offers
+        self.assertEqual([offer.winner for offer in offers[:3]], ['carrier_7', 'carrier_7', 'carrier_8'])
+        self.assertAlmostEqual(offers[0].winning_bid, 280 / (280 + 400) * 700)
+
+    def test_state_actor(self):
+        actor = StateActor()
+        actor.start()
+        counter = []
+        def increment():
+            # a read-modify-write that would lose updates if two threads interleaved
+            value = len(counter)
+            time.sleep(0)
+            counter.append(value)
+        threads = [threading.Thread(target=lambda: [actor.call('increment', increment) for _ in range(50)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter, list(range(200)))
+        self.assertEqual(actor.latency_report()['increment']['count'], 200)
+        # commands issued by a command run inline, errors are raised in the caller
+        self.assertEqual(actor.call('nested', lambda: actor.call('inner', len, 'abc')), 3)
+        with self.assertRaises(ZeroDivisionError):
+            actor.call('fail', lambda: 1 / 0)
+        actor.stop()
+        # the auctioneer state is only changed by its actor
+        self.auctioneer.add_offer('carrier_9', {'offer_id': 'offer9', 'loc_pickup': {}, 'loc_dropoff': {}, 'profit': 1, 'revenue': 10})
+        self.assertEqual(self.auctioneer.offers.position('offer9'), 6)
+        self.assertIn('add_offer', self.auctioneer.actor.latency_report())
+
+    def test_phase_closes_early(self):
+        scheduler = PhaseScheduler()
+        scheduler.enter("BID", 5, ['carrier_1', 'carrier_2'])
+        self.assertFalse(scheduler.act('carrier_1', "REQ_OFFER"))
+        threading.Timer(0.05, scheduler.act, ['carrier_1', "BID"]).start()
+        threading.Timer(0.1, scheduler.act, ['carrier_2', "BID"]).start()
+        start = time.monotonic()
+        self.assertTrue(scheduler.wait())
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_phase_deadline(self):
+        scheduler = PhaseScheduler()
+        scheduler.enter("BID", 0.1, ['carrier_1', 'carrier_2'])
+        scheduler.act('carrier_1', "BID")
+        start = time.monotonic()
+        self.assertFalse(scheduler.wait())
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual((scheduler.closed_early, scheduler.timed_out), (0, 1))
+
+    def test_pipeline_routing(self):
+        pipeline = Pipeline(PhaseScheduler())
+        first = AuctionItem({'offer1': [0]}, pipeline.condition)
+        second = AuctionItem({'offer2': [1]}, pipeline.condition)
+        first.scheduler.enter("RESULTS", 5, ['carrier_1'])
+        second.scheduler.enter("REQ_OFFER", 5, ['carrier_1'])
+        pipeline.add(first)
+        pipeline.add(second)
+        # the next item is offered while the results of the previous one are requested
+        self.assertIs(pipeline.wait_for_item("REQ_OFFER", 'carrier_1', 1)[0], second)
+        self.assertEqual(pipeline.wait_for_item("RESULTS", 'carrier_1', 1), (first, "RESULTS"))
+        first.act('carrier_1', "RESULTS")
+        # results of the second item: waits until it has been bid on
+        threading.Timer(0.05, second.scheduler.enter, ["RESULTS", 5]).start()
+        self.assertEqual(pipeline.wait_for_item("RESULTS", 'carrier_1', 1), (second, "RESULTS"))
+        # a bid names its item, an item that has been cleared is not found
+        self.assertEqual(pipeline.wait_for_item("BID", 'carrier_1', 1, 'offer2'), (second, "RESULTS"))
+        pipeline.remove(first)
+        self.assertEqual(pipeline.wait_for_item("BID", 'carrier_1', 1, 'offer1'), (None, None))
+        pipeline.remove(second)
+        self.assertEqual(pipeline.wait_for_item("CONFIRM", 'carrier_1', 1), (None, None))
+        # no item offered: gives up after the grace period
+        self.assertEqual(pipeline.wait_for_item("REQ_OFFER", 'carrier_1', 0.05), (None, None))
+
+    def test_async_server(self):
+        server = AsyncAuctioneerServer(host='127.0.0.1', port=0)
+        threading.Thread(target=server.handle_connections, daemon=True).start()
+        self.assertTrue(server.wait_until_started(5))
+        port = server.server.sockets[0].getsockname()[1]
+        carrier = RequestHandler('carrier_1', '127.0.0.1', port)
+        response = carrier.register()
+        self.assertEqual((response['action'], response['payload']), ("register", {"status": "OK"}))
+        self.assertEqual(carrier.register()['payload'], {"status": "ALREADY_REGISTERED"})
+        self.assertEqual(RequestHandler('carrier_2', '127.0.0.1', port).request_auction_results()['payload'],
+                         {"status": "NOT_REGISTERED"})
+        self.assertEqual(server.auctioneer.registered_carriers, ['carrier_1'])
+        server.loop.call_soon_threadsafe(server.server.close)
+        server.auctioneer.actor.stop()
+
+    def test_receive_json(self):
+        # the messages of a session, split at any byte or several in one recv()
+        first, second = {"action": "register", "request_id": "1"}, {"action": "bid", "request_id": "2"}
+        for bufsize in (7, 1024):
+            sender, receiver = socket.socketpair()
+            with sender, receiver:
+                sender.sendall(json.dumps(first).encode('utf-8'))
+                sender.sendall(b"\n")
+                sender.sendall((json.dumps(second) + "\n").encode('utf-8'))
+                sender.shutdown(socket.SHUT_WR)
+                message, buffer = utils.receive_json(receiver, bufsize=bufsize)
+                self.assertEqual(message, first)
+                message, buffer = utils.receive_json(receiver, buffer, bufsize)
+                self.assertEqual(message, second)
+                self.assertEqual(utils.receive_json(receiver, buffer, bufsize), (None, b""))
+
+    def test_carrier_session(self):
+        server = AsyncAuctioneerServer(host='127.0.0.1', port=0)
+        threading.Thread(target=server.handle_connections, daemon=True).start()
+        self.assertTrue(server.wait_until_started(5))
+        port = server.server.sockets[0].getsockname()[1]
+        carrier = RequestHandler('carrier_1', '127.0.0.1', port, session=True)
+        self.assertEqual(carrier.register()['payload'], {"status": "OK"})
+        session_socket = carrier.session_socket
+        self.assertEqual(carrier.register()['payload'], {"status": "ALREADY_REGISTERED"})
+        self.assertIs(carrier.session_socket, session_socket)
+        # a request resent while the first attempt still waits for its phase waits for that attempt
+        calls = []
+        send_offer = server.send_offer
+        async def counted_send_offer(handler, data):
+            calls.append(data['request_id'])
+            return await send_offer(handler, data)
+        server.send_offer = counted_send_offer
+        request = {"carrier_id": 'carrier_1', "action": "request_offer", "time": "0", "request_id": 'request_1', "payload": {}}
+        message = (json.dumps(request) + "\n").encode('utf-8')
+        with mock.patch('async_server.PHASE_GRACE', 0.3):
+            first = socket.create_connection(('127.0.0.1', port))
+            first.sendall(message)
+            time.sleep(0.1)
+            first.close()
+            with socket.create_connection(('127.0.0.1', port)) as resent:
+                resent.sendall(message)
+                response = json.loads(resent.makefile('rb').readline())
+        self.assertEqual((response['request_id'], response['payload']), ('request_1', {"status": "OFFER_REQUEST_TIMEOUT"}))
+        self.assertEqual(calls, ['request_1'])
+        # a lost connection is reopened and the request sent again
+        session_socket.shutdown(socket.SHUT_RDWR)
+        offer = Offer('carrier_1', 'offer_1', {'pos_x': 0, 'pos_y': 0}, {'pos_x': 1, 'pos_y': 1}, profit=10, revenue=100)
+        response = carrier.send_offer(offer)
+        self.assertEqual(response['payload'], {"offer_id": 'offer_1', "response": "OK"})
+        self.assertIsNot(carrier.session_socket, session_socket)
+        # a request the auctioneer has answered before is not executed again
+        request = {"carrier_id": 'carrier_1', "action": "offer", "time": "0", "request_id": response['request_id'],
+                   "payload": {"offer_id": 'offer_1', "loc_pickup": offer.loc_pickup, "loc_dropoff": offer.loc_dropoff,
+                               "profit": 10, "revenue": 100}}
+        carrier.session_socket.sendall((json.dumps(request) + "\n").encode('utf-8'))
+        self.assertEqual(json.loads(carrier.session_stream.readline()), response)
+        self.assertEqual(len(server.auctioneer.offers), 1)
+        carrier.close_session()
+        server.loop.call_soon_threadsafe(server.server.close)
+        server.auctioneer.actor.stop()
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
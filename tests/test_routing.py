@@ -153,6 +153,24 @@ class Test_Routing(unittest.TestCase):
         self.assertEqual(updated_offer.winning_bid, 110.0)
         self.assertTrue(updated_offer.on_auction)
 
+    def test_baseline_tour_cache(self):
+        baseline = self.routing.get_baseline_tour()
+        self.routing.calculate_bid([(88.0, 42.0)], [(86.0, 36.0)], 1000.0)
+        self.assertIs(self.routing.get_baseline_tour(), baseline)
+        self.routing.add_location([{'pos_x': 88.0, 'pos_y': 42.0}], [{'pos_x': 86.0, 'pos_y': 36.0}])
+        self.assertIsNot(self.routing.get_baseline_tour(), baseline)
+        self.assertEqual(len(self.routing.get_baseline_tour()['optimalTour']), len(self.routing.locations)+1)
+
+    def test_bid_pruning(self):
+        # far outside the tour: the bound alone exceeds the revenue, no tour is solved
+        bid = self.routing.calculate_bid([(1000.0, 1000.0)], [(2000.0, 0.0)], 100.0)
+        self.assertLessEqual(bid, 0)
+        self.assertIsNone(self.routing._baseline_tour)
+        self.assertEqual(self.routing.bid_stats, {'bids': 1, 'pruned': 1})
+        self.routing.calculate_bid([(88.0, 42.0)], [(86.0, 36.0)], 1000.0)
+        self.assertIsNotNone(self.routing._baseline_tour)
+        self.assertEqual(self.routing.bid_stats, {'bids': 2, 'pruned': 1})
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file